@@ -0,0 +1,5 @@
+"""Reproducible benchmarks of the engine, the formatter and the bot conversation.
+
+    python -m benchmarks -o results.json
+    python -m benchmarks --compare results.json
+"""
@@ -0,0 +1,88 @@
+"""Fixed corpus of family compositions in the ``user_data`` form of the bot."""
+import random
+from typing import Dict, List
+
+DEFAULT_SEED = 2024
+DEFAULT_SIZE = 500
+
+# Typical and edge cases that are always part of the corpus
+CASES = [
+    {'total_inheritance': 1000000.0, 'has_wife': True, 'num_sons': 1, 'num_daughters': 1},
+    {'total_inheritance': 240000.0, 'has_spouse': True, 'has_father': True, 'has_mother': True},
+    {'total_inheritance': 500000.0, 'debts': 100000.0, 'has_will': True, 'will_amount': 50000.0,
+     'has_wife': True, 'num_daughters': 2, 'has_mother': True},
+    {'total_inheritance': 300000.0, 'num_siblings_sisters': 1},
+    {'total_inheritance': 300000.0, 'num_siblings_sisters': 3, 'has_mother': True},
+    {'total_inheritance': 100.0, 'num_cousins_brothers': 2, 'num_cousins_sisters': 1},
+    {'total_inheritance': 777777.77, 'num_grandsons': 2, 'num_granddaughters': 3, 'has_grandfather': True,
+     'has_grandmother': True},
+    {'total_inheritance': 1000.0, 'debts': 1000.0, 'has_wife': True},
+    {'total_inheritance': 900000.0, 'has_will': True, 'will_amount': 500000.0, 'is_murderer': True,
+     'is_different_faith': True, 'num_sons': 3},
+]
+
+FLAGS = ('is_murderer', 'is_different_faith', 'has_spouse', 'has_wife', 'has_father', 'has_mother',
+         'has_grandfather', 'has_grandmother')
+COUNTS = ('num_daughters', 'num_sons', 'num_granddaughters', 'num_grandsons', 'num_siblings_sisters',
+          'num_siblings_brothers', 'num_cousins_sisters', 'num_cousins_brothers')
+
+
+def compositions(size: int = DEFAULT_SIZE, seed: int = DEFAULT_SEED) -> List[Dict]:
+    """``size`` compositions: the fixed cases followed by seeded random ones."""
+    rng = random.Random(seed)
+    corpus = [dict(case) for case in CASES[:size]]
+    while len(corpus) < size:
+        total = round(rng.uniform(1000, 10000000), 2)
+        user_data = {
+            'total_inheritance': total,
+            'debts': rng.choice((0.0, round(rng.uniform(0, total / 2), 2))),
+            'has_will': rng.random() < 0.3,
+        }
+        if user_data['has_will']:
+            user_data['will_amount'] = round(rng.uniform(0, total / 3), 2)
+        for name in FLAGS:
+            user_data[name] = rng.random() < 0.3
+        for name in COUNTS:
+            user_data[name] = rng.choice((0, 0, 0, 1, 1, 2, 3, 5))
+        corpus.append(user_data)
+    return corpus
+
+
+def conversation_answers(user_data: Dict) -> List[str]:
+    """Messages a user sends to the bot after /start to enter ``user_data``, with a will.
+
+    Every conversation goes through all 20 states: without a will the bot
+    skips the will amount and the murderer and faith questions.
+    """
+    answers = [
+        str(user_data.get('total_inheritance', 0)),
+        str(user_data.get('debts', 0)),
+        '1',
+        str(user_data.get('will_amount', 0)),
+    ]
+    answers += [str(int(bool(user_data.get(name)))) for name in FLAGS[:4]]
+    answers += [str(user_data.get(name, 0)) for name in COUNTS[:4]]
+    answers += [str(int(bool(user_data.get(name)))) for name in FLAGS[4:]]
+    answers += [str(user_data.get(name, 0)) for name in COUNTS[4:]]
+    return answers
+
+
+def button_answers(user_data: Dict) -> List[str]:
+    """``conversation_answers`` with the yes/no and count answers as button data.
+
+    The data is ``answer:<state>:<value>``; the states are numbered as in the
+    bot, from the total inheritance (0) to the cousins (19). The amounts are
+    still typed.
+    """
+    answers = conversation_answers(user_data)
+    return [answer if state in (0, 1, 3) or int(answer) > 5 else f'answer:{state}:{answer}'
+            for state, answer in enumerate(answers)]
+
+
+def calc_scenario(user_data: Dict) -> str:
+    """The /calc scenario with the same answers as ``conversation_answers``."""
+    tokens = [f"total={user_data.get('total_inheritance', 0)}", f"debts={user_data.get('debts', 0)}",
+              'has_will=1', f"will={user_data.get('will_amount', 0)}"]
+    tokens += [f'{name}={int(bool(user_data.get(name)))}' for name in FLAGS]
+    tokens += [f'{name}={user_data.get(name, 0)}' for name in COUNTS]
+    return ' '.join(tokens)
@@ -0,0 +1,97 @@
+"""Bot that answers Bot API requests in memory instead of calling Telegram.
+
+Requests are still serialized like for the real API, so a benchmark through
+this bot covers everything but the network.
+"""
+import json
+import time
+from collections import Counter
+from typing import Optional, Tuple
+
+from telegram import Bot, MessageEntity, Update
+from telegram.request import BaseRequest, RequestData
+
+TOKEN = '123456:benchmark'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+
+
+class FakeRequest(BaseRequest):
+    """Answers the Bot API methods the bot uses and keeps the sent messages."""
+
+    def __init__(self):
+        self.sent = []
+        self.edited = []
+        self.inline_answers = []
+        self.calls = Counter()  # method -> number of requests
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        name = url.rsplit('/', 1)[-1]
+        data = request_data.parameters if request_data else {}
+        self.calls[name] += 1
+        if name == 'getMe':
+            result = BOT_USER
+        elif name in ('sendMessage', 'editMessageText'):
+            if name == 'sendMessage':
+                self._message_id += 1
+                self.sent.append(data)
+            else:
+                self.edited.append(data)
+            result = {'message_id': data.get('message_id', self._message_id), 'date': int(time.time()),
+                      'text': data['text'], 'chat': {'id': data['chat_id'], 'type': 'private'}, 'from': BOT_USER}
+        elif name == 'answerCallbackQuery':
+            result = True
+        elif name == 'answerInlineQuery':
+            self.inline_answers.append(data)
+            result = True
+        else:
+            raise NotImplementedError(name)
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+class FakeUser:
+    """Private chat of one user with the fake bot."""
+
+    def __init__(self, bot: Bot, user_id: int = 1):
+        self.bot = bot
+        self.user = {'id': user_id, 'is_bot': False, 'first_name': 'Benchmark'}
+        self.chat = {'id': user_id, 'type': 'private'}
+        self._update_id = 0
+
+    def update(self, text: str) -> Update:
+        """Update with a message of the user."""
+        self._update_id += 1
+        message = {'message_id': self._update_id, 'date': int(time.time()), 'chat': self.chat,
+                   'from': self.user, 'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': MessageEntity.BOT_COMMAND, 'offset': 0,
+                                    'length': len(text.split()[0])}]
+        return Update.de_json({'update_id': self._update_id, 'message': message}, self.bot)
+
+    def inline(self, query: str) -> Update:
+        """Update with an inline query of the user, e.g. ``1000000 wife sons=2``."""
+        self._update_id += 1
+        inline_query = {'id': str(self._update_id), 'from': self.user, 'query': query, 'offset': ''}
+        return Update.de_json({'update_id': self._update_id, 'inline_query': inline_query}, self.bot)
+
+    def press(self, data: str, message_id: int = 1) -> Update:
+        """Update with a press of an inline button under a message of the bot."""
+        self._update_id += 1
+        message = {'message_id': message_id, 'date': int(time.time()), 'chat': self.chat, 'from': BOT_USER,
+                   'text': '?'}
+        query = {'id': str(self._update_id), 'from': self.user, 'chat_instance': str(self.chat['id']),
+                 'message': message, 'data': data}
+        return Update.de_json({'update_id': self._update_id, 'callback_query': query}, self.bot)
+
+
+def fake_bot() -> Bot:
+    request = FakeRequest()
+    return Bot(TOKEN, request=request, get_updates_request=request)
@@ -0,0 +1,156 @@
+"""Local stand-in for the Telegram Bot API server.
+
+The bot talks to it over HTTP like to api.telegram.org (``TELEGRAM_API_URL``),
+while a load driver in the same event loop plays the users: it queues their
+messages and button presses as updates for ``getUpdates`` and waits for the
+messages the bot sends or edits in their chats.
+"""
+import asyncio
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional
+
+from tornado.httpserver import HTTPServer
+from tornado.web import Application, RequestHandler
+
+from benchmarks.fake_bot import BOT_USER
+
+MAX_UPDATES = 100
+
+
+class BotMessage(NamedTuple):
+    method: str  # sendMessage or editMessageText
+    message_id: int
+    text: str
+    reply_markup: Optional[dict]
+    received: float  # time.perf_counter() when the server got the request
+
+
+class FakeBotAPI:
+    """Updates waiting for ``getUpdates`` and the messages of the bot by chat."""
+
+    def __init__(self):
+        self.updates: List[dict] = []
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.polling = asyncio.Event()  # set by the first getUpdates
+        self._update_id = 0
+        self._message_id = 0
+        self._new_updates = asyncio.Event()
+        self._closed = False
+        self._inboxes: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+
+    # Side of the users
+
+    def _push(self, **update):
+        self._update_id += 1
+        update['update_id'] = self._update_id
+        self.updates.append(update)
+        self._new_updates.set()
+
+    def user_message(self, user_id: int, text: str):
+        """Queue a message of the user in the private chat with the bot."""
+        self._message_id += 1
+        message = {'message_id': self._message_id, 'date': int(time.time()), 'text': text,
+                   'chat': {'id': user_id, 'type': 'private'},
+                   'from': {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'}}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        self._push(message=message)
+
+    def button_press(self, user_id: int, message_id: int, data: str):
+        """Queue a press of an inline button under a message of the bot."""
+        self._push(callback_query={
+            'id': f'{user_id}:{self._update_id + 1}', 'chat_instance': str(user_id), 'data': data,
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'},
+            'message': {'message_id': message_id, 'date': int(time.time()), 'text': '',
+                        'chat': {'id': user_id, 'type': 'private'}, 'from': BOT_USER}})
+
+    async def reply(self, user_id: int, timeout: float) -> BotMessage:
+        """The next message the bot sends or edits in the chat of the user."""
+        return await asyncio.wait_for(self._inboxes[user_id].get(), timeout)
+
+    def discard_replies(self, user_id: int):
+        """Forget the messages of the bot that nobody waited for, e.g. warnings."""
+        inbox = self._inboxes[user_id]
+        while not inbox.empty():
+            inbox.get_nowait()
+
+    def close(self):
+        """Answer the pending ``getUpdates`` right away, so the server can stop."""
+        self._closed = True
+        self._new_updates.set()
+
+    # Side of the bot
+
+    async def call(self, method: str, params: dict):
+        self.calls[method] += 1
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('deleteWebhook', 'setWebhook', 'answerCallbackQuery', 'answerInlineQuery'):
+            if params.get('drop_pending_updates') in (True, 'true', 'True'):
+                self.updates.clear()
+            return True
+        if method == 'getUpdates':
+            return await self._get_updates(params)
+        if method in ('sendMessage', 'editMessageText'):
+            return self._message(method, params)
+        raise LookupError(method)
+
+    async def _get_updates(self, params: dict) -> List[dict]:
+        self.polling.set()
+        offset = int(params.get('offset') or 0)
+        if offset:
+            # Updates before the offset are confirmed by the bot
+            self.updates = [update for update in self.updates if update['update_id'] >= offset]
+        if not self.updates and not self._closed:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:int(params.get('limit') or MAX_UPDATES)]
+
+    def _message(self, method: str, params: dict) -> dict:
+        chat_id = int(params['chat_id'])
+        if method == 'sendMessage':
+            self._message_id += 1
+            message_id = self._message_id
+        else:
+            message_id = int(params['message_id'])
+        reply_markup = params.get('reply_markup')
+        if isinstance(reply_markup, str):
+            reply_markup = json.loads(reply_markup)
+        self._inboxes[chat_id].put_nowait(
+            BotMessage(method, message_id, params['text'], reply_markup, time.perf_counter()))
+        return {'message_id': message_id, 'date': int(time.time()), 'text': params['text'],
+                'chat': {'id': chat_id, 'type': 'private'}, 'from': BOT_USER}
+
+
+class MethodHandler(RequestHandler):
+    """``/bot<token>/<method>`` with form, multipart or JSON parameters."""
+
+    def initialize(self, api: FakeBotAPI):
+        self.api = api
+
+    async def post(self, token: str, method: str):
+        if self.request.headers.get('Content-Type', '').startswith('application/json'):
+            params = json.loads(self.request.body or b'{}')
+        else:
+            params = {name: values[-1].decode() for name, values in self.request.arguments.items()}
+        try:
+            result = await self.api.call(method, params)
+        except LookupError:
+            self.set_status(404)
+            self.finish({'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'})
+            return
+        self.finish({'ok': True, 'result': result})
+
+    get = post
+
+
+def serve(api: FakeBotAPI, port: int, address: str = '127.0.0.1') -> HTTPServer:
+    """Start serving the API in the running event loop."""
+    server = HTTPServer(Application([(r'/bot([^/]+)/(\w+)', MethodHandler, {'api': api})]))
+    server.listen(port, address)
+    return server
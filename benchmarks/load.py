@@ -0,0 +1,193 @@
+"""Load test of the bot against the local fake Bot API server.
+
+Starts ``calculate.py`` with ``TELEGRAM_API_URL`` pointing to the fake server
+and lets N users walk through the whole conversation at the same time, with a
+think time before every answer. Reports the throughput, the latency of every
+step from the update to the bot's reply, and the errors::
+
+    python -m benchmarks.load --users 500 --think 2 --ramp 30
+    python -m benchmarks.load --users 200 --buttons -o load.json
+
+Any setting of the bot can be passed through the environment, e.g.
+``CONCURRENT_UPDATES=64 python -m benchmarks.load``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.corpus import (COUNTS, DEFAULT_SEED, FLAGS, button_answers, compositions,
+                               conversation_answers)
+from benchmarks.fake_bot import TOKEN
+from benchmarks.fake_server import BotMessage, FakeBotAPI, serve
+from benchmarks.run import PERCENTILES, percentile
+
+# The steps of a conversation: /start and the questions in the order of conversation_answers
+STEPS = ('start', 'total_inheritance', 'debts', 'has_will', 'will_amount') + FLAGS[:4] + COUNTS[:4] + FLAGS[4:] \
+    + COUNTS[4:]
+DEFAULT_PORT = 8081
+BOT_SCRIPT = Path(__file__).resolve().parent.parent / 'calculate.py'
+
+
+class LoadStats:
+    """Latencies and errors by step."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)  # step -> ms
+        self.errors: Dict[str, Counter] = defaultdict(Counter)  # step -> kind -> count
+        self.completed = 0
+
+    def report(self, users: int, duration: float) -> Dict:
+        replies = sum(len(latencies) for latencies in self.latencies.values())
+        failed = sum(sum(errors.values()) for errors in self.errors.values())
+        steps = {}
+        for step in STEPS:
+            latencies = sorted(self.latencies.get(step, ()))
+            errors = self.errors.get(step, Counter())
+            attempts = len(latencies) + sum(errors.values())
+            if not attempts:
+                continue
+            stats = {'replies': len(latencies), 'errors': dict(errors),
+                     'error_rate': round(sum(errors.values()) / attempts, 4)}
+            if latencies:
+                stats['mean_ms'] = round(sum(latencies) / len(latencies), 2)
+                for p in PERCENTILES:
+                    stats[f'p{p}_ms'] = round(percentile(latencies, p), 2)
+                stats['max_ms'] = round(latencies[-1], 2)
+            steps[step] = stats
+        return {
+            'users': users,
+            'completed': self.completed,
+            'failed': failed,
+            'error_rate': round(failed / users, 4) if users else 0.0,
+            'duration_s': round(duration, 2),
+            'conversations_per_sec': round(self.completed / duration, 2) if duration else 0.0,
+            'replies_per_sec': round(replies / duration, 2) if duration else 0.0,
+            'steps': steps,
+        }
+
+
+async def next_reply(api: FakeBotAPI, user_id: int, timeout: float) -> BotMessage:
+    """The reply to an answer, skipping the warnings the bot sends before the next question."""
+    reply = await api.reply(user_id, timeout)
+    while reply.text.startswith('Предупреждение'):
+        reply = await api.reply(user_id, timeout)
+    return reply
+
+
+async def simulate_user(api: FakeBotAPI, user_id: int, answers: List[str], args, rng: random.Random,
+                        stats: LoadStats):
+    """Walk through the conversation as one user and record the latency of every step."""
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    message_id = None
+    reply = None
+    for step, answer in zip(STEPS, ['/start'] + answers):
+        api.discard_replies(user_id)
+        start = time.perf_counter()
+        if answer.startswith('answer:') and message_id is not None:
+            api.button_press(user_id, message_id, answer)
+        else:
+            api.user_message(user_id, answer)
+        try:
+            reply = await next_reply(api, user_id, args.timeout)
+        except asyncio.TimeoutError:
+            stats.errors[step]['timeout'] += 1
+            return
+        stats.latencies[step].append((reply.received - start) * 1000)
+        if reply.text.startswith('Ошибка'):
+            stats.errors[step]['rejected'] += 1
+            return
+        message_id = reply.message_id
+        await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think)
+    if 'РЕЗУЛЬТАТЫ РАСЧЕТА' not in reply.text:
+        stats.errors[STEPS[-1]]['no_result'] += 1
+        return
+    stats.completed += 1
+
+
+def start_bot(port: int, log) -> subprocess.Popen:
+    env = dict(os.environ, TELEGRAM_BOT_TOKEN=TOKEN, TELEGRAM_API_URL=f'http://127.0.0.1:{port}',
+               WEBHOOK_URL='')
+    env.setdefault('PERSISTENCE_PATH', '')
+    return subprocess.Popen([sys.executable, str(BOT_SCRIPT)], cwd=BOT_SCRIPT.parent, env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+
+
+async def run_load(args) -> Dict:
+    api = FakeBotAPI()
+    server = serve(api, args.port)
+    log = open(args.bot_log, 'w') if args.bot_log else subprocess.DEVNULL
+    bot = None if args.no_spawn else start_bot(args.port, log)
+    try:
+        await asyncio.wait_for(api.polling.wait(), args.startup_timeout)
+        corpus = compositions(args.users, args.seed)
+        rng = random.Random(args.seed)
+        stats = LoadStats()
+        answers = button_answers if args.buttons else conversation_answers
+        started = time.perf_counter()
+        await asyncio.gather(*(simulate_user(api, user_id, answers(user_data), args, random.Random(rng.random()),
+                                             stats)
+                               for user_id, user_data in enumerate(corpus, 1)))
+        report = stats.report(args.users, time.perf_counter() - started)
+        report['api_calls'] = dict(api.calls)
+        return report
+    finally:
+        if bot is not None:
+            bot.terminate()
+            bot.wait()
+        api.close()
+        await asyncio.sleep(0.1)
+        server.stop()
+        if args.bot_log:
+            log.close()
+
+
+def print_report(report: Dict):
+    print(f"Пользователей: {report['users']}, завершено разговоров: {report['completed']}, "
+          f"с ошибкой: {report['failed']} ({report['error_rate']:.2%}) за {report['duration_s']} с")
+    print(f"Пропускная способность: {report['conversations_per_sec']} разговоров/с, "
+          f"{report['replies_per_sec']} ответов/с\n")
+    print(f"{'шаг':24}{'ответов':>9}{'ошибок':>8}" + ''.join(f"{f'p{p}, мс':>11}" for p in PERCENTILES)
+          + f"{'max, мс':>11}")
+    for step, stats in report['steps'].items():
+        print(f"{step:24}{stats['replies']:>9}{sum(stats['errors'].values()):>8}"
+              + ''.join(f"{stats.get(f'p{p}_ms', float('nan')):>11.1f}" for p in PERCENTILES)
+              + f"{stats.get('max_ms', float('nan')):>11.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load',
+                                     description='Нагрузочный тест бота с локальным сервером Bot API')
+    parser.add_argument('--users', type=int, default=100, help='одновременных пользователей (%(default)s)')
+    parser.add_argument('--think', type=float, default=1.0,
+                        help='среднее время на ответ пользователя, с (%(default)s)')
+    parser.add_argument('--ramp', type=float, default=5.0,
+                        help='пользователи начинают в течение стольких секунд (%(default)s)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='ожидание ответа бота, с (%(default)s)')
+    parser.add_argument('--buttons', action='store_true', help='отвечать кнопками, где это возможно')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='seed составов семьи (%(default)s)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='порт сервера Bot API (%(default)s)')
+    parser.add_argument('--no-spawn', action='store_true',
+                        help='не запускать бота: он уже запущен с TELEGRAM_API_URL=http://127.0.0.1:PORT')
+    parser.add_argument('--startup-timeout', type=float, default=30.0, help='ожидание запуска бота, с')
+    parser.add_argument('--bot-log', help='записать журнал бота в файл')
+    parser.add_argument('-o', '--output', help='сохранить отчет в JSON')
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+    return 0 if report['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""Run the benchmarks and write their results as JSON.
+
+Every benchmark times single operations over the whole corpus for a number of
+rounds and reports operations per second and latency percentiles. Pass the
+results of an earlier run with ``--compare`` to see the relative change.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Sequence
+
+from benchmarks.corpus import (DEFAULT_SEED, DEFAULT_SIZE, button_answers, calc_scenario, compositions,
+                               conversation_answers)
+from inheritance import calculate_inheritance, format_inheritance_response, get_emoji_for_heir, result_dicts
+from inheritance.engine import share_structure
+
+PERCENTILES = (50, 90, 99)
+DEFAULT_ROUNDS = 5
+
+
+def percentile(ordered: Sequence[int], p: float) -> int:
+    """Nearest-rank percentile of sorted values."""
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(operations: Sequence[Callable[[], object]], rounds: int, warmup: int = 1) -> Dict:
+    """Time every operation ``rounds`` times after ``warmup`` untimed rounds."""
+    for _ in range(warmup):
+        for operation in operations:
+            operation()
+    timings = []
+    clock = time.perf_counter_ns
+    for _ in range(rounds):
+        for operation in operations:
+            start = clock()
+            operation()
+            timings.append(clock() - start)
+    timings.sort()
+    total = sum(timings)
+    stats = {
+        'operations': len(timings),
+        'ops_per_sec': round(len(timings) / total * 1e9, 1),
+        'mean_us': round(total / len(timings) / 1000, 2),
+    }
+    for p in PERCENTILES:
+        stats[f'p{p}_us'] = round(percentile(timings, p) / 1000, 2)
+    stats['max_us'] = round(timings[-1] / 1000, 2)
+    return stats
+
+
+def bench_engine(corpus: List[Dict], rounds: int) -> Dict:
+    share_structure.cache_clear()
+    return measure([lambda user_data=user_data: calculate_inheritance(user_data) for user_data in corpus],
+                   rounds)
+
+
+def bench_emoji(corpus: List[Dict], rounds: int) -> Dict:
+    heirs = [heir for user_data in corpus for heir in result_dicts(calculate_inheritance(user_data))['amounts']]
+    return measure([lambda heir=heir: get_emoji_for_heir(heir) for heir in heirs], rounds)
+
+
+def bench_formatter(corpus: List[Dict], rounds: int) -> Dict:
+    results = [(user_data, calculate_inheritance(user_data)) for user_data in corpus]
+    return measure([lambda pair=pair: format_inheritance_response(*pair) for pair in results], rounds)
+
+
+def _run_updates(corpus: List[Dict], rounds: int, messages: Callable[[Dict], List[str]]) -> Dict:
+    """Time processing the messages of every composition by the application with a fake bot.
+
+    Messages starting with ``answer:`` are sent as presses of inline buttons
+    and those starting with ``@`` as inline queries.
+    """
+    from telegram.ext import Application
+
+    import calculate
+    from benchmarks.fake_bot import FakeUser, fake_bot
+
+    logging.getLogger().setLevel(logging.WARNING)
+    bot = fake_bot()
+    application = Application.builder().bot(bot).updater(None).build()
+    calculate.add_handlers(application)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(application.initialize())
+
+    async def conversation(user, texts):
+        for text in texts:
+            if text.startswith('answer:'):
+                update = user.press(text)
+            elif text.startswith('@'):
+                update = user.inline(text[1:])
+            else:
+                update = user.update(text)
+            await application.process_update(update)
+
+    operations = []
+    for user_id, user_data in enumerate(corpus, 1):
+        user = FakeUser(bot, user_id)
+        texts = messages(user_data)
+        operations.append(lambda user=user, texts=texts: loop.run_until_complete(conversation(user, texts)))
+
+    try:
+        stats = measure(operations, rounds)
+    finally:
+        loop.run_until_complete(application.shutdown())
+        loop.close()
+    runs = len(operations) * (rounds + 1)
+    texts = [data['text'] for data in bot.request.sent + bot.request.edited]
+    texts += [result['input_message_content']['message_text']
+              for data in bot.request.inline_answers for result in data['results']]
+    finished = sum('РЕЗУЛЬТАТЫ РАСЧЕТА' in text for text in texts)
+    if finished != runs:
+        raise RuntimeError(f'Завершено {finished} разговоров из {runs}')
+    # Bot API requests and new messages in the chat per conversation
+    stats['api_calls'] = round((sum(bot.request.calls.values()) - bot.request.calls['getMe']) / runs, 2)
+    stats['messages_sent'] = round(bot.request.calls['sendMessage'] / runs, 2)
+    return stats
+
+
+def bench_conversation(corpus: List[Dict], rounds: int) -> Dict:
+    """/start and the 20 answers of a conversation."""
+    return _run_updates(corpus, rounds, lambda user_data: ['/start'] + conversation_answers(user_data))
+
+
+def bench_buttons(corpus: List[Dict], rounds: int) -> Dict:
+    """The conversation answered with the inline buttons where possible."""
+    return _run_updates(corpus, rounds, lambda user_data: ['/start'] + button_answers(user_data))
+
+
+def bench_calc(corpus: List[Dict], rounds: int) -> Dict:
+    """The same answers as one /calc message."""
+    return _run_updates(corpus, rounds, lambda user_data: [f'/calc {calc_scenario(user_data)}'])
+
+
+def bench_inline(corpus: List[Dict], rounds: int) -> Dict:
+    """The /calc scenario as an inline query."""
+    return _run_updates(corpus, rounds, lambda user_data: [f'@{calc_scenario(user_data)}'])
+
+
+BENCHMARKS = {
+    'calculate_inheritance': bench_engine,
+    'get_emoji_for_heir': bench_emoji,
+    'format_inheritance_response': bench_formatter,
+    'conversation': bench_conversation,
+    'conversation_buttons': bench_buttons,
+    'calc_command': bench_calc,
+    'inline_query': bench_inline,
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def compare(results: Dict, baseline: Dict):
+    print(f"\nСравнение с {baseline['meta'].get('commit') or 'предыдущим запуском'}:")
+    for name, stats in results['benchmarks'].items():
+        before = baseline['benchmarks'].get(name)
+        if not before:
+            continue
+        speedup = stats['ops_per_sec'] / before['ops_per_sec']
+        p99 = stats['p99_us'] / before['p99_us'] if before['p99_us'] else float('nan')
+        print(f'{name:30} ops/s x{speedup:.2f}  p99 x{p99:.2f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Бенчмарки расчета и бота')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help=f"что запустить: {', '.join(BENCHMARKS)} (по умолчанию все)")
+    parser.add_argument('-o', '--output', help='сохранить результаты в JSON')
+    parser.add_argument('--compare', help='JSON с результатами предыдущего запуска')
+    parser.add_argument('--size', type=int, default=DEFAULT_SIZE, help='размер корпуса (%(default)s)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='seed корпуса (%(default)s)')
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS, help='проходов по корпусу (%(default)s)')
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"неизвестные бенчмарки: {', '.join(sorted(unknown))}")
+
+    corpus = compositions(args.size, args.seed)
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'corpus_size': args.size,
+            'seed': args.seed,
+            'rounds': args.rounds,
+        },
+        'benchmarks': {},
+    }
+    for name in args.benchmarks or BENCHMARKS:
+        stats = BENCHMARKS[name](corpus, args.rounds)
+        results['benchmarks'][name] = stats
+        print(f"{name:30} {stats['ops_per_sec']:>12,.1f} ops/s  "
+              + '  '.join(f"p{p} {stats[f'p{p}_us']:,.1f} us" for p in PERCENTILES), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(results, output, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == '__main__':
+    main()
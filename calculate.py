@@ -1,28 +1,218 @@
 #!/usr/bin/env python3
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackContext, ConversationHandler
-from telegram.error import TimedOut, NetworkError
+from telegram import (Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton,
+                      InlineQueryResultArticle, InlineQueryResultsButton, InputTextMessageContent)
+from telegram.ext import (Application, BaseUpdateProcessor, CallbackQueryHandler, CommandHandler, InlineQueryHandler,
+                          MessageHandler, TypeHandler, filters, ContextTypes, ConversationHandler, PersistenceInput)
+from telegram.warnings import PTBUserWarning
+from telegram.error import RetryAfter, TimedOut, NetworkError
+from telegram.request import HTTPXRequest
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Awaitable, Callable, Dict, Iterable, Mapping, NamedTuple, Optional, Tuple
+import asyncio
+import contextlib
+import functools
+import time
+import warnings
 import os
+import secrets
 import logging
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO)
+from inheritance.answers import (ScenarioError, max_will_amount, parse_count, parse_debts, parse_flag, parse_scenario,
+                                 parse_total, parse_will_amount, will_warning)
+from inheritance.cache import DEFAULT_MAXSIZE, DEFAULT_TTL, TTLCache, response_key
+from inheritance.engine import Estate, calculate, share_structure
+from inheritance.formatting import render_response
+from logs import DEFAULT_SAMPLE_INTERVAL, configure as configure_logging
+from metrics import Registry, serve as serve_metrics
+from outbox import DEFAULT_MAX_ATTEMPTS, Outbox
+from persistence import DEFAULT_UPDATE_INTERVAL, SQLitePersistence
+from profiling import (DEFAULT_FRAMES, DEFAULT_INTERVAL as DEFAULT_PROFILE_INTERVAL, DEFAULT_KEEP, UpdateProfiler,
+                       profiled)
+from rate_limit import DEFAULT_CHAT_BURST, DEFAULT_CHAT_RATE, DEFAULT_RATE, TokenBucketRateLimiter
+from sessions import (DEFAULT_CLEANUP_INTERVAL, DEFAULT_MAX_SESSIONS, DEFAULT_TIMEOUT, SessionRegistry,
+                      approximate_size)
+
+# The answer buttons belong to the conversation of the user, not to a message
+warnings.filterwarnings('ignore', message=".*per_message=False.*", category=PTBUserWarning)
+
+# Журнал: LOG_FORMAT=json (по умолчанию) или text, уровень LOG_LEVEL; сетевые ошибки одного типа
+# пишутся не чаще раза в LOG_SAMPLE_INTERVAL секунд
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_INTERVAL = float(os.environ.get("LOG_SAMPLE_INTERVAL", DEFAULT_SAMPLE_INTERVAL))
 logger = logging.getLogger(__name__)
 
+# Кэш готовых ответов для одинаковых данных: размер и время жизни записи в секундах
+RESPONSE_CACHE = TTLCache(
+    maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", DEFAULT_MAXSIZE)),
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", DEFAULT_TTL)))
+
+# Сколько обновлений обрабатывается одновременно в одном цикле событий
+CONCURRENT_UPDATES = int(os.environ.get("CONCURRENT_UPDATES", 256))
+# Одновременных HTTP-соединений с Bot API для ответов
+CONNECTION_POOL_SIZE = int(os.environ.get("CONNECTION_POOL_SIZE", 64))
+# Процессы для расчета; 0 - расчет в потоке цикла событий по умолчанию
+CALCULATION_PROCESSES = int(os.environ.get("CALCULATION_PROCESSES", 0))
+# Сколько секунд Telegram хранит ответ на одинаковый встроенный запрос (@bot ...)
+INLINE_CACHE_TIME = int(os.environ.get("INLINE_CACHE_TIME", 300))
+# Webhook вместо опроса getUpdates: публичный адрес бота, например https://bot.example.com
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
+# Адрес и порт встроенного HTTP-сервера (Render передает порт в PORT)
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", os.environ.get("PORT", 8443)))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "telegram")
+# Telegram присылает его в X-Telegram-Bot-Api-Secret-Token; без переменной создается при запуске
+WEBHOOK_SECRET_TOKEN = os.environ.get("WEBHOOK_SECRET_TOKEN")
+# Сколько соединений с webhook одновременно открывает Telegram (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", 100))
+# Файл SQLite с незавершенными разговорами; пустая строка отключает сохранение
+PERSISTENCE_PATH = os.environ.get("PERSISTENCE_PATH", "conversations.sqlite3")
+# Как часто (в секундах) изменения разговоров записываются в базу одной транзакцией
+PERSISTENCE_INTERVAL = float(os.environ.get("PERSISTENCE_INTERVAL", DEFAULT_UPDATE_INTERVAL))
+# Через сколько секунд без ответа разговор завершается и его данные удаляются из памяти
+SESSION_TIMEOUT = float(os.environ.get("SESSION_TIMEOUT", DEFAULT_TIMEOUT))
+# Сколько сессий держать в памяти; сверх этого вытесняются давно неактивные
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", DEFAULT_MAX_SESSIONS))
+# Как часто (в секундах) проверять неактивные сессии
+SESSION_CLEANUP_INTERVAL = float(os.environ.get("SESSION_CLEANUP_INTERVAL", DEFAULT_CLEANUP_INTERVAL))
+# Сколько сообщений в секунду бот отправляет всего и в один личный чат (с запасом CHAT_BURST подряд);
+# RATE_LIMIT=0 отключает ограничение
+RATE_LIMIT = float(os.environ.get("RATE_LIMIT", DEFAULT_RATE))
+CHAT_RATE_LIMIT = float(os.environ.get("CHAT_RATE_LIMIT", DEFAULT_CHAT_RATE))
+CHAT_BURST = int(os.environ.get("CHAT_BURST", DEFAULT_CHAT_BURST))
+# Сессии по ключу разговора (chat_id, user_id) и последнее состояние разговора каждой
+SESSIONS = SessionRegistry(SESSION_TIMEOUT, MAX_SESSIONS)
+CONVERSATION_NAME = 'inheritance'
+SESSION_EXPIRED = ('Сессия завершена из-за долгого отсутствия ответа, введенные данные удалены. '
+                   'Чтобы начать расчет заново, используйте /start')
+# Executor for the calculation, set up by main(); None is the default executor of the loop
+CALCULATION_EXECUTOR: Optional[Executor] = None
+# Background task that ends idle sessions, started with the application
+CLEANUP_TASK: Optional[asyncio.Task] = None
+# Сколько раз пытаться отправить вопрос или результат, не дошедший из-за сети
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+# Outbox of the questions and results, set up by build_application(); None sends them directly
+OUTBOX: Optional[Outbox] = None
+# Background task that retries the replies left in the outbox
+DELIVERY_TASK: Optional[asyncio.Task] = None
+
+# Метрики в формате Prometheus на http://METRICS_ADDRESS:METRICS_PORT/metrics; без METRICS_PORT сервер не запускается
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+METRICS_ADDRESS = os.environ.get("METRICS_ADDRESS", "127.0.0.1")
+# Metrics server, started with the application
+METRICS_SERVER: Optional[asyncio.AbstractServer] = None
+METRICS = Registry()
+HANDLER_SECONDS = METRICS.histogram(
+    'bot_handler_duration_seconds', 'Время обработки обновления обработчиком (шагом разговора)', ['handler'])
+CALCULATE_SECONDS = METRICS.histogram('bot_calculate_seconds', 'Время расчета долей (промахи кэша)')
+FORMAT_SECONDS = METRICS.histogram('bot_format_seconds', 'Время форматирования результата (промахи кэша)')
+API_SECONDS = METRICS.histogram('bot_api_request_duration_seconds', 'Время запроса к Bot API', ['method'])
+ERRORS = METRICS.counter('bot_errors', 'Ошибки, дошедшие до error_handler, по типу', ['type'])
+METRICS.function('bot_sessions', 'Активные сессии', lambda: len(SESSIONS))
+METRICS.function('bot_sessions_max', 'Предел числа сессий', lambda: SESSIONS.max_sessions)
+METRICS.function('bot_sessions_expired', 'Сессии, завершенные по времени', lambda: SESSIONS.stats().expired,
+                 'counter')
+METRICS.function('bot_sessions_evicted', 'Сессии, вытесненные из-за предела', lambda: SESSIONS.stats().evicted,
+                 'counter')
+METRICS.function('bot_response_cache_hits', 'Попадания в кэш ответов', lambda: RESPONSE_CACHE.stats().hits,
+                 'counter')
+METRICS.function('bot_response_cache_misses', 'Промахи кэша ответов', lambda: RESPONSE_CACHE.stats().misses,
+                 'counter')
+METRICS.function('bot_response_cache_size', 'Ответы в кэше', lambda: RESPONSE_CACHE.stats().size)
+METRICS.function('bot_response_cache_max', 'Предел числа ответов в кэше', lambda: RESPONSE_CACHE.maxsize)
+METRICS.function('bot_response_cache_hit_ratio', 'Доля попаданий в кэш ответов',
+                 lambda: RESPONSE_CACHE.stats().hit_ratio)
+METRICS.function('bot_response_cache_expirations', 'Промахи кэша ответов из-за истекшего срока записи',
+                 lambda: RESPONSE_CACHE.stats().expirations, 'counter')
+METRICS.function('bot_response_cache_evictions', 'Ответы, вытесненные из кэша из-за размера',
+                 lambda: RESPONSE_CACHE.stats().evictions, 'counter')
+# Кэш долей по составу семьи в процессе бота; расчеты в процессах CALCULATION_PROCESSES в него не попадают
+METRICS.function('bot_share_structure_cache_hits', 'Попадания в кэш долей по составу семьи',
+                 lambda: share_structure.cache_info().hits, 'counter')
+METRICS.function('bot_share_structure_cache_misses', 'Промахи кэша долей по составу семьи',
+                 lambda: share_structure.cache_info().misses, 'counter')
+METRICS.function('bot_share_structure_cache_size', 'Составы семьи в кэше долей',
+                 lambda: share_structure.cache_info().currsize)
+
+
+def timed(callback: Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable]):
+    """The handler with its duration recorded in HANDLER_SECONDS under its name."""
+    histogram = HANDLER_SECONDS.labels(callback.__name__)
+
+    @functools.wraps(callback)
+    async def timed_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    return timed_callback
+
+
+class TimedRequest(HTTPXRequest):
+    """HTTPXRequest that records the duration of every Bot API call in API_SECONDS."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> Tuple[int, bytes]:
+        start = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            API_SECONDS.labels(url.rsplit('/', 1)[-1]).observe(time.perf_counter() - start)
+
+
+# Доля обновлений, которые профилируются cProfile и tracemalloc; 0 отключает профилирование
+PROFILE_RATE = float(os.environ.get("PROFILE_RATE", 0))
+# Каталог для профилей и как часто (в секундах) записывать новый файл; хранятся последние PROFILE_KEEP
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", DEFAULT_PROFILE_INTERVAL))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", DEFAULT_KEEP))
+# Глубина трассировок tracemalloc; 0 - без профиля памяти, который замедляет профилируемые обновления в разы
+PROFILE_TRACEMALLOC_FRAMES = int(os.environ.get("PROFILE_TRACEMALLOC_FRAMES", DEFAULT_FRAMES))
+# Profiler of the sampled updates, set up by build_application()
+PROFILER: Optional[UpdateProfiler] = None
+
 # Define conversation states
 TOTAL_INHERITANCE, DEBTS, HAS_WILL, WILL_AMOUNT, IS_MURDERER, IS_DIFFERENT_FAITH, HAS_SPOUSE, HAS_WIFE, NUM_DAUGHTERS, NUM_SONS, NUM_GRANDDAUGHTERS, NUM_GRANDSONS, HAS_FATHER, HAS_MOTHER, HAS_GRANDFATHER, HAS_GRANDMOTHER, NUM_SIBLINGS_SISTERS, NUM_SIBLINGS_BROTHERS, NUM_COUSINS_SISTERS, NUM_COUSINS_BROTHERS = range(
     20)
 
 
-def start(update: Update, context: CallbackContext) -> int:
+async def send_reply(update: Update, text: str, part: int = 0, **kwargs):
+    """Send a message to the chat of the update through the outbox, which retries it after network errors.
+
+    ``part`` tells apart the messages sent for the same update.
+    """
+    if OUTBOX is None:
+        await update.effective_message.reply_text(text, **kwargs)
+        return
+    await OUTBOX.send(update.get_bot(), update.effective_chat.id, f'{update.update_id}:{part}', 'send_message',
+                      text=text, **kwargs)
+
+
+async def edit_reply(update: Update, text: str, **kwargs):
+    """Turn the message with the pressed button into ``text`` through the outbox."""
+    query = update.callback_query
+    if OUTBOX is None:
+        await query.edit_message_text(text, **kwargs)
+        return
+    await OUTBOX.send(update.get_bot(), update.effective_chat.id, f'{update.update_id}:edit', 'edit_message_text',
+                      message_id=query.message.message_id, text=text, **kwargs)
+
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start the conversation and ask for the total inheritance amount."""
+    if context.args == ['calc']:
+        # Opened from the button of the inline mode
+        await update.message.reply_text(CALC_USAGE)
+        return ConversationHandler.END
+
     # Initialize user data
     context.user_data.clear()
+    if update.callback_query:
+        await update.callback_query.answer()
     
     # Remove keyboard during calculation process
-    update.message.reply_text(
+    await update.effective_message.reply_text(
         'Ассаламу алейкум! 🌙\n\n'
         '*КАЛЬКУЛЯТОР НАСЛЕДСТВА PRO* 📊\n\n'
         'Я помогу рассчитать доли наследства по исламским законам (фараиз) с учетом расширенных правил:\n'
@@ -36,936 +226,295 @@ def start(update: Update, context: CallbackContext) -> int:
     return TOTAL_INHERITANCE
 
 
-def handle_total_inheritance(update: Update, context: CallbackContext) -> int:
+async def handle_total_inheritance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Parse and store the total inheritance amount."""
     try:
-        total = float(update.message.text.replace(',', '.'))
-        if total <= 0:
-            raise ValueError("Сумма наследства должна быть положительной")
+        total = parse_total(update.message.text)
 
         context.user_data['total_inheritance'] = total
-        update.message.reply_text(
-            f'Сумма наследства: {total}\nВведите общую сумму долгов (если нет, введите 0):'
-        )
+        await send_reply(update, f'Сумма наследства: {total}\nВведите общую сумму долгов (если нет, введите 0):')
         return DEBTS
     except ValueError as e:
-        update.message.reply_text(
+        await update.message.reply_text(
             f'Ошибка: {str(e)}. Пожалуйста, введите корректное число:')
         return TOTAL_INHERITANCE
 
 
-def handle_debts(update: Update, context: CallbackContext) -> int:
+async def handle_debts(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Parse and store the debts amount."""
     try:
-        debts = float(update.message.text.replace(',', '.'))
-        if debts < 0:
-            raise ValueError("Сумма долгов не может быть отрицательной")
+        debts = parse_debts(update.message.text)
 
         context.user_data['debts'] = debts
-        update.message.reply_text(
-            'Оставил ли наследодатель завещание? (введите 1 - да, 0 - нет)')
+        await ask(update, HAS_WILL)
         return HAS_WILL
     except ValueError as e:
-        update.message.reply_text(
+        await update.message.reply_text(
             f'Ошибка: {str(e)}. Пожалуйста, введите корректное число:')
         return DEBTS
         
         
-def handle_has_will(update: Update, context: CallbackContext) -> int:
-    """Parse and store whether the deceased left a will."""
-    try:
-        text = update.message.text.strip()
-        if text not in ["0", "1"]:
-            raise ValueError("Пожалуйста, введите 1 для 'да' или 0 для 'нет'")
-
-        has_will = bool(int(text))
-        context.user_data['has_will'] = has_will
-        
-        if has_will:
-            update.message.reply_text(
-                'Какую сумму наследодатель указал в завещании? (до 1/3 от общей суммы наследства)')
-            return WILL_AMOUNT
-        else:
-            update.message.reply_text(
-                'Есть ли супруг (муж)? (введите 1 - да, 0 - нет)')
-            return HAS_SPOUSE
-    except ValueError as e:
-        update.message.reply_text(f'Ошибка: {str(e)}')
-        return HAS_WILL
-        
-        
-def handle_will_amount(update: Update, context: CallbackContext) -> int:
+async def handle_will_amount(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Parse and store the amount specified in the will."""
     try:
-        will_amount = float(update.message.text.replace(',', '.'))
-        if will_amount < 0:
-            raise ValueError("Сумма в завещании не может быть отрицательной")
-            
-        total_inheritance = float(context.user_data.get('total_inheritance', 0))
-        debts = float(context.user_data.get('debts', 0))
-        net_inheritance = max(0, total_inheritance - debts)
-        
-        max_will_amount = net_inheritance / 3  # Не более 1/3 от наследства по исламскому праву
-        
-        if will_amount > max_will_amount:
-            update.message.reply_text(
-                f'Предупреждение: По исламскому праву нельзя завещать более 1/3 от общего наследства. '
-                f'Максимальная сумма завещания: {max_will_amount:.2f}. '
-                f'Сумма будет ограничена до {max_will_amount:.2f}.')
-            will_amount = max_will_amount
+        will_amount = parse_will_amount(update.message.text)
+
+        max_amount = max_will_amount(context.user_data)  # Не более 1/3 от наследства по исламскому праву
+
+        if will_amount > max_amount:
+            await send_reply(update, will_warning(max_amount))
+            will_amount = max_amount
             
         context.user_data['will_amount'] = will_amount
-        update.message.reply_text(
-            'Есть ли среди наследников тот, кто лишил жизни наследодателя? (введите 1 - да, 0 - нет)')
+        await ask(update, IS_MURDERER, part=1)
         return IS_MURDERER
     except ValueError as e:
-        update.message.reply_text(
+        await update.message.reply_text(
             f'Ошибка: {str(e)}. Пожалуйста, введите корректное число:')
         return WILL_AMOUNT
         
         
-def handle_is_murderer(update: Update, context: CallbackContext) -> int:
-    """Parse and store whether there is a heir who killed the deceased."""
-    try:
-        text = update.message.text.strip()
-        if text not in ["0", "1"]:
-            raise ValueError("Пожалуйста, введите 1 для 'да' или 0 для 'нет'")
-
-        is_murderer = bool(int(text))
-        context.user_data['is_murderer'] = is_murderer
-        
-        update.message.reply_text(
-            'Есть ли среди наследников немусульмане? (введите 1 - да, 0 - нет)')
-        return IS_DIFFERENT_FAITH
-    except ValueError as e:
-        update.message.reply_text(f'Ошибка: {str(e)}')
-        return IS_MURDERER
-        
-        
-def handle_is_different_faith(update: Update, context: CallbackContext) -> int:
-    """Parse and store whether there are heirs of different faith."""
-    try:
-        text = update.message.text.strip()
-        if text not in ["0", "1"]:
-            raise ValueError("Пожалуйста, введите 1 для 'да' или 0 для 'нет'")
-
-        is_different_faith = bool(int(text))
-        context.user_data['is_different_faith'] = is_different_faith
-        
-        update.message.reply_text(
-            'Есть ли супруг (муж)? (введите 1 - да, 0 - нет)')
-        return HAS_SPOUSE
-    except ValueError as e:
-        update.message.reply_text(f'Ошибка: {str(e)}')
-        return IS_DIFFERENT_FAITH
-
-
-def handle_has_spouse(update: Update, context: CallbackContext) -> int:
-    """Parse and store whether the deceased has a spouse (husband)."""
-    try:
-        text = update.message.text.strip()
-        if text not in ["0", "1"]:
-            raise ValueError("Пожалуйста, введите 1 для 'да' или 0 для 'нет'")
-
-        context.user_data['has_spouse'] = bool(int(text))
-        update.message.reply_text(
-            'Есть ли супруга (жена)? (введите 1 - да, 0 - нет)')
-        return HAS_WIFE
-    except ValueError as e:
-        update.message.reply_text(f'Ошибка: {str(e)}')
-        return HAS_SPOUSE
-
-
-def handle_has_wife(update: Update, context: CallbackContext) -> int:
-    """Parse and store whether the deceased has a wife."""
-    try:
-        text = update.message.text.strip()
-        if text not in ["0", "1"]:
-            raise ValueError("Пожалуйста, введите 1 для 'да' или 0 для 'нет'")
-
-        context.user_data['has_wife'] = bool(int(text))
-        update.message.reply_text('Сколько дочерей? (введите число)')
-        return NUM_DAUGHTERS
-    except ValueError as e:
-        update.message.reply_text(f'Ошибка: {str(e)}')
-        return HAS_WIFE
-
-
-def handle_num_daughters(update: Update, context: CallbackContext) -> int:
-    """Parse and store the number of daughters."""
-    try:
-        num = int(update.message.text.strip())
-        if num < 0:
-            raise ValueError("Число не может быть отрицательным")
-
-        context.user_data['num_daughters'] = num
-        update.message.reply_text('Сколько сыновей? (введите число)')
-        return NUM_SONS
-    except ValueError as e:
-        update.message.reply_text(
-            f'Ошибка: {str(e)}. Пожалуйста, введите целое число:')
-        return NUM_DAUGHTERS
-
-
-def handle_num_sons(update: Update, context: CallbackContext) -> int:
-    """Parse and store the number of sons."""
-    try:
-        num = int(update.message.text.strip())
-        if num < 0:
-            raise ValueError("Число не может быть отрицательным")
-
-        context.user_data['num_sons'] = num
-        update.message.reply_text('Сколько внучек? (введите число)')
-        return NUM_GRANDDAUGHTERS
-    except ValueError as e:
-        update.message.reply_text(
-            f'Ошибка: {str(e)}. Пожалуйста, введите целое число:')
-        return NUM_SONS
-
-
-def handle_num_granddaughters(update: Update, context: CallbackContext) -> int:
-    """Parse and store the number of granddaughters."""
-    try:
-        num = int(update.message.text.strip())
-        if num < 0:
-            raise ValueError("Число не может быть отрицательным")
-
-        context.user_data['num_granddaughters'] = num
-        update.message.reply_text('Сколько внуков? (введите число)')
-        return NUM_GRANDSONS
-    except ValueError as e:
-        update.message.reply_text(
-            f'Ошибка: {str(e)}. Пожалуйста, введите целое число:')
-        return NUM_GRANDDAUGHTERS
+class Question(NamedTuple):
+    field: str
+    text: str
+    parse: Callable[[str], object]
+    error: str  # Подсказка после текста ошибки
+    keyboard: Optional[InlineKeyboardMarkup] = None
+
+
+def answer_keyboard(state: int, *choices: Tuple[str, str]) -> InlineKeyboardMarkup:
+    """Buttons that answer the question of ``state`` with the values of ``choices`` in one row."""
+    return InlineKeyboardMarkup([[InlineKeyboardButton(label, callback_data=f'answer:{state}:{value}')
+                                  for label, value in choices]])
+
+
+def yes_no(state: int) -> InlineKeyboardMarkup:
+    return answer_keyboard(state, ('Да', '1'), ('Нет', '0'))
+
+
+def counts(state: int) -> InlineKeyboardMarkup:
+    # Larger numbers are typed
+    return answer_keyboard(state, *((str(num), str(num)) for num in range(6)))
+
+
+FLAG_HINT = ''
+COUNT_HINT = '. Пожалуйста, введите целое число:'
+
+# Questions asked with buttons; the amounts are only typed
+QUESTIONS = {
+    HAS_WILL: Question('has_will', 'Оставил ли наследодатель завещание? (введите 1 - да, 0 - нет)',
+                       parse_flag, FLAG_HINT, yes_no(HAS_WILL)),
+    WILL_AMOUNT: Question('will_amount',
+                          'Какую сумму наследодатель указал в завещании? (до 1/3 от общей суммы наследства)',
+                          parse_will_amount, '. Пожалуйста, введите корректное число:'),
+    IS_MURDERER: Question('is_murderer',
+                          'Есть ли среди наследников тот, кто лишил жизни наследодателя? (введите 1 - да, 0 - нет)',
+                          parse_flag, FLAG_HINT, yes_no(IS_MURDERER)),
+    IS_DIFFERENT_FAITH: Question('is_different_faith',
+                                 'Есть ли среди наследников немусульмане? (введите 1 - да, 0 - нет)',
+                                 parse_flag, FLAG_HINT, yes_no(IS_DIFFERENT_FAITH)),
+    HAS_SPOUSE: Question('has_spouse', 'Есть ли супруг (муж)? (введите 1 - да, 0 - нет)',
+                         parse_flag, FLAG_HINT, yes_no(HAS_SPOUSE)),
+    HAS_WIFE: Question('has_wife', 'Есть ли супруга (жена)? (введите 1 - да, 0 - нет)',
+                       parse_flag, FLAG_HINT, yes_no(HAS_WIFE)),
+    NUM_DAUGHTERS: Question('num_daughters', 'Сколько дочерей? (введите число)',
+                            parse_count, COUNT_HINT, counts(NUM_DAUGHTERS)),
+    NUM_SONS: Question('num_sons', 'Сколько сыновей? (введите число)',
+                       parse_count, COUNT_HINT, counts(NUM_SONS)),
+    NUM_GRANDDAUGHTERS: Question('num_granddaughters', 'Сколько внучек? (введите число)',
+                                 parse_count, COUNT_HINT, counts(NUM_GRANDDAUGHTERS)),
+    NUM_GRANDSONS: Question('num_grandsons', 'Сколько внуков? (введите число)',
+                            parse_count, COUNT_HINT, counts(NUM_GRANDSONS)),
+    HAS_FATHER: Question('has_father', 'Жив ли отец наследодателя? (введите 1 - да, 0 - нет)',
+                         parse_flag, FLAG_HINT, yes_no(HAS_FATHER)),
+    HAS_MOTHER: Question('has_mother', 'Жива ли мать наследодателя? (введите 1 - да, 0 - нет)',
+                         parse_flag, FLAG_HINT, yes_no(HAS_MOTHER)),
+    HAS_GRANDFATHER: Question('has_grandfather', 'Жив ли дедушка (по отцовской линии)? (введите 1 - да, 0 - нет)',
+                              parse_flag, FLAG_HINT, yes_no(HAS_GRANDFATHER)),
+    HAS_GRANDMOTHER: Question('has_grandmother', 'Жива ли бабушка (по отцовской линии)? (введите 1 - да, 0 - нет)',
+                              parse_flag, FLAG_HINT, yes_no(HAS_GRANDMOTHER)),
+    NUM_SIBLINGS_SISTERS: Question('num_siblings_sisters', 'Сколько родных сестёр у наследодателя? (введите число)',
+                                   parse_count, COUNT_HINT, counts(NUM_SIBLINGS_SISTERS)),
+    NUM_SIBLINGS_BROTHERS: Question('num_siblings_brothers',
+                                    'Сколько родных братьев у наследодателя? (введите число)',
+                                    parse_count, COUNT_HINT, counts(NUM_SIBLINGS_BROTHERS)),
+    NUM_COUSINS_SISTERS: Question('num_cousins_sisters', 'Сколько двоюродных сестёр у наследодателя? (введите число)',
+                                  parse_count, COUNT_HINT, counts(NUM_COUSINS_SISTERS)),
+    NUM_COUSINS_BROTHERS: Question('num_cousins_brothers',
+                                   'Сколько двоюродных братьев у наследодателя? (введите число)',
+                                   parse_count, COUNT_HINT, counts(NUM_COUSINS_BROTHERS)),
+}
+
+
+async def ask(update: Update, state: int, part: int = 0):
+    """Ask the question of ``state``: in place of the previous one after a button press."""
+    question = QUESTIONS[state]
+    query = update.callback_query
+    if query:
+        # Answering the query stops the progress indicator on the button
+        await asyncio.gather(query.answer(), edit_reply(update, question.text, reply_markup=question.keyboard))
+    else:
+        await send_reply(update, question.text, part, reply_markup=question.keyboard)
 
 
-def handle_num_grandsons(update: Update, context: CallbackContext) -> int:
-    """Parse and store the number of grandsons."""
-    try:
-        num = int(update.message.text.strip())
-        if num < 0:
-            raise ValueError("Число не может быть отрицательным")
-
-        context.user_data['num_grandsons'] = num
-        update.message.reply_text(
-            'Жив ли отец наследодателя? (введите 1 - да, 0 - нет)')
-        return HAS_FATHER
-    except ValueError as e:
-        update.message.reply_text(
-            f'Ошибка: {str(e)}. Пожалуйста, введите целое число:')
-        return NUM_GRANDSONS
+def answer_handler(state: int) -> Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[int]]:
+    """Handler of a typed or pressed answer to the question of ``state``."""
+    question = QUESTIONS[state]
 
+    async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        query = update.callback_query
+        if query:
+            # The buttons only send valid values
+            value = question.parse(query.data.rsplit(':', 1)[1])
+        else:
+            try:
+                value = question.parse(update.message.text)
+            except ValueError as e:
+                await update.message.reply_text(f'Ошибка: {str(e)}{question.error}')
+                return state
+        context.user_data[question.field] = value
+
+        if state == NUM_COUSINS_BROTHERS:
+            return await finish(update, context)
+        # Without a will the will amount, murderer and faith questions are skipped
+        next_state = HAS_SPOUSE if state == HAS_WILL and not value else state + 1
+        await ask(update, next_state)
+        return next_state
+
+    handle_answer.__name__ = handle_answer.__qualname__ = f'handle_{question.field}'
+    handle_answer.__doc__ = f'Parse and store {question.field}.'
+    return handle_answer
+
+
+async def stale_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer a button of a question that is no longer asked."""
+    await update.callback_query.answer('Этот вопрос уже не актуален. Продолжите с последнего вопроса или /start')
+
+
+def timed_response(user_data: Mapping, detailed: bool) -> Tuple[str, float, float]:
+    """The response with the seconds spent on the calculation and on the formatting.
+
+    Runs in the executor, a module-level function so that it can run in a process
+    pool too; the histograms are observed on the event loop, so the timings come
+    back with the result.
+    """
+    start = time.perf_counter()
+    shares = calculate(Estate.from_user_data(user_data), detailed)
+    calculated = time.perf_counter()
+    response = render_response(user_data, shares)
+    return response, calculated - start, time.perf_counter() - calculated
+
+
+async def calculation_response(user_data: Mapping, detailed: bool = True) -> str:
+    """The rendered result from the cache, calculated in the executor on a miss.
+
+    The calculation is CPU-bound, so it runs off the event loop and the other
+    conversations keep being served meanwhile.
+    """
+    user_data = dict(user_data)
+    key = response_key(user_data, detailed)
+    response = RESPONSE_CACHE.get(key)
+    if response is None:
+        loop = asyncio.get_running_loop()
+        if PROFILER is not None and PROFILER.sampling():
+            # Profiled where it runs: the profile of the event loop does not see the executor
+            result, stats = await loop.run_in_executor(
+                CALCULATION_EXECUTOR, profiled, timed_response, user_data, detailed)
+            PROFILER.add(stats)
+        else:
+            result = await loop.run_in_executor(CALCULATION_EXECUTOR, timed_response, user_data, detailed)
+        response, calculate_seconds, format_seconds = result
+        CALCULATE_SECONDS.observe(calculate_seconds)
+        FORMAT_SECONDS.observe(format_seconds)
+        RESPONSE_CACHE.put(key, response)
+    return response
 
-def handle_has_father(update: Update, context: CallbackContext) -> int:
-    """Parse and store whether the deceased's father is alive."""
-    try:
-        text = update.message.text.strip()
-        if text not in ["0", "1"]:
-            raise ValueError("Пожалуйста, введите 1 для 'да' или 0 для 'нет'")
-
-        context.user_data['has_father'] = bool(int(text))
-        update.message.reply_text(
-            'Жива ли мать наследодателя? (введите 1 - да, 0 - нет)')
-        return HAS_MOTHER
-    except ValueError as e:
-        update.message.reply_text(f'Ошибка: {str(e)}')
-        return HAS_FATHER
 
+async def finish(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Calculate the shares and send the result, completing the conversation."""
+    # Calculate inheritance shares and format the response (cached for identical answers)
+    response = await calculation_response(context.user_data, context.bot_data.get('detailed', True))
 
-def handle_has_mother(update: Update, context: CallbackContext) -> int:
-    """Parse and store whether the deceased's mother is alive."""
-    try:
-        text = update.message.text.strip()
-        if text not in ["0", "1"]:
-            raise ValueError("Пожалуйста, введите 1 для 'да' или 0 для 'нет'")
-
-        context.user_data['has_mother'] = bool(int(text))
-        update.message.reply_text(
-            'Жив ли дедушка (по отцовской линии)? (введите 1 - да, 0 - нет)')
-        return HAS_GRANDFATHER
-    except ValueError as e:
-        update.message.reply_text(f'Ошибка: {str(e)}')
-        return HAS_MOTHER
+    query = update.callback_query
+    if query:
+        # The questionnaire message turns into the result
+        await asyncio.gather(query.answer(), edit_reply(
+            update, response, parse_mode='Markdown',
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton('🧮 Начать расчет', callback_data='start')]])))
+        return ConversationHandler.END
 
+    # Создаем клавиатуру с кнопками для результата
+    keyboard = [
+        [KeyboardButton('🧮 Начать расчет')],
+        [KeyboardButton('💰 Донат'), KeyboardButton('💬 Отзывы и предложения')]
+    ]
+    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
-def handle_has_grandfather(update: Update, context: CallbackContext) -> int:
-    """Parse and store whether the deceased's grandfather is alive."""
-    try:
-        text = update.message.text.strip()
-        if text not in ["0", "1"]:
-            raise ValueError("Пожалуйста, введите 1 для 'да' или 0 для 'нет'")
-
-        context.user_data['has_grandfather'] = bool(int(text))
-        update.message.reply_text(
-            'Жива ли бабушка (по отцовской линии)? (введите 1 - да, 0 - нет)')
-        return HAS_GRANDMOTHER
-    except ValueError as e:
-        update.message.reply_text(f'Ошибка: {str(e)}')
-        return HAS_GRANDFATHER
+    await send_reply(update, response, parse_mode='Markdown', reply_markup=reply_markup)
+    return ConversationHandler.END
 
 
-def handle_has_grandmother(update: Update, context: CallbackContext) -> int:
-    """Parse and store whether the deceased's grandmother is alive."""
-    try:
-        text = update.message.text.strip()
-        if text not in ["0", "1"]:
-            raise ValueError("Пожалуйста, введите 1 для 'да' или 0 для 'нет'")
-
-        context.user_data['has_grandmother'] = bool(int(text))
-        update.message.reply_text(
-            'Сколько родных сестёр у наследодателя? (введите число)')
-        return NUM_SIBLINGS_SISTERS
-    except ValueError as e:
-        update.message.reply_text(f'Ошибка: {str(e)}')
-        return HAS_GRANDMOTHER
+CALC_USAGE = (
+    'Расчет одним сообщением:\n'
+    '/calc 1000000 wife sons=2 daughters=1 mother\n\n'
+    'Числа в начале - сумма наследства, долги и сумма завещания. '
+    'Слово без значения означает "да" (wife, husband, father, mother, grandfather, grandmother, '
+    'murderer, faith), а имя=значение задает любое поле: total, debts, will, daughters, sons, '
+    'granddaughters, grandsons, sisters, brothers, cousin_sisters, cousin_brothers.')
 
 
-def handle_num_siblings_sisters(update: Update,
-                              context: CallbackContext) -> int:
-    """Parse and store the number of sisters."""
-    try:
-        num = int(update.message.text.strip())
-        if num < 0:
-            raise ValueError("Число не может быть отрицательным")
-
-        context.user_data['num_siblings_sisters'] = num
-        update.message.reply_text(
-            'Сколько родных братьев у наследодателя? (введите число)')
-        return NUM_SIBLINGS_BROTHERS
-    except ValueError as e:
-        update.message.reply_text(
-            f'Ошибка: {str(e)}. Пожалуйста, введите целое число:')
-        return NUM_SIBLINGS_SISTERS
+# Кнопка над результатами встроенного режима, открывающая чат с ботом
+INLINE_HELP_BUTTON = InlineQueryResultsButton('Как описать состав семьи', start_parameter='calc')
 
 
-def handle_num_siblings_brothers(update: Update,
-                               context: CallbackContext) -> int:
-    """Parse and store the number of brothers."""
+async def calc_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Calculate a whole scenario given in one message, e.g. /calc 1000000 wife sons=2."""
+    if not context.args:
+        await update.message.reply_text(CALC_USAGE)
+        return
     try:
-        num = int(update.message.text.strip())
-        if num < 0:
-            raise ValueError("Число не может быть отрицательным")
-
-        context.user_data['num_siblings_brothers'] = num
-        update.message.reply_text(
-            'Сколько двоюродных сестёр у наследодателя? (введите число)')
-        return NUM_COUSINS_SISTERS
-    except ValueError as e:
-        update.message.reply_text(
-            f'Ошибка: {str(e)}. Пожалуйста, введите целое число:')
-        return NUM_SIBLINGS_BROTHERS
-
+        user_data, warnings = parse_scenario(' '.join(context.args))
+    except ScenarioError as e:
+        await update.message.reply_text(
+            'Ошибки в описании:\n' + '\n'.join(f'• {field}: {message}' for field, message in e.errors)
+            + '\n\n' + CALC_USAGE)
+        return
 
-def handle_num_cousins_sisters(update: Update,
-                               context: CallbackContext) -> int:
-    """Parse and store the number of sisters."""
-    try:
-        num = int(update.message.text.strip())
-        if num < 0:
-            raise ValueError("Число не может быть отрицательным")
-
-        context.user_data['num_cousins_sisters'] = num
-        update.message.reply_text(
-            'Сколько двоюродных братьев у наследодателя? (введите число)')
-        return NUM_COUSINS_BROTHERS
-    except ValueError as e:
-        update.message.reply_text(
-            f'Ошибка: {str(e)}. Пожалуйста, введите целое число:')
-        return NUM_COUSINS_SISTERS
+    response = await calculation_response(user_data, context.bot_data.get('detailed', True))
+    keyboard = [
+        [KeyboardButton('🧮 Начать расчет')],
+        [KeyboardButton('💰 Донат'), KeyboardButton('💬 Отзывы и предложения')]
+    ]
+    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    await send_reply(update, '\n\n'.join(warnings + [response]), parse_mode='Markdown', reply_markup=reply_markup)
 
 
-def handle_num_cousins_brothers(update: Update,
-                                context: CallbackContext) -> int:
-    """Parse and store the number of brothers and complete the calculation."""
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer an inline query like @bot 1000000 wife sons=2 with the result ready to be sent to the chat."""
+    query = update.inline_query
+    if not query.query.strip():
+        await query.answer([], cache_time=INLINE_CACHE_TIME, button=INLINE_HELP_BUTTON)
+        return
     try:
-        num = int(update.message.text.strip())
-        if num < 0:
-            raise ValueError("Число не может быть отрицательным")
-
-        context.user_data['num_cousins_brothers'] = num
-
-        # Calculate inheritance shares
-        inheritance_data = calculate_inheritance(context.user_data)
-
-        # Format the response
-        response = format_inheritance_response(context.user_data, inheritance_data)
-
-        # Создаем клавиатуру с кнопками для результата
-        keyboard = [
-            [KeyboardButton('🧮 Начать расчет')],
-            [KeyboardButton('💰 Донат'), KeyboardButton('💬 Отзывы и предложения')]
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        
-        update.message.reply_text(response, parse_mode='Markdown', reply_markup=reply_markup)
-        return ConversationHandler.END
-    except ValueError as e:
-        update.message.reply_text(
-            f'Ошибка: {str(e)}. Пожалуйста, введите целое число:')
-        return NUM_COUSINS_BROTHERS
-
-
-def calculate_inheritance(user_data):
-    """Calculate inheritance shares based on Islamic inheritance laws."""
-    total_inheritance = float(user_data.get('total_inheritance', 0))
-    debts = float(user_data.get('debts', 0))
-    has_will = user_data.get('has_will', False)
-    will_amount = float(user_data.get('will_amount', 0)) if has_will else 0
-    is_murderer = user_data.get('is_murderer', False)  # Есть ли убийца среди наследников
-    is_different_faith = user_data.get('is_different_faith', False)  # Есть ли наследники другой веры
-
-    # Calculate net inheritance after debts
-    net_inheritance = max(0, total_inheritance - debts)
-
-    if net_inheritance <= 0:
-        return {
-            "amounts": {"Ошибка": "После выплаты долгов не осталось средств для распределения"},
-            "fractions": {},
-            "percentages": {},
-            "explanations": {}
-        }
-    
-    # Проверка суммы завещания (не более 1/3 наследства)
-    max_will_amount = net_inheritance / 3
-    will_amount = min(will_amount, max_will_amount)
-
-    # Initialize shares for different family members
-    amounts = {}  # Денежные суммы
-    fractions = {}  # Доли в виде дробей
-    percentages = {}  # Процентное соотношение
-    explanations = {}  # Объяснения для наследников без доли
-    
-    # Предупреждения о специальных случаях
-    if is_murderer:
-        explanations["Предупреждение"] = "По исламскому праву убийца не может наследовать имущество своей жертвы. Согласно учению Мухаммеда ибн Идрис Шафии, убийца во всех случаях лишается права наследовать после своей жертвы (за исключением убийства в приступе безумия или совершенного малолетним). Есть и другие трактовки о сохранении права наследования в случаях убийства при самозащите или по несчастному случаю. Рекомендуем проконсультироваться с имамом или исламским юристом."
-    
-    if is_different_faith:
-        explanations["Предупреждение о вере"] = "По исламскому праву немусульмане не могут наследовать от мусульман, а мусульмане не могут наследовать от немусульман. Это правило относится как к наследникам по родству, так и по завещанию. Рекомендуем проконсультироваться с имамом или исламским юристом."
-    
-    # Учитываем завещание, если оно есть
-    if has_will and will_amount > 0:
-        amounts["Завещание (васия)"] = will_amount
-        will_percentage = (will_amount / net_inheritance) * 100
-        percentages["Завещание (васия)"] = will_percentage
-        fractions["Завещание (васия)"] = "≤1/3"
-        explanations["О завещании (васия)"] = "Согласно исламскому праву, завещание (васия) может составлять не более 1/3 от всего наследства. Распределение по завещанию происходит после выплаты долгов умершего, но до распределения наследства между родственниками. Наследники по родству не могут одновременно быть наследниками по завещанию."
-        # Уменьшаем оставшуюся сумму
-        remaining = net_inheritance - will_amount
-    else:
-        remaining = net_inheritance
-
-    # Islamic inheritance calculation rules
-    # 1. First allocate fixed shares (Fard)
-    # 2. Then distribute remaining to agnatic heirs (Asaba)
-
-    # Spouse shares
-    if user_data.get('has_spouse', False):
-        has_descendants = (user_data.get('num_sons', 0) > 0
-                           or user_data.get('num_daughters', 0) > 0
-                           or user_data.get('num_grandsons', 0) > 0
-                           or user_data.get('num_granddaughters', 0) > 0)
-
-        if has_descendants:
-            spouse_share = net_inheritance * 0.25
-            fractions["Супруг (муж)"] = "1/4"
-            percentages["Супруг (муж)"] = 25.0
-            explanations["О доле мужа"] = "Согласно аяту 12 суры Ан-Ниса (Женщины): «Вам принадлежит половина того, что оставили ваши жены, если у них нет ребенка. Но если у них есть ребенок, то вам принадлежит четверть того, что они оставили»."
-        else:
-            spouse_share = net_inheritance * 0.5
-            fractions["Супруг (муж)"] = "1/2"
-            percentages["Супруг (муж)"] = 50.0
-            explanations["О доле мужа"] = "Согласно аяту 12 суры Ан-Ниса (Женщины): «Вам принадлежит половина того, что оставили ваши жены, если у них нет ребенка»."
-            
-        amounts["Супруг (муж)"] = spouse_share
-        remaining -= spouse_share
-
-    if user_data.get('has_wife', False):
-        has_descendants = (user_data.get('num_sons', 0) > 0
-                           or user_data.get('num_daughters', 0) > 0
-                           or user_data.get('num_grandsons', 0) > 0
-                           or user_data.get('num_granddaughters', 0) > 0)
-
-        if has_descendants:
-            wife_share = net_inheritance * 0.125
-            fractions["Супруга (жена)"] = "1/8"
-            percentages["Супруга (жена)"] = 12.5
-            explanations["О доле жены"] = "Согласно аяту 12 суры Ан-Ниса (Женщины): «Им принадлежит четверть того, что вы оставили, если у вас нет ребенка. Но если у вас есть ребенок, то им принадлежит одна восьмая того, что вы оставили»."
-        else:
-            wife_share = net_inheritance * 0.25
-            fractions["Супруга (жена)"] = "1/4"
-            percentages["Супруга (жена)"] = 25.0
-            explanations["О доле жены"] = "Согласно аяту 12 суры Ан-Ниса (Женщины): «Им принадлежит четверть того, что вы оставили, если у вас нет ребенка»."
-            
-        amounts["Супруга (жена)"] = wife_share
-        remaining -= wife_share
-
-    # Parents shares
-    if user_data.get('has_father', False):
-        has_sons = user_data.get('num_sons', 0) > 0
-        if has_sons:
-            father_share = net_inheritance * (1/6)
-            fractions["Отец"] = "1/6"
-            percentages["Отец"] = 16.67
-            explanations["О доле отца"] = "Согласно аяту 11 суры Ан-Ниса (Женщины): «Каждому из родителей принадлежит одна шестая того, что он оставил, если у него есть ребенок». Отец получает фиксированную долю 1/6 наследства."
-        else:
-            father_share = remaining  # Father gets residue if no sons
-            fractions["Отец"] = "Остаток"
-            if net_inheritance > 0:
-                percentages["Отец"] = (father_share / net_inheritance) * 100
-            else:
-                percentages["Отец"] = 0
-            explanations["О доле отца"] = "Если у умершего нет сыновей, отец получает остаток наследства после распределения фиксированных долей другим наследникам. Согласно правилам 'асаба' (остаточные наследники), отец имеет право на оставшуюся часть наследства."
-            
-        amounts["Отец"] = father_share
-        remaining -= father_share
-
-    if user_data.get('has_mother', False):
-        has_children = (user_data.get('num_sons', 0) > 0
-                        or user_data.get('num_daughters', 0) > 0)
-        has_siblings = (user_data.get('num_siblings_brothers', 0) > 0
-                        or user_data.get('num_siblings_sisters', 0) > 0
-                        or user_data.get('num_cousins_brothers', 0) > 0
-                        or user_data.get('num_cousins_sisters', 0) > 0)
-
-        if has_children or has_siblings:
-            mother_share = net_inheritance * (1/6)
-            fractions["Мать"] = "1/6"
-            percentages["Мать"] = 16.67
-            explanations["О доле матери"] = "Согласно аяту 11 суры Ан-Ниса (Женщины): «Каждому из родителей принадлежит одна шестая того, что он оставил, если у него есть ребенок. Если же у него есть братья, то матери достается одна шестая». Мать получает 1/6, так как у умершего есть дети или братья/сестры."
-        else:
-            mother_share = net_inheritance * (1/3)
-            fractions["Мать"] = "1/3"
-            percentages["Мать"] = 33.33
-            explanations["О доле матери"] = "Согласно аяту 11 суры Ан-Ниса (Женщины): «Если же у него нет ребенка, то ему наследуют родители, и матери достается одна треть». Мать получает 1/3, так как у умершего нет детей и братьев/сестер."
-
-        amounts["Мать"] = mother_share
-        remaining -= mother_share
-
-    # Grandfather's share (paternal)
-    if user_data.get('has_grandfather', False):
-        if user_data.get('has_father', False):
-            # Grandfather doesn't inherit if father is alive
-            explanations["Дедушка (по отцу)"] = "Не получает долю, так как отец жив. По исламскому праву, наличие отца блокирует право деда на наследство, поскольку отец является более близким родственником к умершему."
-        else:
-            # If father is not alive, grandfather gets 1/6
-            grandfather_share = net_inheritance * (1/6)
-            amounts["Дедушка (по отцу)"] = grandfather_share
-            fractions["Дедушка (по отцу)"] = "1/6"
-            percentages["Дедушка (по отцу)"] = 16.67
-            explanations["О доле дедушки"] = "В отсутствие отца, дедушка (по отцовской линии) занимает его место в наследовании и получает фиксированную долю 1/6 наследства. Это правило основано на принципе 'асабы' - когда более близкий родственник отсутствует, его место занимает следующий по степени родства."
-            remaining -= grandfather_share
-
-    # Grandmother's share (maternal)
-    if user_data.get('has_grandmother', False):
-        if user_data.get('has_mother', False):
-            # Grandmother doesn't inherit if mother is alive
-            explanations["Бабушка (по матери)"] = "Не получает долю, так как мать жива. По исламскому праву, наличие матери блокирует право бабушки на наследство, поскольку мать является более близким родственником к умершему."
-        else:
-            # If mother is not alive, grandmother gets 1/6
-            grandmother_share = net_inheritance * (1/6)
-            amounts["Бабушка (по матери)"] = grandmother_share
-            fractions["Бабушка (по матери)"] = "1/6"
-            percentages["Бабушка (по матери)"] = 16.67
-            explanations["О доле бабушки"] = "В отсутствие матери, бабушка (по материнской линии) занимает её место в наследовании и получает фиксированную долю 1/6 наследства. Это правило основано на хадисе, согласно которому Пророк Мухаммад (мир ему) установил для бабушки 1/6 часть наследства, если нет матери."
-            remaining -= grandmother_share
-
-    # Children shares
-    num_sons = user_data.get('num_sons', 0)
-    num_daughters = user_data.get('num_daughters', 0)
-
-    if num_sons > 0 or num_daughters > 0:
-        # In Islamic law, a son gets twice the share of a daughter
-        total_parts = num_sons * 2 + num_daughters
-        explanations["О доле детей"] = "Согласно аяту 11 суры Ан-Ниса (Женщины): «Аллах заповедует вам относительно ваших детей: мужчине достается доля, равная доле двух женщин». Сыновья и дочери получают остаток наследства после распределения фиксированных долей другим наследникам, при этом доля сына вдвое больше доли дочери."
-
-        if total_parts > 0:
-            share_per_part = remaining / total_parts
-
-            if num_sons > 0:
-                son_share = share_per_part * 2
-                son_percentage = (son_share / net_inheritance) * 100 if net_inheritance > 0 else 0
-                
-                if num_sons > 1:
-                    amounts[f"Сыновья ({num_sons})"] = son_share * num_sons
-                    amounts[f"Каждому сыну"] = son_share
-                    fractions[f"Каждому сыну"] = f"{2}/{total_parts} остатка"
-                    percentages[f"Каждому сыну"] = son_percentage
-                else:
-                    amounts["Сын"] = son_share
-                    fractions["Сын"] = f"{2}/{total_parts} остатка"
-                    percentages["Сын"] = son_percentage
-
-            if num_daughters > 0:
-                daughter_share = share_per_part
-                daughter_percentage = (daughter_share / net_inheritance) * 100 if net_inheritance > 0 else 0
-                
-                if num_daughters > 1:
-                    amounts[f"Дочери ({num_daughters})"] = daughter_share * num_daughters
-                    amounts[f"Каждой дочери"] = daughter_share
-                    fractions[f"Каждой дочери"] = f"1/{total_parts} остатка"
-                    percentages[f"Каждой дочери"] = daughter_percentage
-                else:
-                    amounts["Дочь"] = daughter_share
-                    fractions["Дочь"] = f"1/{total_parts} остатка"
-                    percentages["Дочь"] = daughter_percentage
-
-            remaining = 0  # All remaining inheritance distributed
-
-    # Check if there are grandsons/granddaughters but they don't inherit
-    num_grandsons = user_data.get('num_grandsons', 0)
-    num_granddaughters = user_data.get('num_granddaughters', 0)
-    
-    # If there are grandsons/granddaughters but they don't inherit (because there are sons/daughters)
-    if (num_sons > 0 or num_daughters > 0) and (num_grandsons > 0 or num_granddaughters > 0):
-        if num_grandsons > 0:
-            if num_grandsons > 1:
-                explanations[f"Внуки ({num_grandsons})"] = "Не получают долю, так как есть сыновья/дочери покойного"
-            else:
-                explanations["Внук"] = "Не получает долю, так как есть сыновья/дочери покойного"
-        
-        if num_granddaughters > 0:
-            if num_granddaughters > 1:
-                explanations[f"Внучки ({num_granddaughters})"] = "Не получают долю, так как есть сыновья/дочери покойного"
-            else:
-                explanations["Внучка"] = "Не получает долю, так как есть сыновья/дочери покойного"
-    
-    # If no children, distribute to grandchildren
-    if num_sons == 0 and num_daughters == 0 and remaining > 0:
-        if num_grandsons > 0 or num_granddaughters > 0:
-            total_parts = num_grandsons * 2 + num_granddaughters
-            explanations["О доле внуков"] = "В отсутствие сыновей и дочерей, внуки и внучки занимают их место в наследовании. По принципу 'таазиб', действует то же правило, как и для детей: внук получает вдвое больше, чем внучка. Внуки наследуют остаток имущества после распределения фиксированных долей другим наследникам."
-
-            if total_parts > 0:
-                share_per_part = remaining / total_parts
-
-                if num_grandsons > 0:
-                    grandson_share = share_per_part * 2
-                    grandson_percentage = (grandson_share / net_inheritance) * 100 if net_inheritance > 0 else 0
-                    
-                    if num_grandsons > 1:
-                        amounts[f"Внуки ({num_grandsons})"] = grandson_share * num_grandsons
-                        amounts[f"Каждому внуку"] = grandson_share
-                        fractions[f"Каждому внуку"] = f"{2}/{total_parts} остатка"
-                        percentages[f"Каждому внуку"] = grandson_percentage
-                    else:
-                        amounts["Внук"] = grandson_share
-                        fractions["Внук"] = f"{2}/{total_parts} остатка"
-                        percentages["Внук"] = grandson_percentage
-
-                if num_granddaughters > 0:
-                    granddaughter_share = share_per_part
-                    granddaughter_percentage = (granddaughter_share / net_inheritance) * 100 if net_inheritance > 0 else 0
-                    
-                    if num_granddaughters > 1:
-                        amounts[f"Внучки ({num_granddaughters})"] = granddaughter_share * num_granddaughters
-                        amounts[f"Каждой внучке"] = granddaughter_share
-                        fractions[f"Каждой внучке"] = f"1/{total_parts} остатка"
-                        percentages[f"Каждой внучке"] = granddaughter_percentage
-                    else:
-                        amounts["Внучка"] = granddaughter_share
-                        fractions["Внучка"] = f"1/{total_parts} остатка"
-                        percentages["Внучка"] = granddaughter_percentage
-
-                remaining = 0  # All remaining inheritance distributed
-
-    # Check if there are sons, daughters, grandsons, or granddaughters that would block siblings and cousins inheritance
-    has_direct_descendants = (
-        user_data.get('num_sons', 0) > 0 or 
-        user_data.get('num_daughters', 0) > 0 or 
-        user_data.get('num_grandsons', 0) > 0 or 
-        user_data.get('num_granddaughters', 0) > 0
-    )
-    
-    # Get number of siblings
-    num_siblings_brothers = user_data.get('num_siblings_brothers', 0)
-    num_siblings_sisters = user_data.get('num_siblings_sisters', 0)
-    
-    # Get number of cousins
-    num_brothers = user_data.get('num_cousins_brothers', 0)
-    num_sisters = user_data.get('num_cousins_sisters', 0)
-    
-    # Check if there are siblings but they wouldn't inherit due to direct descendants
-    if has_direct_descendants and (num_siblings_brothers > 0 or num_siblings_sisters > 0):
-        if num_siblings_brothers > 0:
-            if num_siblings_brothers > 1:
-                explanations[f"Родные братья ({num_siblings_brothers})"] = "Не получают долю, так как есть прямые потомки (сыновья/дочери/внуки/внучки)"
-            else:
-                explanations["Родной брат"] = "Не получает долю, так как есть прямые потомки (сыновья/дочери/внуки/внучки)"
-        
-        if num_siblings_sisters > 0:
-            if num_siblings_sisters > 1:
-                explanations[f"Родные сестры ({num_siblings_sisters})"] = "Не получают долю, так как есть прямые потомки (сыновья/дочери/внуки/внучки)"
-            else:
-                explanations["Родная сестра"] = "Не получает долю, так как есть прямые потомки (сыновья/дочери/внуки/внучки)"
-    
-    # Check if there are cousins but they wouldn't inherit due to direct descendants
-    if has_direct_descendants and (num_brothers > 0 or num_sisters > 0):
-        if num_brothers > 0:
-            if num_brothers > 1:
-                explanations[f"Двоюродные братья ({num_brothers})"] = "Не получают долю, так как есть прямые потомки (сыновья/дочери/внуки/внучки)"
-            else:
-                explanations["Двоюродный брат"] = "Не получает долю, так как есть прямые потомки (сыновья/дочери/внуки/внучки)"
-        
-        if num_sisters > 0:
-            if num_sisters > 1:
-                explanations[f"Двоюродные сестры ({num_sisters})"] = "Не получают долю, так как есть прямые потомки (сыновья/дочери/внуки/внучки)"
-            else:
-                explanations["Двоюродная сестра"] = "Не получает долю, так как есть прямые потомки (сыновья/дочери/внуки/внучки)"
-    
-    # Особое правило для сестер: если нет братьев, сыновей и отца, сестра получает 1/2, две и более сестер - 2/3
-    special_sisters_rule = (
-        not has_direct_descendants and  # Нет сыновей, дочерей, внуков и внучек
-        num_siblings_brothers == 0 and  # Нет братьев
-        num_siblings_sisters > 0 and    # Есть сестры
-        not user_data.get('has_father', False)  # Нет отца
-    )
-    
-    # Сперва распределяем наследство родным братьям и сестрам, если они есть
-    if remaining > 0:
-        if num_siblings_brothers > 0 or num_siblings_sisters > 0:
-            # Применяем особое правило для сестер, если условия соответствуют
-            if special_sisters_rule:
-                explanations["О доле сестер"] = "Согласно аяту 176 суры Ан-Ниса (Женщины): «Если умрет мужчина, у которого нет ребенка, но есть сестра, то ей принадлежит половина того, что он оставил. И он наследует ей, если у нее нет ребенка. Если их две, то им принадлежат две трети того, что он оставил»."
-                
-                if num_siblings_sisters == 1:  # Одна сестра получает 1/2
-                    sister_share = net_inheritance * 0.5
-                    amounts["Родная сестра"] = sister_share
-                    fractions["Родная сестра"] = "1/2"
-                    percentages["Родная сестра"] = 50.0
-                    remaining -= sister_share
-                else:  # Две и более сестер делят 2/3
-                    total_share = net_inheritance * (2/3)
-                    each_sister_share = total_share / num_siblings_sisters
-                    amounts[f"Родные сестры ({num_siblings_sisters})"] = total_share
-                    amounts[f"Каждой родной сестре"] = each_sister_share
-                    fractions[f"Каждой родной сестре"] = f"2/3 ÷ {num_siblings_sisters}"
-                    percentages[f"Каждой родной сестре"] = (each_sister_share / net_inheritance) * 100 if net_inheritance > 0 else 0
-                    remaining -= total_share
-            else:
-                # Стандартный расчет: брат получает в два раза больше сестры
-                total_parts = num_siblings_brothers * 2 + num_siblings_sisters
-                explanations["О доле братьев и сестер"] = "Согласно аяту 176 суры Ан-Ниса (Женщины): «Если они являются братьями и сестрами, то мужчине принадлежит доля, равная доле двух женщин». Братья и сестры наследуют при отсутствии прямых потомков (сыновей и дочерей) умершего, при этом брат получает долю в два раза больше, чем сестра."
-    
-                if total_parts > 0:
-                    share_per_part = remaining / total_parts
-    
-                    if num_siblings_brothers > 0:
-                        brother_share = share_per_part * 2
-                        brother_percentage = (brother_share / net_inheritance) * 100 if net_inheritance > 0 else 0
-                        
-                        if num_siblings_brothers > 1:
-                            amounts[f"Родные братья ({num_siblings_brothers})"] = brother_share * num_siblings_brothers
-                            amounts[f"Каждому родному брату"] = brother_share
-                            fractions[f"Каждому родному брату"] = f"{2}/{total_parts} остатка"
-                            percentages[f"Каждому родному брату"] = brother_percentage
-                        else:
-                            amounts["Родной брат"] = brother_share
-                            fractions["Родной брат"] = f"{2}/{total_parts} остатка"
-                            percentages["Родной брат"] = brother_percentage
-    
-                    if num_siblings_sisters > 0:
-                        sister_share = share_per_part
-                        sister_percentage = (sister_share / net_inheritance) * 100 if net_inheritance > 0 else 0
-                        
-                        if num_siblings_sisters > 1:
-                            amounts[f"Родные сестры ({num_siblings_sisters})"] = sister_share * num_siblings_sisters
-                            amounts[f"Каждой родной сестре"] = sister_share
-                            fractions[f"Каждой родной сестре"] = f"1/{total_parts} остатка"
-                            percentages[f"Каждой родной сестре"] = sister_percentage
-                        else:
-                            amounts["Родная сестра"] = sister_share
-                            fractions["Родная сестра"] = f"1/{total_parts} остатка"
-                            percentages["Родная сестра"] = sister_percentage
-    
-                    remaining = 0  # All remaining inheritance distributed
-    
-    # Если после распределения родным братьям и сестрам остались средства, распределяем двоюродным
-    if remaining > 0:
-        if num_brothers > 0 or num_sisters > 0:
-            total_parts = num_brothers * 2 + num_sisters
-
-            if total_parts > 0:
-                share_per_part = remaining / total_parts
-
-                if num_brothers > 0:
-                    brother_share = share_per_part * 2
-                    brother_percentage = (brother_share / net_inheritance) * 100 if net_inheritance > 0 else 0
-                    
-                    if num_brothers > 1:
-                        amounts[f"Двоюродные братья ({num_brothers})"] = brother_share * num_brothers
-                        amounts[f"Каждому двоюродному брату"] = brother_share
-                        fractions[f"Каждому двоюродному брату"] = f"{2}/{total_parts} остатка"
-                        percentages[f"Каждому двоюродному брату"] = brother_percentage
-                    else:
-                        amounts["Двоюродный брат"] = brother_share
-                        fractions["Двоюродный брат"] = f"{2}/{total_parts} остатка"
-                        percentages["Двоюродный брат"] = brother_percentage
-
-                if num_sisters > 0:
-                    sister_share = share_per_part
-                    sister_percentage = (sister_share / net_inheritance) * 100 if net_inheritance > 0 else 0
-                    
-                    if num_sisters > 1:
-                        amounts[f"Двоюродные сестры ({num_sisters})"] = sister_share * num_sisters
-                        amounts[f"Каждой двоюродной сестре"] = sister_share
-                        fractions[f"Каждой двоюродной сестре"] = f"1/{total_parts} остатка"
-                        percentages[f"Каждой двоюродной сестре"] = sister_percentage
-                    else:
-                        amounts["Двоюродная сестра"] = sister_share
-                        fractions["Двоюродная сестра"] = f"1/{total_parts} остатка"
-                        percentages["Двоюродная сестра"] = sister_percentage
-
-                remaining = 0  # All remaining inheritance distributed
-    
-    # Если есть двоюродные братья/сестры, но родные братья/сестры уже получили наследство
-    if num_siblings_brothers > 0 or num_siblings_sisters > 0:
-        if num_brothers > 0:
-            if num_brothers > 1:
-                explanations[f"Двоюродные братья ({num_brothers})"] = "Не получают долю, так как есть родные братья/сестры"
-            else:
-                explanations["Двоюродный брат"] = "Не получает долю, так как есть родные братья/сестры"
-        
-        if num_sisters > 0:
-            if num_sisters > 1:
-                explanations[f"Двоюродные сестры ({num_sisters})"] = "Не получают долю, так как есть родные братья/сестры"
-            else:
-                explanations["Двоюродная сестра"] = "Не получает долю, так как есть родные братья/сестры"
-
-    # Возвращаем словарь с разными типами представления долей
-    return {
-        'amounts': amounts,  # Денежные суммы
-        'fractions': fractions,  # Дроби по исламскому праву
-        'percentages': percentages,  # Проценты
-        'explanations': explanations  # Объяснения для наследников без доли
-    }
-
-
-# Функция для получения эмодзи в зависимости от типа наследника
-def get_emoji_for_heir(heir_name):
-    if "завещание" in heir_name.lower() or "васия" in heir_name.lower():
-        return "📜"
-    elif "муж" in heir_name.lower():
-        return "👨‍❤️‍👨"
-    elif "жена" in heir_name.lower():
-        return "👩‍❤️‍👨"
-    elif "сын" in heir_name.lower():
-        return "👦"
-    elif "дочь" in heir_name.lower() or "дочер" in heir_name.lower():
-        return "👧"
-    elif "отец" in heir_name.lower():
-        return "👨‍🦳"
-    elif "мать" in heir_name.lower() or "матер" in heir_name.lower():
-        return "👩‍🦳"
-    elif "дедушк" in heir_name.lower():
-        return "👴"
-    elif "бабушк" in heir_name.lower():
-        return "👵"
-    elif "двоюродный брат" in heir_name.lower() or "двоюродные братья" in heir_name.lower():
-        return "👬"
-    elif "двоюродная сестра" in heir_name.lower() or "двоюродные сестры" in heir_name.lower():
-        return "👭"
-    elif "брат" in heir_name.lower():
-        return "👬"
-    elif "сестр" in heir_name.lower():
-        return "👭"
-    elif "внук" in heir_name.lower() and not "внучк" in heir_name.lower():
-        return "👦"
-    elif "внучк" in heir_name.lower():
-        return "👧"
-    else:
-        return "👤"
-
-
-def format_inheritance_response(user_data, shares_data):
-    """Format the inheritance calculation results for display."""
-    total_inheritance = float(user_data.get('total_inheritance', 0))
-    debts = float(user_data.get('debts', 0))
-    has_will = user_data.get('has_will', False)
-    will_amount = float(user_data.get('will_amount', 0)) if has_will else 0
-    net_inheritance = total_inheritance - debts
-
-    # Проверяем структуру данных
-    if isinstance(shares_data, dict) and 'amounts' in shares_data:
-        # Новый формат данных
-        amounts = shares_data.get('amounts', {})
-        fractions = shares_data.get('fractions', {})
-        percentages = shares_data.get('percentages', {})
-        explanations = shares_data.get('explanations', {})
-    else:
-        # Старый формат данных (обратная совместимость)
-        amounts = shares_data
-        fractions = {}
-        percentages = {}
-        explanations = {}
-
-    response = "📋 *РЕЗУЛЬТАТЫ РАСЧЕТА НАСЛЕДСТВА*\n\n"
-    response += f"💰 *Общая сумма наследства:* {total_inheritance:.2f} ₽\n"
-    response += f"💸 *Долги:* {debts:.2f} ₽\n"
-    
-    if has_will and will_amount > 0:
-        response += f"📜 *Сумма по завещанию:* {will_amount:.2f} ₽ (≤1/3 от наследства)\n"
-    
-    response += f"🏦 *Чистая сумма для распределения:* {net_inheritance:.2f} ₽\n\n"
-    response += "*Распределение наследства:*\n\n"
-
-    if not amounts:
-        response += "❌ Не удалось рассчитать доли наследства.\n"
-    else:
-        # Сортируем наследников для лучшего представления
-        for heir in sorted(amounts.keys()):
-            amount = amounts[heir]
-            # Обрабатываем значение, чтобы убедиться, что это число
-            try:
-                if isinstance(amount, (int, float)):
-                    amount_value = amount
-                else:
-                    amount_value = float(amount)
-                
-                # Получаем эмодзи для наследника
-                heir_emoji = get_emoji_for_heir(heir)
-                
-                # Начинаем раздел для каждого наследника с эмодзи
-                response += f"{heir_emoji} *{heir}:*\n"
-                
-                # Добавляем информацию о сумме
-                response += f"• 💰 Сумма: {amount_value:.2f} ₽\n"
-                
-                # Добавляем процентное соотношение
-                if heir in percentages:
-                    response += f"• 📊 Процент: {percentages[heir]:.2f}%\n"
-                else:
-                    # Вычисляем процент, если он не предоставлен
-                    percentage = (amount_value / net_inheritance) * 100 if net_inheritance > 0 else 0
-                    response += f"• 📊 Процент: {percentage:.2f}%\n"
-                
-                # Добавляем исламскую долю
-                if heir in fractions:
-                    response += f"• ⚖️ Исламская доля: {fractions[heir]}\n"
-                else:
-                    response += f"• ⚖️ Исламская доля: Расчетная доля\n"
-                
-                response += "\n"
-            except (ValueError, TypeError):
-                # Получаем эмодзи для наследника и добавляем сообщение об ошибке
-                heir_emoji = get_emoji_for_heir(heir)
-                response += f"{heir_emoji} *{heir}:* {amount}\n\n"
-
-    # Добавляем информацию о наследниках, которые не получают доли
-    if explanations:
-        response += "*Наследники без доли:*\n\n"
-        for heir, explanation in sorted(explanations.items()):
-            heir_emoji = get_emoji_for_heir(heir)
-            response += f"{heir_emoji} *{heir}:* {explanation}\n\n"
-
-    response += "✅ Расчет выполнен согласно исламским законам наследования.\n"
-    response += "ℹ️ Для нового расчета используйте команду /start\n"
-    response += "💰 Чтобы поддержать проект: используйте кнопку \"Донат\"\n"
-    response += "💬 Для отзывов и предложений: используйте кнопку \"Отзывы и предложения\""
+        user_data, warnings = parse_scenario(query.query)
+    except ScenarioError as e:
+        # The user is probably still typing; the errors show up as the description
+        await query.answer([InlineQueryResultArticle(
+            'errors', 'Ошибки в описании',
+            InputTextMessageContent(CALC_USAGE),
+            description='; '.join(f'{field}: {message}' for field, message in e.errors))],
+            cache_time=INLINE_CACHE_TIME, button=INLINE_HELP_BUTTON)
+        return
 
-    return response
+    response = await calculation_response(user_data, context.bot_data.get('detailed', True))
+    await query.answer([InlineQueryResultArticle(
+        'result', f"📋 Расчет наследства: {user_data['total_inheritance']:.2f} ₽",
+        InputTextMessageContent('\n\n'.join(warnings + [response]), parse_mode='Markdown'),
+        description=' '.join(warnings) or 'Отправить расчет в чат')],
+        cache_time=INLINE_CACHE_TIME)
 
 
-def cancel(update: Update, context: CallbackContext) -> int:
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancel and end the conversation."""
     # Создаем клавиатуру с кнопками
     keyboard = [
@@ -974,16 +523,26 @@ def cancel(update: Update, context: CallbackContext) -> int:
     ]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
     
-    update.message.reply_text(
+    await update.message.reply_text(
         'Расчет отменен. Чтобы начать снова, используйте кнопку "Начать расчет" или команду /start',
         reply_markup=reply_markup)
     return ConversationHandler.END
 
 
-def error_handler(update, context):
+async def error_handler(update, context):
     """Log errors caused by updates."""
     error_message = str(context.error)
-    logger.warning(f'Update "{update}" caused error "{error_message}"')
+    error_type = type(context.error).__name__
+    ERRORS.labels(error_type).inc()
+    timed_out = "Timed out" in error_message or isinstance(context.error, TimedOut)
+    network_error = error_type == 'NetworkError'
+    # Поля обновления и состояние разговора извлекаются в потоке журнала, а не здесь
+    extra = {'update': update, 'error': error_type,
+             'state': functools.partial(conversation_state, context.application, update)}
+    if timed_out or network_error or isinstance(context.error, RetryAfter):
+        # Пока Telegram недоступен или ограничивает бота, такие ошибки идут сериями: в журнал попадает выборка
+        extra['sample_key'] = error_type
+    logger.warning('Update caused error "%s"', error_message, extra=extra)
     
     # Игнорируем ошибку конфликта при запуске нескольких экземпляров бота
     if "Conflict: terminated by other getUpdates request" in error_message:
@@ -992,13 +551,21 @@ def error_handler(update, context):
         return
     
     # Обрабатываем ошибку тайм-аута
-    if "Timed out" in error_message or (hasattr(context.error, '__class__') and context.error.__class__.__name__ == 'TimedOut'):
-        logger.info("Произошёл тайм-аут при подключении к Telegram API. Подождите, бот автоматически попробует переподключиться.")
+    if timed_out:
+        logger.info("Произошёл тайм-аут при подключении к Telegram API. Подождите, бот автоматически попробует переподключиться.",
+                    extra={'sample_key': 'timed_out_hint'})
         return
         
+    # Лимит Telegram не отпустил и после повторов: сообщение об ошибке тоже не дойдет
+    if isinstance(context.error, RetryAfter):
+        logger.warning("Превышен лимит сообщений Telegram, следующая попытка через %s с", context.error.retry_after,
+                       extra={'sample_key': 'retry_after_hint'})
+        return
+
     # Обрабатываем другие сетевые ошибки
-    if (hasattr(context.error, '__class__') and context.error.__class__.__name__ == 'NetworkError'):
-        logger.info("Произошла сетевая ошибка. Бот автоматически попробует переподключиться.")
+    if network_error:
+        logger.info("Произошла сетевая ошибка. Бот автоматически попробует переподключиться.",
+                    extra={'sample_key': 'network_error_hint'})
         return
         
     # Обрабатываем ошибку аутентификации
@@ -1009,13 +576,13 @@ def error_handler(update, context):
     # Оба дополнительных условия нужны для защиты от возможных ошибок
     try:
         if update and hasattr(update, 'message') and update.message:
-            update.message.reply_text(
+            await update.message.reply_text(
                 'Произошла ошибка. Пожалуйста, начните снова с команды /start')
     except Exception as e:
-        logger.error(f"Ошибка в обработчике ошибок: {e}")
+        logger.error("Ошибка в обработчике ошибок: %s", e)
 
 
-def help_command(update: Update, context: CallbackContext):
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /help is issued."""
     # Создаем клавиатуру с кнопками
     keyboard = [
@@ -1024,7 +591,7 @@ def help_command(update: Update, context: CallbackContext):
     ]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
     
-    update.message.reply_text(
+    await update.message.reply_text(
         '📊 *Калькулятор наследства PRO* 📊\n\n'
         'Этот бот помогает рассчитать доли наследства по исламским законам наследования (фараиз).\n\n'
         '*Возможности PRO-версии:*\n'
@@ -1036,15 +603,16 @@ def help_command(update: Update, context: CallbackContext):
         '• Учет различий в вере между наследниками\n'
         '• Особые правила для сестер при отсутствии братьев и сыновей\n\n'
         'Для начала расчета нажмите кнопку "Начать расчет" или используйте команду /start.\n'
+        'Если состав семьи уже известен, можно описать его одним сообщением: /calc 1000000 wife sons=2 daughters=1\n'
         'Вам нужно будет ответить на серию вопросов о наследодателе и его семье.',
         parse_mode='Markdown',
         reply_markup=reply_markup
     )
 
 
-def donate_command(update: Update, context: CallbackContext):
+async def donate_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send donation information when the donate button is pressed."""
-    update.message.reply_text(
+    await update.message.reply_text(
         '💰 *Поддержать проект*\n\n'
         'Если вам понравился наш бот, вы можете поддержать его развитие:\n\n'
         '*Реквизиты для доната:*\n'
@@ -1054,9 +622,9 @@ def donate_command(update: Update, context: CallbackContext):
     )
 
 
-def feedback_command(update: Update, context: CallbackContext):
+async def feedback_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send feedback information when the feedback button is pressed."""
-    update.message.reply_text(
+    await update.message.reply_text(
         '💬 *Отзывы и предложения*\n\n'
         'Мы будем рады услышать ваши отзывы и предложения по улучшению бота!\n\n'
         'Пожалуйста, напишите ваш отзыв в ответном сообщении, и мы постараемся учесть его при дальнейшей разработке.',
@@ -1064,127 +632,314 @@ def feedback_command(update: Update, context: CallbackContext):
     )
 
 
-def main():
-    """Start the bot."""
-    # Get the token from environment variables
-    TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
-    
-    # Check if token exists
-    if not TOKEN:
-        logger.error("Отсутствует TELEGRAM_BOT_TOKEN. Убедитесь, что переменная окружения установлена.")
-        return
-        
-    # Create the Updater and pass it your bot's token
-    updater = Updater(TOKEN)
+async def track_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Note the activity of the user before the other handlers run."""
+    key = session_key(update)
+    if key is not None:
+        await end_sessions(context.application, SESSIONS.touch(key))
+
+
+def session_key(update: object) -> Optional[Tuple[int, int]]:
+    """The chat and the user of the update, the key of its conversation (per_chat and per_user)."""
+    if not isinstance(update, Update) or not update.effective_chat or not update.effective_user:
+        return None
+    return update.effective_chat.id, update.effective_user.id
+
+
+def conversation_step(callback: Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable],
+                      entry_point: bool = False):
+    """The callback of the conversation with the state it returns noted in SESSIONS.
+
+    A session that was ended while the user was away is still in a conversation
+    for the handler: its next update gets SESSION_EXPIRED and END, so the
+    handler forgets the conversation itself.
+    """
+
+    @functools.wraps(callback)
+    async def step(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        key = session_key(update)
+        if not entry_point and SESSIONS.state(key) is None:
+            if update.callback_query:
+                await update.callback_query.answer()
+            await update.effective_message.reply_text(SESSION_EXPIRED)
+            return ConversationHandler.END
+        state = await callback(update, context)
+        if state is not None:
+            SESSIONS.set_state(key, None if state == ConversationHandler.END else state)
+        return state
+
+    return step
 
-    # Get the dispatcher to register handlers
-    dispatcher = updater.dispatcher
+
+async def end_sessions(application: Application, keys: Iterable[Tuple[int, int]]):
+    """Drop the answers of the sessions and their saved conversations."""
+    for key in keys:
+        application.drop_user_data(key[1])
+        if application.persistence is not None:
+            # Only the changes of the conversations are saved, so the handler does not write it back
+            await application.persistence.update_conversation(CONVERSATION_NAME, key, None)
+
+
+def conversation_state(application: Application, update: object) -> Optional[object]:
+    """The state of the conversation the update belongs to, None outside of one."""
+    # Called by the log listener thread: a single get() does not race the event loop
+    return SESSIONS.state(session_key(update))
+
+
+def session_bytes(application: Application, key: Tuple[int, int]) -> int:
+    user_data = application.user_data.get(key[1])
+    return approximate_size(user_data) if user_data is not None else 0
+
+
+async def clean_sessions(application: Application):
+    """End the idle sessions every SESSION_CLEANUP_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(SESSION_CLEANUP_INTERVAL)
+        expired = SESSIONS.expire()
+        if expired:
+            await end_sessions(application, expired)
+            stats = SESSIONS.stats(lambda key: session_bytes(application, key))
+            logger.info("Завершено неактивных сессий: %d; в памяти %d сессий, ~%d КБ",
+                        len(expired), stats.sessions, stats.bytes // 1024)
+
+
+def add_handlers(application: Application):
+    """Register the conversation, command and button handlers."""
+    # Track the sessions before the other handlers see the update
+    application.add_handler(TypeHandler(Update, track_session), group=-1)
 
     # Add conversation handler
+    states = {
+        TOTAL_INHERITANCE: [
+            MessageHandler(filters.TEXT & ~filters.COMMAND,
+                           conversation_step(timed(handle_total_inheritance)))
+        ],
+        DEBTS:
+        [MessageHandler(filters.TEXT & ~filters.COMMAND, conversation_step(timed(handle_debts)))],
+        WILL_AMOUNT: [
+            MessageHandler(filters.TEXT & ~filters.COMMAND,
+                           conversation_step(timed(handle_will_amount)))
+        ],
+    }
+    # The other questions take a typed answer or a button press
+    for state in QUESTIONS:
+        if state not in states:
+            handle_answer = conversation_step(timed(answer_handler(state)))
+            states[state] = [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_answer),
+                CallbackQueryHandler(handle_answer, pattern=f'^answer:{state}:'),
+            ]
+
+    timed_start = conversation_step(timed(start), entry_point=True)
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('start', start)],
-        states={
-            TOTAL_INHERITANCE: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_total_inheritance)
-            ],
-            DEBTS:
-            [MessageHandler(Filters.text & ~Filters.command, handle_debts)],
-            HAS_WILL: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_has_will)
-            ],
-            WILL_AMOUNT: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_will_amount)
-            ],
-            IS_MURDERER: [
-                MessageHandler(Filters.text & ~Filters.command,
-                              handle_is_murderer)
-            ],
-            IS_DIFFERENT_FAITH: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_is_different_faith)
-            ],
-            HAS_SPOUSE: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_has_spouse)
-            ],
-            HAS_WIFE:
-            [MessageHandler(Filters.text & ~Filters.command, handle_has_wife)],
-            NUM_DAUGHTERS: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_num_daughters)
-            ],
-            NUM_SONS:
-            [MessageHandler(Filters.text & ~Filters.command, handle_num_sons)],
-            NUM_GRANDDAUGHTERS: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_num_granddaughters)
-            ],
-            NUM_GRANDSONS: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_num_grandsons)
-            ],
-            HAS_FATHER: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_has_father)
-            ],
-            HAS_MOTHER: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_has_mother)
-            ],
-            HAS_GRANDFATHER: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_has_grandfather)
-            ],
-            HAS_GRANDMOTHER: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_has_grandmother)
-            ],
-            NUM_SIBLINGS_SISTERS: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_num_siblings_sisters)
-            ],
-            NUM_SIBLINGS_BROTHERS: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_num_siblings_brothers)
-            ],
-            NUM_COUSINS_SISTERS: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_num_cousins_sisters)
-            ],
-            NUM_COUSINS_BROTHERS: [
-                MessageHandler(Filters.text & ~Filters.command,
-                               handle_num_cousins_brothers)
-            ],
-        },
-        fallbacks=[CommandHandler('cancel', cancel)],
+        entry_points=[CommandHandler('start', timed_start), CallbackQueryHandler(timed_start, pattern='^start$')],
+        states=states,
+        fallbacks=[CommandHandler('cancel', conversation_step(cancel)),
+                   CallbackQueryHandler(conversation_step(stale_answer), pattern='^answer:')],
         allow_reentry=True,
+        # The sessions are keyed like the conversations, see session_key()
+        per_chat=True,
+        per_user=True,
+        name=CONVERSATION_NAME,
+        persistent=application.persistence is not None,
     )
 
-    dispatcher.add_handler(conv_handler)
-    dispatcher.add_handler(CommandHandler("help", help_command))
+    application.add_handler(conv_handler)
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("calc", timed(calc_command)))
+    application.add_handler(InlineQueryHandler(timed(inline_query)))
     
     # Add handlers for the buttons
-    dispatcher.add_handler(MessageHandler(Filters.regex('^🧮 Начать расчет$'), start))
-    dispatcher.add_handler(MessageHandler(Filters.regex('^💰 Донат$'), donate_command))
-    dispatcher.add_handler(MessageHandler(Filters.regex('^💬 Отзывы и предложения$'), feedback_command))
+    application.add_handler(MessageHandler(filters.Regex('^🧮 Начать расчет$'), start))
+    application.add_handler(MessageHandler(filters.Regex('^💰 Донат$'), donate_command))
+    application.add_handler(MessageHandler(filters.Regex('^💬 Отзывы и предложения$'), feedback_command))
+    application.add_handler(CallbackQueryHandler(stale_answer, pattern='^answer:'))
 
     # Register error handler
-    dispatcher.add_error_handler(error_handler)
+    application.add_error_handler(error_handler)
+
+
+class ChatUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates of different chats concurrently and updates of one chat in order.
+
+    The conversation state of a chat changes only after its handler returns, so
+    the next message of the same user has to wait for the previous one.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chats: Dict[int, Tuple[asyncio.Lock, int]] = {}  # chat id -> (lock, updates using it)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable):
+        if PROFILER is not None:
+            coroutine = PROFILER.wrap(coroutine)
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await coroutine
+            return
+        lock, users = self._chats.get(chat.id, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._chats[chat.id] = (lock, users + 1)
+        try:
+            async with lock:
+                await coroutine
+        finally:
+            users = self._chats[chat.id][1] - 1
+            if users:
+                self._chats[chat.id] = (lock, users)
+            else:
+                del self._chats[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+def build_application(token: str, detailed: bool = True, api_url: Optional[str] = None,
+                      persistence_path: Optional[str] = None) -> Application:
+    """Application with the handlers.
+
+    ``api_url`` points it to another Bot API server, ``persistence_path`` keeps
+    the conversations, answers and unsent replies in this SQLite file across
+    restarts.
+    """
+    global OUTBOX, PROFILER
+    builder = (Application.builder().token(token)
+               .concurrent_updates(ChatUpdateProcessor(CONCURRENT_UPDATES))
+               .request(TimedRequest(connection_pool_size=CONNECTION_POOL_SIZE, pool_timeout=30)))
+    if api_url:
+        builder = builder.base_url(f"{api_url.rstrip('/')}/bot").base_file_url(f"{api_url.rstrip('/')}/file/bot")
+    if RATE_LIMIT > 0:
+        builder = builder.rate_limiter(TokenBucketRateLimiter(RATE_LIMIT, CHAT_RATE_LIMIT, CHAT_BURST))
+    if persistence_path:
+        # Only the answers and the conversation states: bot_data holds the settings of this instance
+        builder = builder.persistence(SQLitePersistence(
+            persistence_path, PersistenceInput(bot_data=False, chat_data=False), PERSISTENCE_INTERVAL))
+    # Without a file the outbox still retries the replies until the bot stops
+    OUTBOX = Outbox(persistence_path or ':memory:', max_attempts=OUTBOX_MAX_ATTEMPTS)
+    if PROFILE_RATE > 0:
+        PROFILER = UpdateProfiler(PROFILE_RATE, PROFILE_DIR, PROFILE_INTERVAL, PROFILE_KEEP, PROFILE_TRACEMALLOC_FRAMES)
+        logger.info("Профилирование %.1f%% обновлений, профили в %s", PROFILE_RATE * 100, PROFILE_DIR)
+    application = builder.post_init(start_background).post_stop(stop_background).build()
+    application.bot_data['detailed'] = detailed
+    add_handlers(application)
+    return application
+
+
+async def start_background(application: Application):
+    """Start the calculation processes, the cleanup of idle sessions, the retries of the outbox and the metrics."""
+    global CALCULATION_EXECUTOR, CLEANUP_TASK, DELIVERY_TASK, METRICS_SERVER
+    if CALCULATION_PROCESSES > 0:
+        CALCULATION_EXECUTOR = ProcessPoolExecutor(CALCULATION_PROCESSES)
+    # Conversations restored from the persistence start their timeout anew
+    conversations = {}
+    if application.persistence is not None:
+        conversations = await application.persistence.get_conversations(CONVERSATION_NAME)
+    for user_id in application.user_data:
+        await end_sessions(application, SESSIONS.touch((user_id, user_id)))
+    for key, state in conversations.items():
+        if key[1] in application.user_data:
+            await end_sessions(application, SESSIONS.touch(key))
+            SESSIONS.set_state(key, state)
+        else:
+            # Ended while its last step was still to be saved; without the answers
+            # it cannot go on, and its next update ends it in the handler too
+            await application.persistence.update_conversation(CONVERSATION_NAME, key, None)
+    CLEANUP_TASK = asyncio.create_task(clean_sessions(application))
+    if OUTBOX is not None:
+        DELIVERY_TASK = asyncio.create_task(OUTBOX.run(application.bot))
+    if METRICS_PORT:
+        METRICS_SERVER = await serve_metrics(METRICS, METRICS_PORT, METRICS_ADDRESS)
+        logger.info("Метрики: http://%s:%d/metrics", METRICS_ADDRESS, METRICS_PORT)
+
+
+async def stop_background(application: Application):
+    global CALCULATION_EXECUTOR, CLEANUP_TASK, DELIVERY_TASK, METRICS_SERVER
+    if PROFILER is not None:
+        PROFILER.write()
+    if METRICS_SERVER is not None:
+        METRICS_SERVER.close()
+        await METRICS_SERVER.wait_closed()
+        METRICS_SERVER = None
+    if CLEANUP_TASK is not None:
+        CLEANUP_TASK.cancel()
+        CLEANUP_TASK = None
+    if DELIVERY_TASK is not None:
+        DELIVERY_TASK.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await DELIVERY_TASK
+        DELIVERY_TASK = None
+        # What is still pending stays in the file for the next start
+        stats = await OUTBOX.stats()
+        logger.info("Очередь ответов: доставлено %d, повторов %d, не доставлено %d, ждут повтора %d",
+                    stats.delivered, stats.retried, stats.dropped, stats.pending)
+        OUTBOX.close()
+    if CALCULATION_EXECUTOR is not None:
+        CALCULATION_EXECUTOR.shutdown()
+        CALCULATION_EXECUTOR = None
+
+
+def run_webhook(application: Application):
+    """Receive updates with the built-in HTTP server instead of polling.
+
+    The server checks the secret token, puts the update into the update queue
+    and answers Telegram right away; the handlers process it afterwards.
+    """
+    secret_token = WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+    url_path = WEBHOOK_PATH.strip('/')
+    logger.info("Webhook: %s:%d/%s", WEBHOOK_LISTEN, WEBHOOK_PORT, url_path)
+    application.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=url_path,
+        webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{url_path}",
+        secret_token=secret_token,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        drop_pending_updates=not PERSISTENCE_PATH)
+
+
+def main(detailed: bool = True):
+    """Start the bot."""
+    configure_logging(LOG_LEVEL, LOG_FORMAT != "text", LOG_SAMPLE_INTERVAL)
+    # httpx пишет строку на каждый запрос к Bot API; их время видно в метриках
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    # Get the token from environment variables
+    TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
+    
+    # Check if token exists
+    if not TOKEN:
+        logger.error("Отсутствует TELEGRAM_BOT_TOKEN. Убедитесь, что переменная окружения установлена.")
+        return
+
+    # TELEGRAM_API_URL: другой сервер Bot API, например локальный для тестов
+    application = build_application(TOKEN, detailed, os.environ.get("TELEGRAM_API_URL"), PERSISTENCE_PATH)
 
     # Start the Bot with improved configuration to handle network issues
-    # - drop_pending_updates=True: избегаем конфликтов при перезапуске
+    # - drop_pending_updates: без сохранения разговоров сообщения, пришедшие во время перезапуска,
+    #   отбрасываются; с сохранением они продолжают восстановленные разговоры
     # - timeout=30: увеличенный таймаут для сетевых операций
-    
-    # Запуск бота с базовыми параметрами, которые поддерживаются в текущей версии
-    updater.start_polling(drop_pending_updates=True, timeout=30)
-    
     logger.info("Бот успешно запущен!")
 
     # Run the bot until you press Ctrl-C
-    updater.idle()
+    if WEBHOOK_URL:
+        run_webhook(application)
+    else:
+        application.run_polling(drop_pending_updates=not PERSISTENCE_PATH, timeout=30)
+
+    stats = RESPONSE_CACHE.stats()
+    logger.info("Кэш ответов: %d/%d записей, попаданий %d, промахов %d (%.1f%% попаданий), истекло %d, "
+                "вытеснено %d", stats.size, stats.maxsize, stats.hits, stats.misses, stats.hit_ratio * 100,
+                stats.expirations, stats.evictions)
+    if application.bot.rate_limiter is not None:
+        stats = application.bot.rate_limiter.stats()
+        logger.info("Отправка: запросов %d, ждали лимита %d, повторов после 429 %d",
+                    stats.requests, stats.throttled, stats.retries)
+    stats = SESSIONS.stats()
+    logger.info("Сессии: %d/%d, завершено по времени %d, вытеснено %d",
+                stats.sessions, stats.max_sessions, stats.expired, stats.evicted)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,39 @@
+"""Islamic inheritance (faraid) calculation engine used by the Telegram bots.
+
+Importing this package does not require python-telegram-bot.
+"""
+from inheritance.engine import (
+    Composition,
+    Estate,
+    Heir,
+    HeirShare,
+    InheritanceShares,
+    ShareStructure,
+    calculate,
+    calculate_inheritance,
+    share_structure,
+)
+from inheritance.formatting import (
+    InheritanceResult,
+    format_inheritance_response,
+    get_emoji_for_heir,
+    render_response,
+    result_dicts,
+)
+
+__all__ = [
+    'Composition',
+    'Estate',
+    'Heir',
+    'HeirShare',
+    'InheritanceResult',
+    'InheritanceShares',
+    'ShareStructure',
+    'calculate',
+    'calculate_inheritance',
+    'share_structure',
+    'format_inheritance_response',
+    'get_emoji_for_heir',
+    'render_response',
+    'result_dicts',
+]
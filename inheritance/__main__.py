@@ -0,0 +1,3 @@
+from inheritance.cli import main
+
+main()
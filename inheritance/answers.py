@@ -0,0 +1,173 @@
+"""Parsing and validation of the answers the bot asks for.
+
+The step-by-step conversation and the one-message ``/calc`` command check the
+answers with the same functions, so both reject the same input with the same
+errors. A scenario for ``/calc`` is a number of tokens::
+
+    1000000 wife sons=2 daughters=1 mother
+    total=500000 debts=100000 will=50000 wife=1 daughters=2 mother=1
+
+Leading bare numbers are the total, the debts and the will amount; bare words
+set a flag, ``key=value`` sets any field. The keys are the ``user_data`` names
+or the short names from ``ALIASES``.
+"""
+import math
+from dataclasses import asdict
+from decimal import InvalidOperation
+from typing import Dict, List, Mapping, Tuple
+
+from inheritance.engine import ESTATE_FIELDS, Estate
+from inheritance.money import to_kopecks
+
+FLAG_ERROR = "Пожалуйста, введите 1 для 'да' или 0 для 'нет'"
+
+
+def parse_amount(text: str) -> float:
+    amount = float(text.replace(',', '.'))
+    # float() accepts 'inf' and 'nan', the calculation does not
+    if not math.isfinite(amount):
+        raise ValueError("Сумма должна быть числом")
+    try:
+        to_kopecks(amount)
+    except InvalidOperation:
+        raise ValueError("Сумма слишком велика") from None
+    return amount
+
+
+def parse_total(text: str) -> float:
+    total = parse_amount(text)
+    if total <= 0:
+        raise ValueError("Сумма наследства должна быть положительной")
+    return total
+
+
+def parse_debts(text: str) -> float:
+    debts = parse_amount(text)
+    if debts < 0:
+        raise ValueError("Сумма долгов не может быть отрицательной")
+    return debts
+
+
+def parse_will_amount(text: str) -> float:
+    will_amount = parse_amount(text)
+    if will_amount < 0:
+        raise ValueError("Сумма в завещании не может быть отрицательной")
+    return will_amount
+
+
+def max_will_amount(user_data: Mapping) -> float:
+    """At most a third of the inheritance left after the debts can be bequeathed."""
+    total_inheritance = float(user_data.get('total_inheritance', 0))
+    debts = float(user_data.get('debts', 0))
+    if not (math.isfinite(total_inheritance) and math.isfinite(debts)):
+        raise ValueError("Сумма наследства и долгов должна быть числом")
+    return max(0, total_inheritance - debts) / 3
+
+
+def will_warning(max_amount: float) -> str:
+    return (f'Предупреждение: По исламскому праву нельзя завещать более 1/3 от общего наследства. '
+            f'Максимальная сумма завещания: {max_amount:.2f}. '
+            f'Сумма будет ограничена до {max_amount:.2f}.')
+
+
+def parse_flag(text: str) -> bool:
+    text = text.strip()
+    if text not in ("0", "1"):
+        raise ValueError(FLAG_ERROR)
+    return bool(int(text))
+
+
+def parse_count(text: str) -> int:
+    num = int(text.strip())
+    if num < 0:
+        raise ValueError("Число не может быть отрицательным")
+    return num
+
+
+PARSERS = {
+    'total_inheritance': parse_total,
+    'debts': parse_debts,
+    'has_will': parse_flag,
+    'will_amount': parse_will_amount,
+}
+PARSERS.update((name, parse_flag) for name in ESTATE_FIELDS
+               if name.startswith(('has_', 'is_')) and name not in PARSERS)
+PARSERS.update((name, parse_count) for name in ESTATE_FIELDS if name.startswith('num_'))
+
+# Short names of the fields in a scenario
+ALIASES = {
+    'total': 'total_inheritance',
+    'will': 'will_amount',
+    'murderer': 'is_murderer',
+    'faith': 'is_different_faith',
+    'husband': 'has_spouse',
+    'wife': 'has_wife',
+    'daughters': 'num_daughters',
+    'sons': 'num_sons',
+    'granddaughters': 'num_granddaughters',
+    'grandsons': 'num_grandsons',
+    'father': 'has_father',
+    'mother': 'has_mother',
+    'grandfather': 'has_grandfather',
+    'grandmother': 'has_grandmother',
+    'sisters': 'num_siblings_sisters',
+    'brothers': 'num_siblings_brothers',
+    'cousin_sisters': 'num_cousins_sisters',
+    'cousin_brothers': 'num_cousins_brothers',
+}
+ALIASES.update((name, name) for name in ESTATE_FIELDS)
+POSITIONAL = ('total_inheritance', 'debts', 'will_amount')
+
+
+class ScenarioError(ValueError):
+    """Errors in a scenario, one ``(field, message)`` pair per invalid token."""
+
+    def __init__(self, errors: List[Tuple[str, str]]):
+        super().__init__('; '.join(f'{field}: {message}' for field, message in errors))
+        self.errors = errors
+
+
+def parse_scenario(text: str) -> Tuple[Dict, List[str]]:
+    """Parse a scenario into complete ``user_data`` and the warnings about it.
+
+    Raises ScenarioError with all the invalid fields at once.
+    """
+    values = {}
+    errors = []
+    invalid = set()
+    positional = iter(POSITIONAL)
+    for token in text.split():
+        key, separator, value = token.partition('=')
+        if not separator:
+            if key[:1].isdigit():
+                key, value = next(positional, ''), token
+                if not key:
+                    errors.append((token, 'лишнее число, укажите поле в виде имя=значение'))
+                    continue
+            else:
+                value = '1'
+        name = ALIASES.get(key.lower())
+        if name is None:
+            errors.append((key, 'неизвестное поле'))
+            continue
+        try:
+            values[name] = PARSERS[name](value)
+        except ValueError as e:
+            errors.append((key, str(e)))
+            invalid.add(name)
+    if 'total_inheritance' not in values and 'total_inheritance' not in invalid:
+        errors.insert(0, ('total', 'не указана сумма наследства'))
+    if errors:
+        raise ScenarioError(errors)
+
+    user_data = asdict(Estate())
+    user_data.update(values)
+    warnings = []
+    if 'has_will' not in values:
+        user_data['has_will'] = user_data['will_amount'] > 0
+    if not user_data['has_will']:
+        user_data['will_amount'] = 0.0
+    elif user_data['will_amount'] > max_will_amount(user_data):
+        warnings.append(will_warning(max_will_amount(user_data)))
+        user_data['will_amount'] = max_will_amount(user_data)
+    return user_data, warnings
@@ -0,0 +1,87 @@
+"""Bounded cache of rendered responses with expiry and hit metrics.
+
+Many users enter the same family with the same round amounts, so the bot
+keeps the final message for the normalized answers instead of calculating
+and rendering it again.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Mapping, NamedTuple
+
+from inheritance.engine import Estate
+
+DEFAULT_MAXSIZE = 1024
+DEFAULT_TTL = 3600.0  # секунд
+
+
+class CacheStats(NamedTuple):
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    expirations: int  # Промахи из-за истекшего срока записи
+    evictions: int  # Записи, вытесненные из-за размера
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class TTLCache:
+    """LRU cache of at most ``maxsize`` entries that expire ``ttl`` seconds after they are stored."""
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, ttl: float = DEFAULT_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._expirations = self._evictions = 0
+
+    def get(self, key: Hashable):
+        """The value stored for the key, or None if there is none or it has expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > self._clock():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self._expirations += 1
+            self._misses += 1
+            return None
+
+    def put(self, key: Hashable, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(len(self._entries), self.maxsize, self._hits, self._misses,
+                              self._expirations, self._evictions)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def response_key(user_data: Mapping, detailed: bool = True, target: str = 'markdown') -> tuple:
+    """Normalized answers that determine the rendered response."""
+    estate = Estate.from_user_data(user_data)
+    # The message shows the amounts as entered, so they are part of the key as floats
+    will_amount = float(estate.will_amount) if estate.has_will else 0.0
+    return (float(estate.total_inheritance), float(estate.debts), bool(estate.has_will), will_amount,
+            estate.composition(), detailed, target)
@@ -0,0 +1,379 @@
+"""Streaming batch calculation of many estates from JSONL or CSV.
+
+Every input record uses the same field names as the bot's ``user_data``
+(``total_inheritance``, ``debts``, ``has_will``, ``num_sons`` ...); other
+fields, e.g. an ``id``, are copied to the output. Records are read, calculated
+and written chunk by chunk, so memory use does not depend on the input size::
+
+    python -m inheritance estates.jsonl -o results.jsonl
+    cat estates.csv | python -m inheritance --format csv --chunk-size 5000 > results.csv
+    python -m inheritance estates.jsonl -o results.jsonl --workers 0  # all CPUs
+    python -m inheritance estates.jsonl -o results.jsonl --table shares.tbl  # see inheritance.table
+"""
+import argparse
+import csv
+import json
+import math
+import shutil
+import sys
+import tempfile
+from decimal import InvalidOperation
+from functools import lru_cache, partial
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+from inheritance.engine import ESTATE_FIELDS, HEIR_GROUPS, Estate, distribute
+from inheritance.money import allocate, to_kopecks, to_rubles
+from inheritance.parallel import default_workers, map_chunks
+from inheritance.table import TABLE_COLUMNS, ShareTable
+
+FORMATS = ('jsonl', 'csv')
+DEFAULT_CHUNK_SIZE = 1000
+
+MONEY_FIELDS = ('total_inheritance', 'debts', 'will_amount')
+FLAG_FIELDS = tuple(name for name in ESTATE_FIELDS if name.startswith(('has_', 'is_')))
+COUNT_FIELDS = tuple(name for name in ESTATE_FIELDS if name.startswith('num_'))
+
+RESULT_FIELDS = ('net_inheritance', 'asl', 'error') + tuple(
+    field for group in HEIR_GROUPS for field in (group, f'{group}_parts'))
+# Heir group of every column of a share table
+TABLE_HEIRS = tuple(HEIR_GROUPS.index(name) for name in TABLE_COLUMNS)
+
+# Ошибки одной записи: они попадают в поле error ее строки и не прерывают расчет остальных
+RECORD_ERRORS = (ValueError, TypeError, AttributeError, InvalidOperation)
+
+
+class InvalidRecord(NamedTuple):
+    """A JSONL line that could not be decoded; its output row gets the error."""
+    error: str
+
+
+def decode_record(line: str):
+    """The record of a JSONL line, or :class:`InvalidRecord`."""
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return InvalidRecord(f'некорректная строка JSON: {e}')
+
+
+def record_error(error: Exception) -> str:
+    """The text for the ``error`` field of a record."""
+    if isinstance(error, InvalidOperation):
+        # Decimal cannot round an amount with more digits than its precision to kopecks
+        return 'сумма слишком велика для расчета'
+    return str(error)
+
+
+def _parse_flag(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('', '0', 'false', 'no'):
+        return False
+    if text in ('1', 'true', 'yes'):
+        return True
+    raise ValueError("Пожалуйста, введите 1 для 'да' или 0 для 'нет'")
+
+
+def parse_record(record: Mapping) -> Estate:
+    """Build an estate from a record whose values may be strings (CSV) or JSON values."""
+    if isinstance(record, InvalidRecord):
+        raise ValueError(record.error)
+    if not isinstance(record, Mapping):
+        raise ValueError('запись должна быть объектом JSON')
+    values = {}
+    for name in MONEY_FIELDS:
+        value = record.get(name)
+        if value not in (None, ''):
+            try:
+                values[name] = float(str(value).replace(',', '.'))
+            except ValueError:
+                raise ValueError(f'{name}: пожалуйста, введите корректное число') from None
+            if not math.isfinite(values[name]):
+                raise ValueError(f'{name}: пожалуйста, введите корректное число')
+    for name in FLAG_FIELDS:
+        if record.get(name) is not None:
+            try:
+                values[name] = _parse_flag(record[name])
+            except ValueError as e:
+                raise ValueError(f'{name}: {e}') from None
+    for name in COUNT_FIELDS:
+        value = record.get(name)
+        if value not in (None, ''):
+            try:
+                values[name] = int(str(value).strip())
+            except ValueError:
+                raise ValueError(f'{name}: пожалуйста, введите целое число') from None
+            if values[name] < 0:
+                raise ValueError(f'{name}: число не может быть отрицательным')
+
+    if values.get('total_inheritance', 0) <= 0:
+        raise ValueError('total_inheritance: сумма наследства должна быть положительной')
+    if values.get('debts', 0) < 0:
+        raise ValueError('debts: сумма долгов не может быть отрицательной')
+    if values.get('will_amount', 0) < 0:
+        raise ValueError('will_amount: сумма в завещании не может быть отрицательной')
+    return Estate(**values)
+
+
+def _passthrough(record) -> Dict:
+    if not isinstance(record, Mapping):
+        return {}
+    return {name: value for name, value in record.items() if name not in ESTATE_FIELDS}
+
+
+@lru_cache(maxsize=None)
+def open_table(path: str) -> ShareTable:
+    """The share table, mapped once per process."""
+    return ShareTable(path)
+
+
+def _shares(estate: Estate, table: Optional[ShareTable]) -> Optional[Tuple[int, int, List[Tuple[int, int, int]]]]:
+    """Net inheritance, common base and (heir group, parts, kopecks) of the estate; None if nothing is left.
+
+    An estate without a will whose composition is in the table is looked up
+    there instead of applying the rules.
+    """
+    if table is not None and not (estate.has_will and to_kopecks(estate.will_amount) > 0):
+        entry = table.lookup(estate.composition())
+        if entry is not None:
+            net_inheritance = max(0, to_kopecks(estate.total_inheritance) - to_kopecks(estate.debts))
+            if net_inheritance <= 0:
+                return None
+            heirs = [heir for heir, present in zip(TABLE_HEIRS, entry.present) if present]
+            parts = [part for part, present in zip(entry.parts, entry.present) if present]
+            return net_inheritance, entry.asl, list(zip(heirs, parts, allocate(parts, entry.asl, net_inheritance)))
+    distribution = distribute(estate, detailed=False)
+    if distribution is None:
+        return None
+    structure = distribution.structure
+    return distribution.net_inheritance, structure.asl, [
+        (line.heir, part, amount)
+        for line, part, amount in zip(structure.lines, structure.parts, distribution.kopecks)]
+
+
+def calculate_scalar(records: List[Mapping], table: Optional[ShareTable] = None) -> Iterator[Dict]:
+    """Calculate a chunk record by record with the cached scalar engine, or the share table."""
+    for record in records:
+        row = _passthrough(record)
+        try:
+            shares = _shares(parse_record(record), table)
+        except RECORD_ERRORS as e:
+            row['error'] = record_error(e)
+            yield row
+            continue
+        if shares is None:
+            row['net_inheritance'] = '0.00'
+            row['error'] = 'После выплаты долгов не осталось средств для распределения'
+            yield row
+            continue
+        net_inheritance, asl, heirs = shares
+        row['net_inheritance'] = str(to_rubles(net_inheritance))
+        row['asl'] = asl
+        for heir, part, amount in heirs:
+            group = HEIR_GROUPS[heir]
+            row[group] = str(to_rubles(amount))
+            row[f'{group}_parts'] = part
+        yield row
+
+
+def calculate_vectorized(records: List[Mapping]) -> Iterator[Dict]:
+    """Calculate a whole chunk at once with the numpy engine."""
+    import numpy as np
+
+    from inheritance.vectorized import calculate_batch
+
+    rows = [_passthrough(record) for record in records]
+    estates = []
+    calculated = []  # (row, record) of the estates
+    for row, record in zip(rows, records):
+        try:
+            estates.append(parse_record(record))
+        except RECORD_ERRORS as e:
+            row['error'] = record_error(e)
+        else:
+            calculated.append((row, record))
+
+    if estates:
+        columns = {name: np.array([getattr(estate, name) for estate in estates]) for name in ESTATE_FIELDS}
+        result = calculate_batch(columns)
+        for i, (row, record) in enumerate(calculated):
+            if result.overflow[i]:
+                # Too large for int64, the scalar engine calculates it exactly
+                row.update(next(calculate_scalar([record])))
+                continue
+            row['net_inheritance'] = str(to_rubles(int(result.net[i])))
+            if not result.valid[i]:
+                row['error'] = 'После выплаты долгов не осталось средств для распределения'
+                continue
+            row['asl'] = int(result.asl[i])
+            for j in np.flatnonzero(result.present[i]):
+                row[HEIR_GROUPS[j]] = str(to_rubles(int(result.kopecks[i, j])))
+                row[f'{HEIR_GROUPS[j]}_parts'] = int(result.parts[i, j])
+    return iter(rows)
+
+
+ENGINES = {
+    'scalar': calculate_scalar,
+    'numpy': calculate_vectorized,
+}
+
+
+def read_records(stream, fmt: str) -> Iterator:
+    """CSV rows as dicts, JSONL records as raw lines (decoded in :func:`process_chunk`)."""
+    if fmt == 'csv':
+        return iter(csv.DictReader(stream))
+    return (line for line in stream if line.strip())
+
+
+def jsonl_fields(stream) -> Tuple[object, List[str]]:
+    """Keys of all JSONL records in the order they first appear, and the stream to read the records from.
+
+    The records are scanned and then read again; a stream that cannot seek,
+    e.g. a pipe, is copied to a temporary file for that.
+    """
+    if not stream.seekable():
+        spool = tempfile.TemporaryFile('w+', newline='', encoding='utf-8')
+        shutil.copyfileobj(stream, spool)
+        spool.seek(0)
+        stream = spool
+    start = stream.tell()
+    fields = {}
+    for line in read_records(stream, 'jsonl'):
+        record = decode_record(line)
+        if isinstance(record, Mapping):
+            fields.update(dict.fromkeys(record))
+    stream.seek(start)
+    return stream, list(fields)
+
+
+def chunks(records: Iterable, size: int) -> Iterator[List]:
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def process_chunk(engine: str, fmt: str, output_format: str, table: Optional[str], chunk: List) -> List:
+    """Calculate a chunk read by :func:`read_records`.
+
+    Returns result rows, already encoded as lines for JSONL output. Decoding
+    and encoding happen here so that they run in the worker processes too.
+    With the path of a share ``table`` the scalar engine looks the shares up.
+    """
+    records = [decode_record(line) for line in chunk] if fmt == 'jsonl' else chunk
+    if table is not None:
+        rows = calculate_scalar(records, open_table(table))
+    else:
+        rows = ENGINES[engine](records)
+    if output_format == 'jsonl':
+        return [json.dumps(row, ensure_ascii=False) + '\n' for row in rows]
+    return list(rows)
+
+
+def run(source, target, fmt: str = 'jsonl', output_format: Optional[str] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE, engine: str = 'scalar', workers: int = 1,
+        table: Optional[str] = None) -> int:
+    """Stream the estates of ``source`` to ``target``; returns the number of records.
+
+    With ``workers > 1`` the chunks are calculated in a process pool; the
+    output keeps the input order. ``table`` is the path of a share table for
+    the scalar engine.
+    """
+    if table is not None and engine != 'scalar':
+        raise ValueError('Таблица долей используется только движком scalar')
+    output_format = output_format or fmt
+    task = partial(process_chunk, engine, fmt, output_format, table)
+    stream = source
+    fieldnames = None
+    if output_format == 'csv':
+        # The header lists the copied fields of all records, whatever the first row has
+        if fmt == 'csv':
+            records = csv.DictReader(source)
+            fields = records.fieldnames or []
+        else:
+            stream, fields = jsonl_fields(source)
+            records = read_records(stream, fmt)
+        fieldnames = [name for name in fields if name not in ESTATE_FIELDS and name not in RESULT_FIELDS]
+        fieldnames += RESULT_FIELDS
+    else:
+        records = read_records(source, fmt)
+    records = chunks(records, chunk_size)
+    if workers > 1:
+        results = map_chunks(task, records, workers)
+    else:
+        results = map(task, records)
+    writer = None
+    count = 0
+    try:
+        for rows in results:
+            if output_format == 'csv':
+                if writer is None and rows:
+                    writer = csv.DictWriter(target, fieldnames, extrasaction='ignore')
+                    writer.writeheader()
+                writer.writerows(rows)
+            else:
+                target.writelines(rows)
+            target.flush()
+            count += len(rows)
+    finally:
+        if stream is not source:
+            stream.close()
+    return count
+
+
+def _default_engine() -> str:
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return 'scalar'
+    return 'numpy'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m inheritance',
+                                     description='Пакетный расчет наследства из JSONL или CSV')
+    parser.add_argument('input', nargs='?', default='-', help='входной файл (по умолчанию stdin)')
+    parser.add_argument('-o', '--output', default='-', help='выходной файл (по умолчанию stdout)')
+    parser.add_argument('--format', choices=FORMATS,
+                        help='формат входа (по умолчанию по расширению файла, иначе jsonl)')
+    parser.add_argument('--output-format', choices=FORMATS, help='формат выхода (по умолчанию как у входа)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='сколько записей обрабатывать за раз (по умолчанию %(default)s)')
+    parser.add_argument('--engine', choices=tuple(ENGINES), default=None,
+                        help='numpy, если он установлен, иначе scalar')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='число процессов; 0 — по числу доступных процессоров (по умолчанию %(default)s)')
+    parser.add_argument('--table', help='таблица долей (python -m inheritance.table build) для движка scalar: '
+                                        'наследства без завещания берут доли из нее')
+    args = parser.parse_args(argv)
+    if args.chunk_size <= 0:
+        parser.error('--chunk-size должен быть положительным')
+    if args.workers < 0:
+        parser.error('--workers не может быть отрицательным')
+    engine = args.engine or ('scalar' if args.table else _default_engine())
+    if args.table:
+        if engine != 'scalar':
+            parser.error('--table работает только с --engine scalar')
+        try:
+            open_table(args.table)
+        except (OSError, ValueError) as e:
+            parser.error(f'--table: {e}')
+
+    fmt = args.format or ('csv' if args.input.endswith('.csv') else 'jsonl')
+    source = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    try:
+        run(source, target, fmt, args.output_format, args.chunk_size, engine, args.workers or default_workers(),
+            args.table)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,540 @@
+"""Inheritance share calculation according to Islamic inheritance law (faraid).
+
+The module deliberately has no third-party dependencies so it can be imported
+by batch jobs and services without pulling in python-telegram-bot.
+"""
+from dataclasses import dataclass, fields
+from enum import IntEnum
+from fractions import Fraction
+from functools import lru_cache
+from math import lcm
+from typing import List, Mapping, NamedTuple, Optional, Tuple
+
+from inheritance.money import allocate, to_kopecks
+
+
+class Heir(IntEnum):
+    """Heir groups in the order in which the rules give out the shares."""
+    WILL = 0  # Завещание (васия)
+    HUSBAND = 1
+    WIFE = 2
+    FATHER = 3
+    MOTHER = 4
+    GRANDFATHER = 5  # по отцу
+    GRANDMOTHER = 6  # по матери
+    SONS = 7
+    DAUGHTERS = 8
+    GRANDSONS = 9
+    GRANDDAUGHTERS = 10
+    SIBLINGS_BROTHERS = 11
+    SIBLINGS_SISTERS = 12
+    COUSINS_BROTHERS = 13
+    COUSINS_SISTERS = 14
+
+
+# Имена групп наследников в полях расчета (num_sons, has_father ...) и в пакетных форматах
+HEIR_GROUPS = tuple(heir.name.lower() for heir in Heir)
+
+
+class Rule(IntEnum):
+    """How the share of an heir group was determined."""
+    WILL = 0  # Завещание, не более 1/3
+    FIXED = 1  # Фиксированная доля (фард)
+    FIXED_SHARED = 2  # Фиксированная доля поровну на всю группу
+    RESIDUE = 3  # Весь остаток
+    RESIDUE_SPLIT = 4  # Часть остатка: мужчине вдвое больше, чем женщине
+
+
+class Reason(IntEnum):
+    """Why an heir group gets nothing."""
+    CHILDREN = 0  # Есть сыновья/дочери
+    DESCENDANTS = 1  # Есть прямые потомки
+    SIBLINGS = 2  # Есть родные братья/сестры
+    FATHER = 3  # Отец жив
+    MOTHER = 4  # Мать жива
+
+# Сколько различных составов семьи хранить в кэше долей
+SHARE_CACHE_SIZE = 1024
+
+
+class Composition(NamedTuple):
+    """Family composition: everything except the amounts that the shares depend on."""
+    is_murderer: bool
+    is_different_faith: bool
+    has_spouse: bool
+    has_wife: bool
+    num_daughters: int
+    num_sons: int
+    num_granddaughters: int
+    num_grandsons: int
+    has_father: bool
+    has_mother: bool
+    has_grandfather: bool
+    has_grandmother: bool
+    num_siblings_sisters: int
+    num_siblings_brothers: int
+    num_cousins_sisters: int
+    num_cousins_brothers: int
+
+
+class ShareLine(NamedTuple):
+    """Exact share of the net inheritance of an heir group."""
+    heir: Heir
+    count: int  # Количество наследников в группе
+    share: Fraction
+    rule: Rule
+    residue_parts: int = 0  # На сколько частей делится остаток (Rule.RESIDUE_SPLIT)
+
+
+class Exclusion(NamedTuple):
+    """Heir group that is present but gets nothing."""
+    heir: Heir
+    count: int
+    reason: Reason
+
+
+class ShareStructure(NamedTuple):
+    """Exact shares of a family composition, independent of the amounts."""
+    lines: Tuple[ShareLine, ...]
+    notes: Tuple[Tuple[str, str], ...]  # Предупреждения и пояснения к расчету (заголовок, текст)
+    exclusions: Tuple[Exclusion, ...]
+    asl: int  # Общее основание долей (асль аль-масаля)
+    parts: Tuple[int, ...]  # Доля каждой строки в частях от основания
+
+
+@dataclass(frozen=True)
+class Estate:
+    """Input of the calculation.
+
+    Field names match the keys the bot stores in ``context.user_data``.
+    """
+    total_inheritance: float = 0.0
+    debts: float = 0.0
+    has_will: bool = False
+    will_amount: float = 0.0
+    is_murderer: bool = False  # Есть ли убийца среди наследников
+    is_different_faith: bool = False  # Есть ли наследники другой веры
+    has_spouse: bool = False
+    has_wife: bool = False
+    num_daughters: int = 0
+    num_sons: int = 0
+    num_granddaughters: int = 0
+    num_grandsons: int = 0
+    has_father: bool = False
+    has_mother: bool = False
+    has_grandfather: bool = False
+    has_grandmother: bool = False
+    num_siblings_sisters: int = 0
+    num_siblings_brothers: int = 0
+    num_cousins_sisters: int = 0
+    num_cousins_brothers: int = 0
+
+    @classmethod
+    def from_user_data(cls, user_data: Mapping) -> 'Estate':
+        """Build an estate from a ``user_data``-like mapping, ignoring unknown keys."""
+        return cls(**{name: user_data[name] for name in ESTATE_FIELDS if name in user_data})
+
+    def composition(self) -> Composition:
+        """Normalize the family composition, e.g. to use it as a cache key."""
+        return Composition(
+            bool(self.is_murderer), bool(self.is_different_faith),
+            bool(self.has_spouse), bool(self.has_wife),
+            int(self.num_daughters), int(self.num_sons),
+            int(self.num_granddaughters), int(self.num_grandsons),
+            bool(self.has_father), bool(self.has_mother),
+            bool(self.has_grandfather), bool(self.has_grandmother),
+            int(self.num_siblings_sisters), int(self.num_siblings_brothers),
+            int(self.num_cousins_sisters), int(self.num_cousins_brothers),
+        )
+
+
+ESTATE_FIELDS = tuple(f.name for f in fields(Estate))
+
+
+class HeirShare:
+    """Share of an heir group in a calculated estate.
+
+    The group gets ``numerator / denominator`` of the net inheritance, that is
+    ``amount`` kopecks; the denominator is the common base (asl) of the estate.
+    """
+    __slots__ = ('heir', 'count', 'numerator', 'denominator', 'amount', 'rule', 'residue_parts')
+
+    def __init__(self, heir: Heir, count: int, numerator: int, denominator: int, amount: int,
+                 rule: Rule, residue_parts: int = 0):
+        self.heir = heir
+        self.count = count
+        self.numerator = numerator
+        self.denominator = denominator
+        self.amount = amount
+        self.rule = rule
+        self.residue_parts = residue_parts
+
+    def __repr__(self):
+        return (f'HeirShare({self.heir.name}, count={self.count}, '
+                f'share={self.numerator}/{self.denominator}, amount={self.amount})')
+
+
+class InheritanceShares:
+    """Output of the calculation: the shares of every heir group in kopecks.
+
+    ``heirs`` is empty with ``net_inheritance == 0`` when the debts leave
+    nothing to distribute. Display texts are produced by
+    :mod:`inheritance.formatting`.
+    """
+    __slots__ = ('net_inheritance', 'asl', 'heirs', 'exclusions', 'notes', 'detailed')
+
+    def __init__(self, net_inheritance: int, asl: int, heirs: Tuple[HeirShare, ...],
+                 exclusions: Tuple[Exclusion, ...] = (), notes: Tuple[Tuple[str, str], ...] = (),
+                 detailed: bool = True):
+        self.net_inheritance = net_inheritance  # в копейках
+        self.asl = asl  # Общее основание долей (асль аль-масаля)
+        self.heirs = heirs
+        self.exclusions = exclusions  # Наследники без доли
+        self.notes = notes  # Предупреждения и пояснения к расчету
+        self.detailed = detailed
+
+    def __repr__(self):
+        return f'InheritanceShares(net_inheritance={self.net_inheritance}, asl={self.asl}, heirs={self.heirs!r})'
+
+
+# Пояснения к расчету: подробный вариант (calculate.py) и краткий (calculate2.py)
+MURDERER_WARNING = {
+    True: "По исламскому праву убийца не может наследовать имущество своей жертвы. Согласно учению Мухаммеда ибн Идрис Шафии, убийца во всех случаях лишается права наследовать после своей жертвы (за исключением убийства в приступе безумия или совершенного малолетним). Есть и другие трактовки о сохранении права наследования в случаях убийства при самозащите или по несчастному случаю. Рекомендуем проконсультироваться с имамом или исламским юристом.",
+    False: "По исламскому праву убийца не может наследовать имущество своей жертвы. Рекомендуем проконсультироваться с имамом или исламским юристом.",
+}
+FAITH_WARNING = {
+    True: "По исламскому праву немусульмане не могут наследовать от мусульман, а мусульмане не могут наследовать от немусульман. Это правило относится как к наследникам по родству, так и по завещанию. Рекомендуем проконсультироваться с имамом или исламским юристом.",
+    False: "По исламскому праву немусульмане не могут наследовать от мусульман. Рекомендуем проконсультироваться с имамом или исламским юристом.",
+}
+
+# Ссылки на Коран и правила, которые добавляются только в подробном варианте
+ABOUT_WILL = "Согласно исламскому праву, завещание (васия) может составлять не более 1/3 от всего наследства. Распределение по завещанию происходит после выплаты долгов умершего, но до распределения наследства между родственниками. Наследники по родству не могут одновременно быть наследниками по завещанию."
+ABOUT_HUSBAND_WITH_CHILDREN = "Согласно аяту 12 суры Ан-Ниса (Женщины): «Вам принадлежит половина того, что оставили ваши жены, если у них нет ребенка. Но если у них есть ребенок, то вам принадлежит четверть того, что они оставили»."
+ABOUT_HUSBAND = "Согласно аяту 12 суры Ан-Ниса (Женщины): «Вам принадлежит половина того, что оставили ваши жены, если у них нет ребенка»."
+ABOUT_WIFE_WITH_CHILDREN = "Согласно аяту 12 суры Ан-Ниса (Женщины): «Им принадлежит четверть того, что вы оставили, если у вас нет ребенка. Но если у вас есть ребенок, то им принадлежит одна восьмая того, что вы оставили»."
+ABOUT_WIFE = "Согласно аяту 12 суры Ан-Ниса (Женщины): «Им принадлежит четверть того, что вы оставили, если у вас нет ребенка»."
+ABOUT_FATHER_WITH_SONS = "Согласно аяту 11 суры Ан-Ниса (Женщины): «Каждому из родителей принадлежит одна шестая того, что он оставил, если у него есть ребенок». Отец получает фиксированную долю 1/6 наследства."
+ABOUT_FATHER_RESIDUE = "Если у умершего нет сыновей, отец получает остаток наследства после распределения фиксированных долей другим наследникам. Согласно правилам 'асаба' (остаточные наследники), отец имеет право на оставшуюся часть наследства."
+ABOUT_MOTHER_SIXTH = "Согласно аяту 11 суры Ан-Ниса (Женщины): «Каждому из родителей принадлежит одна шестая того, что он оставил, если у него есть ребенок. Если же у него есть братья, то матери достается одна шестая». Мать получает 1/6, так как у умершего есть дети или братья/сестры."
+ABOUT_MOTHER_THIRD = "Согласно аяту 11 суры Ан-Ниса (Женщины): «Если же у него нет ребенка, то ему наследуют родители, и матери достается одна треть». Мать получает 1/3, так как у умершего нет детей и братьев/сестер."
+ABOUT_GRANDFATHER = "В отсутствие отца, дедушка (по отцовской линии) занимает его место в наследовании и получает фиксированную долю 1/6 наследства. Это правило основано на принципе 'асабы' - когда более близкий родственник отсутствует, его место занимает следующий по степени родства."
+ABOUT_GRANDMOTHER = "В отсутствие матери, бабушка (по материнской линии) занимает её место в наследовании и получает фиксированную долю 1/6 наследства. Это правило основано на хадисе, согласно которому Пророк Мухаммад (мир ему) установил для бабушки 1/6 часть наследства, если нет матери."
+ABOUT_CHILDREN = "Согласно аяту 11 суры Ан-Ниса (Женщины): «Аллах заповедует вам относительно ваших детей: мужчине достается доля, равная доле двух женщин». Сыновья и дочери получают остаток наследства после распределения фиксированных долей другим наследникам, при этом доля сына вдвое больше доли дочери."
+ABOUT_GRANDCHILDREN = "В отсутствие сыновей и дочерей, внуки и внучки занимают их место в наследовании. По принципу 'таазиб', действует то же правило, как и для детей: внук получает вдвое больше, чем внучка. Внуки наследуют остаток имущества после распределения фиксированных долей другим наследникам."
+ABOUT_SISTERS = "Согласно аяту 176 суры Ан-Ниса (Женщины): «Если умрет мужчина, у которого нет ребенка, но есть сестра, то ей принадлежит половина того, что он оставил. И он наследует ей, если у нее нет ребенка. Если их две, то им принадлежат две трети того, что он оставил»."
+ABOUT_SIBLINGS = "Согласно аяту 176 суры Ан-Ниса (Женщины): «Если они являются братьями и сестрами, то мужчине принадлежит доля, равная доле двух женщин». Братья и сестры наследуют при отсутствии прямых потомков (сыновей и дочерей) умершего, при этом брат получает долю в два раза больше, чем сестра."
+
+
+def _split_remaining(lines, remaining, male, num_male, female, num_female):
+    """Distribute the remaining inheritance so that a man gets twice the share of a woman."""
+    total_parts = num_male * 2 + num_female
+    share_per_part = remaining / total_parts
+
+    if num_male > 0:
+        lines.append(ShareLine(male, num_male, share_per_part * 2 * num_male, Rule.RESIDUE_SPLIT, total_parts))
+
+    if num_female > 0:
+        lines.append(ShareLine(female, num_female, share_per_part * num_female, Rule.RESIDUE_SPLIT, total_parts))
+
+
+def _exclude(exclusions, heir, count, reason):
+    """Record that the heirs of a group get nothing; a later reason replaces an earlier one."""
+    if count > 0:
+        exclusions[heir] = Exclusion(heir, count, reason)
+
+
+def share_structure(composition: Composition, will_share: Fraction = Fraction(0),
+                    detailed: bool = True) -> ShareStructure:
+    """Calculate the exact shares of a family composition.
+
+    Without a will the result does not depend on the amounts, so it is cached
+    by the composition; ``share_structure.cache_info()`` reports hits and
+    misses. The share of a will is a ratio of two particular amounts and
+    almost never repeats, so those structures are calculated every time
+    rather than pushing the shared compositions out of the cache.
+    """
+    if will_share > 0:
+        return _share_structure(composition, will_share, detailed)
+    return _cached_share_structure(composition, detailed)
+
+
+@lru_cache(maxsize=SHARE_CACHE_SIZE)
+def _cached_share_structure(composition: Composition, detailed: bool) -> ShareStructure:
+    return _share_structure(composition, Fraction(0), detailed)
+
+
+share_structure.cache_info = _cached_share_structure.cache_info
+share_structure.cache_clear = _cached_share_structure.cache_clear
+
+
+def _share_structure(composition: Composition, will_share: Fraction, detailed: bool) -> ShareStructure:
+    lines = []
+    notes = {}  # Предупреждения и пояснения к расчету
+    exclusions = {}  # Наследники без доли
+
+    # Предупреждения о специальных случаях
+    if composition.is_murderer:
+        notes["Предупреждение"] = MURDERER_WARNING[detailed]
+
+    if composition.is_different_faith:
+        notes["Предупреждение о вере"] = FAITH_WARNING[detailed]
+
+    # Учитываем завещание, если оно есть
+    remaining = Fraction(1)
+    if will_share > 0:
+        lines.append(ShareLine(Heir.WILL, 1, will_share, Rule.WILL))
+        if detailed:
+            notes["О завещании (васия)"] = ABOUT_WILL
+        # Уменьшаем оставшуюся сумму
+        remaining -= will_share
+
+    num_sons = composition.num_sons
+    num_daughters = composition.num_daughters
+    num_grandsons = composition.num_grandsons
+    num_granddaughters = composition.num_granddaughters
+
+    # Sons, daughters, grandsons or granddaughters reduce the spouse shares
+    # and block siblings and cousins
+    has_direct_descendants = (num_sons > 0 or num_daughters > 0
+                              or num_grandsons > 0 or num_granddaughters > 0)
+
+    # Islamic inheritance calculation rules
+    # 1. First allocate fixed shares (Fard)
+    # 2. Then distribute remaining to agnatic heirs (Asaba)
+
+    # Spouse shares
+    if composition.has_spouse:
+        if has_direct_descendants:
+            spouse_share = Fraction(1, 4)
+            if detailed:
+                notes["О доле мужа"] = ABOUT_HUSBAND_WITH_CHILDREN
+        else:
+            spouse_share = Fraction(1, 2)
+            if detailed:
+                notes["О доле мужа"] = ABOUT_HUSBAND
+
+        lines.append(ShareLine(Heir.HUSBAND, 1, spouse_share, Rule.FIXED))
+        remaining -= spouse_share
+
+    if composition.has_wife:
+        if has_direct_descendants:
+            wife_share = Fraction(1, 8)
+            if detailed:
+                notes["О доле жены"] = ABOUT_WIFE_WITH_CHILDREN
+        else:
+            wife_share = Fraction(1, 4)
+            if detailed:
+                notes["О доле жены"] = ABOUT_WIFE
+
+        lines.append(ShareLine(Heir.WIFE, 1, wife_share, Rule.FIXED))
+        remaining -= wife_share
+
+    # Parents shares
+    if composition.has_father:
+        if num_sons > 0:
+            lines.append(ShareLine(Heir.FATHER, 1, Fraction(1, 6), Rule.FIXED))
+            remaining -= Fraction(1, 6)
+            if detailed:
+                notes["О доле отца"] = ABOUT_FATHER_WITH_SONS
+        else:
+            # Father gets residue if no sons
+            lines.append(ShareLine(Heir.FATHER, 1, remaining, Rule.RESIDUE))
+            remaining = Fraction(0)
+            if detailed:
+                notes["О доле отца"] = ABOUT_FATHER_RESIDUE
+
+    if composition.has_mother:
+        has_children = num_sons > 0 or num_daughters > 0
+        has_siblings = (composition.num_siblings_brothers > 0
+                        or composition.num_siblings_sisters > 0
+                        or composition.num_cousins_brothers > 0
+                        or composition.num_cousins_sisters > 0)
+
+        if has_children or has_siblings:
+            mother_share = Fraction(1, 6)
+            if detailed:
+                notes["О доле матери"] = ABOUT_MOTHER_SIXTH
+        else:
+            mother_share = Fraction(1, 3)
+            if detailed:
+                notes["О доле матери"] = ABOUT_MOTHER_THIRD
+
+        lines.append(ShareLine(Heir.MOTHER, 1, mother_share, Rule.FIXED))
+        remaining -= mother_share
+
+    # Grandfather's share (paternal)
+    if composition.has_grandfather:
+        if composition.has_father:
+            # Grandfather doesn't inherit if father is alive
+            _exclude(exclusions, Heir.GRANDFATHER, 1, Reason.FATHER)
+        else:
+            # If father is not alive, grandfather gets 1/6
+            lines.append(ShareLine(Heir.GRANDFATHER, 1, Fraction(1, 6), Rule.FIXED))
+            if detailed:
+                notes["О доле дедушки"] = ABOUT_GRANDFATHER
+            remaining -= Fraction(1, 6)
+
+    # Grandmother's share (maternal)
+    if composition.has_grandmother:
+        if composition.has_mother:
+            # Grandmother doesn't inherit if mother is alive
+            _exclude(exclusions, Heir.GRANDMOTHER, 1, Reason.MOTHER)
+        else:
+            # If mother is not alive, grandmother gets 1/6
+            lines.append(ShareLine(Heir.GRANDMOTHER, 1, Fraction(1, 6), Rule.FIXED))
+            if detailed:
+                notes["О доле бабушки"] = ABOUT_GRANDMOTHER
+            remaining -= Fraction(1, 6)
+
+    # Children shares
+    if num_sons > 0 or num_daughters > 0:
+        # In Islamic law, a son gets twice the share of a daughter
+        if detailed:
+            notes["О доле детей"] = ABOUT_CHILDREN
+
+        _split_remaining(lines, remaining, Heir.SONS, num_sons, Heir.DAUGHTERS, num_daughters)
+        remaining = Fraction(0)  # All remaining inheritance distributed
+
+        # Grandsons and granddaughters don't inherit if there are sons/daughters
+        _exclude(exclusions, Heir.GRANDSONS, num_grandsons, Reason.CHILDREN)
+        _exclude(exclusions, Heir.GRANDDAUGHTERS, num_granddaughters, Reason.CHILDREN)
+
+    # If no children, distribute to grandchildren
+    if num_sons == 0 and num_daughters == 0 and remaining > 0:
+        if num_grandsons > 0 or num_granddaughters > 0:
+            if detailed:
+                notes["О доле внуков"] = ABOUT_GRANDCHILDREN
+
+            _split_remaining(lines, remaining, Heir.GRANDSONS, num_grandsons, Heir.GRANDDAUGHTERS, num_granddaughters)
+            remaining = Fraction(0)  # All remaining inheritance distributed
+
+    # Get number of siblings
+    num_siblings_brothers = composition.num_siblings_brothers
+    num_siblings_sisters = composition.num_siblings_sisters
+
+    # Get number of cousins
+    num_brothers = composition.num_cousins_brothers
+    num_sisters = composition.num_cousins_sisters
+
+    # Siblings and cousins don't inherit if there are direct descendants
+    if has_direct_descendants:
+        _exclude(exclusions, Heir.SIBLINGS_BROTHERS, num_siblings_brothers, Reason.DESCENDANTS)
+        _exclude(exclusions, Heir.SIBLINGS_SISTERS, num_siblings_sisters, Reason.DESCENDANTS)
+        _exclude(exclusions, Heir.COUSINS_BROTHERS, num_brothers, Reason.DESCENDANTS)
+        _exclude(exclusions, Heir.COUSINS_SISTERS, num_sisters, Reason.DESCENDANTS)
+
+    # Особое правило для сестер: если нет братьев, сыновей и отца, сестра получает 1/2, две и более сестер - 2/3
+    special_sisters_rule = (
+        not has_direct_descendants and  # Нет сыновей, дочерей, внуков и внучек
+        num_siblings_brothers == 0 and  # Нет братьев
+        num_siblings_sisters > 0 and    # Есть сестры
+        not composition.has_father  # Нет отца
+    )
+
+    # Сперва распределяем наследство родным братьям и сестрам, если они есть
+    if remaining > 0:
+        if num_siblings_brothers > 0 or num_siblings_sisters > 0:
+            # Применяем особое правило для сестер, если условия соответствуют
+            if special_sisters_rule:
+                if detailed:
+                    notes["О доле сестер"] = ABOUT_SISTERS
+
+                if num_siblings_sisters == 1:  # Одна сестра получает 1/2
+                    sisters_share = Fraction(1, 2)
+                    lines.append(ShareLine(Heir.SIBLINGS_SISTERS, 1, sisters_share, Rule.FIXED))
+                else:  # Две и более сестер делят 2/3
+                    sisters_share = Fraction(2, 3)
+                    lines.append(ShareLine(Heir.SIBLINGS_SISTERS, num_siblings_sisters, sisters_share,
+                                           Rule.FIXED_SHARED))
+                remaining -= sisters_share
+            else:
+                # Стандартный расчет: брат получает в два раза больше сестры
+                if detailed:
+                    notes["О доле братьев и сестер"] = ABOUT_SIBLINGS
+
+                _split_remaining(lines, remaining, Heir.SIBLINGS_BROTHERS, num_siblings_brothers,
+                                 Heir.SIBLINGS_SISTERS, num_siblings_sisters)
+                remaining = Fraction(0)  # All remaining inheritance distributed
+
+    # Если после распределения родным братьям и сестрам остались средства, распределяем двоюродным
+    if remaining > 0:
+        if num_brothers > 0 or num_sisters > 0:
+            _split_remaining(lines, remaining, Heir.COUSINS_BROTHERS, num_brothers,
+                             Heir.COUSINS_SISTERS, num_sisters)
+            remaining = Fraction(0)  # All remaining inheritance distributed
+
+    # Если есть двоюродные братья/сестры, но родные братья/сестры уже получили наследство
+    if num_siblings_brothers > 0 or num_siblings_sisters > 0:
+        _exclude(exclusions, Heir.COUSINS_BROTHERS, num_brothers, Reason.SIBLINGS)
+        _exclude(exclusions, Heir.COUSINS_SISTERS, num_sisters, Reason.SIBLINGS)
+
+    # Common base (asl al-mas'ala): every heir gets a whole number of shares
+    asl = lcm(*(line.share.denominator for line in lines),
+              *((line.share / line.count).denominator for line in lines))
+
+    return ShareStructure(
+        tuple(lines),
+        tuple(notes.items()),
+        tuple(exclusions.values()),
+        asl,
+        tuple(int(line.share * asl) for line in lines),
+    )
+
+
+class Distribution(NamedTuple):
+    """Exact shares of an estate and the kopecks allocated to every line."""
+    net_inheritance: int  # в копейках
+    structure: ShareStructure
+    kopecks: List[int]
+
+
+def distribute(estate: Estate, detailed: bool = True) -> Optional[Distribution]:
+    """Allocate the net inheritance in kopecks, or None if the debts leave nothing."""
+    total_inheritance = to_kopecks(estate.total_inheritance)
+    debts = to_kopecks(estate.debts)
+    will_amount = to_kopecks(estate.will_amount) if estate.has_will else 0
+
+    # Calculate net inheritance after debts
+    net_inheritance = max(0, total_inheritance - debts)
+
+    if net_inheritance <= 0:
+        return None
+
+    # Проверка суммы завещания (не более 1/3 наследства)
+    if will_amount > 0:
+        will_share = min(Fraction(will_amount, net_inheritance), Fraction(1, 3))
+    else:
+        will_share = Fraction(0)
+    structure = share_structure(estate.composition(), will_share, detailed)
+
+    # Only now convert the exact shares to kopecks
+    kopecks = allocate(structure.parts, structure.asl, net_inheritance)
+    return Distribution(net_inheritance, structure, kopecks)
+
+
+def calculate(estate: Estate, detailed: bool = True) -> InheritanceShares:
+    """Calculate inheritance shares based on Islamic inheritance laws.
+
+    Shares are exact fractions of the net inheritance. They are reported as
+    integer shares over a common base (asl al-mas'ala) and converted to
+    kopecks only at the end, so the amounts add up to the distributed total.
+
+    With ``detailed=False`` the explanations omit the references to the Quran
+    and the rules behind every share.
+    """
+    distribution = distribute(estate, detailed)
+
+    if distribution is None:
+        return InheritanceShares(0, 1, (), detailed=detailed)
+
+    structure = distribution.structure
+    asl = structure.asl
+    heirs = tuple(HeirShare(line.heir, line.count, part, asl, amount, line.rule, line.residue_parts)
+                  for line, part, amount in zip(structure.lines, structure.parts, distribution.kopecks))
+    return InheritanceShares(distribution.net_inheritance, asl, heirs, structure.exclusions, structure.notes,
+                             detailed)
+
+
+def calculate_inheritance(user_data: Mapping, detailed: bool = True) -> InheritanceShares:
+    """Calculate inheritance shares for the answers collected in ``user_data``."""
+    return calculate(Estate.from_user_data(user_data), detailed)
@@ -0,0 +1,403 @@
+"""Rendering of inheritance calculation results: Telegram Markdown, plain text and HTML.
+
+The engine identifies heirs by :class:`~inheritance.engine.Heir`; all display
+names, fractions and explanations are produced here.
+"""
+import html
+import re
+from decimal import Decimal
+from fractions import Fraction
+from functools import partial
+from operator import itemgetter
+from typing import Callable, Dict, Iterator, Mapping, NamedTuple, Optional, Tuple, TypedDict, Union
+
+from inheritance.engine import Heir, HeirShare, InheritanceShares, Reason, Rule
+from inheritance.money import divide_half_up, to_rubles
+
+
+class HeirNames(NamedTuple):
+    emoji: str
+    single: str  # Один наследник
+    plural: Optional[str] = None  # Группа: "Сыновья (3)"
+    each: Optional[str] = None  # Доля каждого в группе
+
+
+HEIR_NAMES = {
+    Heir.WILL: HeirNames("📜", "Завещание (васия)"),
+    Heir.HUSBAND: HeirNames("👨‍❤️‍👨", "Супруг (муж)"),
+    Heir.WIFE: HeirNames("👩‍❤️‍👨", "Супруга (жена)"),
+    Heir.FATHER: HeirNames("👨‍🦳", "Отец"),
+    Heir.MOTHER: HeirNames("👩‍🦳", "Мать"),
+    Heir.GRANDFATHER: HeirNames("👴", "Дедушка (по отцу)"),
+    Heir.GRANDMOTHER: HeirNames("👵", "Бабушка (по матери)"),
+    Heir.SONS: HeirNames("👦", "Сын", "Сыновья", "Каждому сыну"),
+    Heir.DAUGHTERS: HeirNames("👧", "Дочь", "Дочери", "Каждой дочери"),
+    Heir.GRANDSONS: HeirNames("👦", "Внук", "Внуки", "Каждому внуку"),
+    Heir.GRANDDAUGHTERS: HeirNames("👧", "Внучка", "Внучки", "Каждой внучке"),
+    Heir.SIBLINGS_BROTHERS: HeirNames("👬", "Родной брат", "Родные братья", "Каждому родному брату"),
+    Heir.SIBLINGS_SISTERS: HeirNames("👭", "Родная сестра", "Родные сестры", "Каждой родной сестре"),
+    Heir.COUSINS_BROTHERS: HeirNames("👬", "Двоюродный брат", "Двоюродные братья", "Каждому двоюродному брату"),
+    Heir.COUSINS_SISTERS: HeirNames("👭", "Двоюродная сестра", "Двоюродные сестры", "Каждой двоюродной сестре"),
+}
+
+DEFAULT_EMOJI = "👤"
+
+# Заголовки пояснений, которые добавляет inheritance.engine.share_structure
+NOTE_TITLES = (
+    "Предупреждение",
+    "Предупреждение о вере",
+    "О завещании (васия)",
+    "О доле мужа",
+    "О доле жены",
+    "О доле отца",
+    "О доле матери",
+    "О доле дедушки",
+    "О доле бабушки",
+    "О доле детей",
+    "О доле внуков",
+    "О доле сестер",
+    "О доле братьев и сестер",
+)
+
+# В остатке мужчине достается две части, женщине одна
+MALE_HEIRS = frozenset((Heir.SONS, Heir.GRANDSONS, Heir.SIBLINGS_BROTHERS, Heir.COUSINS_BROTHERS))
+
+# Почему наследник не получает долю: (один наследник, несколько)
+REASONS = {
+    Reason.CHILDREN: ("Не получает долю, так как есть сыновья/дочери покойного",
+                      "Не получают долю, так как есть сыновья/дочери покойного"),
+    Reason.DESCENDANTS: ("Не получает долю, так как есть прямые потомки (сыновья/дочери/внуки/внучки)",
+                         "Не получают долю, так как есть прямые потомки (сыновья/дочери/внуки/внучки)"),
+    Reason.SIBLINGS: ("Не получает долю, так как есть родные братья/сестры",
+                      "Не получают долю, так как есть родные братья/сестры"),
+}
+# Подробный вариант (calculate.py) и краткий (calculate2.py)
+GRANDFATHER_BLOCKED = {
+    True: "Не получает долю, так как отец жив. По исламскому праву, наличие отца блокирует право деда на наследство, поскольку отец является более близким родственником к умершему.",
+    False: "Не получает долю, так как отец жив",
+}
+GRANDMOTHER_BLOCKED = {
+    True: "Не получает долю, так как мать жива. По исламскому праву, наличие матери блокирует право бабушки на наследство, поскольку мать является более близким родственником к умершему.",
+    False: "Не получает долю, так как мать жива",
+}
+
+NOTHING_TO_DISTRIBUTE = "После выплаты долгов не осталось средств для распределения"
+
+
+class InheritanceResult(TypedDict):
+    """Shares keyed by the display name of the heir, see :func:`result_dicts`."""
+    amounts: Dict[str, Union[Decimal, str]]  # Денежные суммы в рублях с точностью до копейки
+    fractions: Dict[str, str]  # Дроби по исламскому праву
+    percentages: Dict[str, float]  # Проценты
+    explanations: Dict[str, str]  # Объяснения для наследников без доли
+    asl: int  # Общее основание долей (асль аль-масаля)
+    shares: Dict[str, int]  # Доли наследников в частях от основания
+
+
+def heir_label(heir: Heir, count: int = 1) -> str:
+    """Display name of an heir group: "Сын" or "Сыновья (3)"."""
+    names = HEIR_NAMES[heir]
+    if count > 1:
+        return f"{names.plural} ({count})"
+    return names.single
+
+
+def fraction_label(share: HeirShare) -> str:
+    """Islamic share of every heir of the group, as the rule states it."""
+    if share.rule is Rule.WILL:
+        return "≤1/3"
+    if share.rule is Rule.RESIDUE:
+        return "Остаток"
+    if share.rule is Rule.RESIDUE_SPLIT:
+        return f"{2 if share.heir in MALE_HEIRS else 1}/{share.residue_parts} остатка"
+    fraction = Fraction(share.numerator, share.denominator)
+    if share.rule is Rule.FIXED_SHARED:
+        return f"{fraction} ÷ {share.count}"
+    return str(fraction)
+
+
+def percentage(share: HeirShare) -> float:
+    """Percentage of the net inheritance of every heir of the group."""
+    # Integer division is correctly rounded, like float(Fraction(...))
+    return share.numerator * 100 / (share.denominator * share.count)
+
+
+def explanation(heir: Heir, count: int, reason: Reason, detailed: bool) -> str:
+    if reason is Reason.FATHER:
+        return GRANDFATHER_BLOCKED[detailed]
+    if reason is Reason.MOTHER:
+        return GRANDMOTHER_BLOCKED[detailed]
+    return REASONS[reason][count > 1]
+
+
+def _explanations(result: InheritanceShares) -> Iterator[Tuple[str, str]]:
+    yield from result.notes
+    for exclusion in result.exclusions:
+        yield (heir_label(exclusion.heir, exclusion.count),
+               explanation(exclusion.heir, exclusion.count, exclusion.reason, result.detailed))
+
+
+def result_dicts(result: InheritanceShares) -> InheritanceResult:
+    """The shares as dicts keyed by the display names of the heirs.
+
+    A group of several heirs has a line with the total amount under its
+    plural name and a line per heir under the "Каждому ..." name.
+    """
+    if not result.net_inheritance:
+        return {"amounts": {"Ошибка": NOTHING_TO_DISTRIBUTE}, "fractions": {}, "percentages": {},
+                "explanations": {}, "asl": 1, "shares": {}}
+
+    amounts = {}
+    fractions = {}
+    percentages = {}
+    shares = {}
+    for share in result.heirs:
+        label = heir_label(share.heir, share.count)
+        amounts[label] = to_rubles(share.amount)
+        shares[label] = share.numerator
+        if share.count > 1:
+            label = HEIR_NAMES[share.heir].each
+            amounts[label] = to_rubles(divide_half_up(share.amount, share.count))
+            shares[label] = share.numerator // share.count
+        fractions[label] = fraction_label(share)
+        percentages[label] = percentage(share)
+    return {
+        'amounts': amounts,
+        'fractions': fractions,
+        'percentages': percentages,
+        'explanations': dict(_explanations(result)),
+        'asl': result.asl,
+        'shares': shares,
+    }
+
+
+def _match_emoji(name: str) -> str:
+    """Guess the emoji of a free-form heir name by its word stems."""
+    name = name.lower()
+    if "завещание" in name or "васия" in name:
+        return "📜"
+    elif "муж" in name:
+        return "👨‍❤️‍👨"
+    elif "жена" in name:
+        return "👩‍❤️‍👨"
+    elif "сын" in name:
+        return "👦"
+    elif "дочь" in name or "дочер" in name:
+        return "👧"
+    elif "отец" in name:
+        return "👨‍🦳"
+    elif "дедушк" in name:
+        return "👴"
+    elif "бабушк" in name:
+        return "👵"
+    elif "мать" in name or "матер" in name:
+        return "👩‍🦳"
+    elif "брат" in name:
+        return "👬"
+    elif "сестр" in name:
+        return "👭"
+    elif "внучк" in name:
+        return "👧"
+    elif "внук" in name:
+        return "👦"
+    else:
+        return DEFAULT_EMOJI
+
+
+NOTE_EMOJI = {title: _match_emoji(title) for title in NOTE_TITLES}
+
+# Эмодзи по любому имени наследника без количества, а также по заголовкам пояснений
+EMOJI_BY_NAME = dict(NOTE_EMOJI)
+for _names in HEIR_NAMES.values():
+    EMOJI_BY_NAME.update(dict.fromkeys(filter(None, _names[1:]), _names.emoji))
+del _names
+
+
+# Функция для получения эмодзи в зависимости от типа наследника
+def get_emoji_for_heir(heir_name):
+    """Emoji for a display name such as "Сыновья (3)" or "О доле матери"."""
+    emoji = EMOJI_BY_NAME.get(heir_name)
+    if emoji is None:
+        # "Сыновья (3)" -> "Сыновья"
+        emoji = EMOJI_BY_NAME.get(heir_name.rpartition(" (")[0]) or _match_emoji(heir_name)
+    return emoji
+
+
+class Templates(NamedTuple):
+    """Message templates of an output target, see :class:`Renderer`."""
+    header: str
+    will: str
+    net: str
+    heir: str  # Строка распределения
+    message: str  # Наследник с пояснением или ошибкой вместо суммы
+    no_shares: str
+    explanations: str  # Заголовок раздела "Наследники без доли"
+    footer: str
+    escape: Callable[[str], str] = str  # Экранирование имен и текстов
+
+
+MARKDOWN = Templates(
+    header=("📋 *РЕЗУЛЬТАТЫ РАСЧЕТА НАСЛЕДСТВА*\n\n"
+            "💰 *Общая сумма наследства:* {total:.2f} ₽\n"
+            "💸 *Долги:* {debts:.2f} ₽\n"),
+    will="📜 *Сумма по завещанию:* {will:.2f} ₽ (≤1/3 от наследства)\n",
+    net=("🏦 *Чистая сумма для распределения:* {net:.2f} ₽\n\n"
+         "*Распределение наследства:*\n\n"),
+    heir=("{emoji} *{name}:*\n"
+          "• 💰 Сумма: {amount:.2f} ₽\n"
+          "• 📊 Процент: {percent:.2f}%\n"
+          "• ⚖️ Исламская доля: {fraction}\n\n"),
+    message="{emoji} *{name}:* {text}\n\n",
+    no_shares="❌ Не удалось рассчитать доли наследства.\n",
+    explanations="*Наследники без доли:*\n\n",
+    footer=("✅ Расчет выполнен согласно исламским законам наследования.\n"
+            "ℹ️ Для нового расчета используйте команду /start\n"
+            "💰 Чтобы поддержать проект: используйте кнопку \"Донат\"\n"
+            "💬 Для отзывов и предложений: используйте кнопку \"Отзывы и предложения\""),
+)
+PLAIN_TEXT = Templates(*(template.replace("*", "") for template in MARKDOWN[:-1]))
+HTML = Templates(*(re.sub(r"\*([^*]+)\*", r"<b>\1</b>", template) for template in MARKDOWN[:-1]),
+                 escape=partial(html.escape, quote=False))
+
+
+def _share_lines(result: InheritanceShares, net_inheritance: float) -> Iterator[tuple]:
+    """(display name, emoji, amount, percentage, fraction, text) of every line of the distribution."""
+    if not result.net_inheritance:
+        yield "Ошибка", DEFAULT_EMOJI, None, None, None, NOTHING_TO_DISTRIBUTE
+        return
+    for share in result.heirs:
+        names = HEIR_NAMES[share.heir]
+        amount = share.amount / 100  # Рубли из копеек, как float(to_rubles(...))
+        if share.count > 1:
+            # Сумма на всю группу, доля указывается для каждого наследника
+            percent = (amount / net_inheritance) * 100 if net_inheritance > 0 else 0
+            yield heir_label(share.heir, share.count), names.emoji, amount, percent, "Расчетная доля", None
+            yield (names.each, names.emoji, divide_half_up(share.amount, share.count) / 100,
+                   percentage(share), fraction_label(share), None)
+        else:
+            yield names.single, names.emoji, amount, percentage(share), fraction_label(share), None
+
+
+def _explanation_lines(result: InheritanceShares) -> Iterator[Tuple[str, str, str]]:
+    """(display name, emoji, text) of every note and every heir without a share."""
+    for title, text in result.notes:
+        yield title, NOTE_EMOJI.get(title) or _match_emoji(title), text
+    for exclusion in result.exclusions:
+        yield (heir_label(exclusion.heir, exclusion.count), HEIR_NAMES[exclusion.heir].emoji,
+               explanation(exclusion.heir, exclusion.count, exclusion.reason, result.detailed))
+
+
+def _dict_lines(shares_data, net_inheritance: float) -> Iterator[tuple]:
+    """Lines like :func:`_share_lines` of a result in the dict format."""
+    if isinstance(shares_data, dict) and 'amounts' in shares_data:
+        amounts = shares_data.get('amounts', {})
+        fractions = shares_data.get('fractions', {})
+        percentages = shares_data.get('percentages', {})
+    else:
+        # Старый формат данных (обратная совместимость)
+        amounts = shares_data
+        fractions = {}
+        percentages = {}
+
+    for heir, amount in amounts.items():
+        # Обрабатываем значение, чтобы убедиться, что это число
+        try:
+            amount_value = amount if isinstance(amount, (int, float)) else float(amount)
+        except (ValueError, TypeError):
+            yield heir, get_emoji_for_heir(heir), None, None, None, amount
+            continue
+        if heir in percentages:
+            percent = percentages[heir]
+        else:
+            # Вычисляем процент, если он не предоставлен
+            percent = (amount_value / net_inheritance) * 100 if net_inheritance > 0 else 0
+        yield heir, get_emoji_for_heir(heir), amount_value, percent, fractions.get(heir, "Расчетная доля"), None
+
+
+def _dict_explanation_lines(shares_data) -> Iterator[Tuple[str, str, str]]:
+    explanations = shares_data.get('explanations', {}) if isinstance(shares_data, dict) else {}
+    for heir, text in explanations.items():
+        yield heir, get_emoji_for_heir(heir), text
+
+
+class Renderer:
+    """Renders calculation results with the templates of an output target.
+
+    The ``format`` methods of the templates are looked up once; a message is
+    collected as a list of parts and joined at the end.
+    """
+
+    def __init__(self, templates: Templates):
+        self.templates = templates
+        self._header = templates.header.format
+        self._will = templates.will.format
+        self._net = templates.net.format
+        self._heir = templates.heir.format
+        self._message = templates.message.format
+        self._escape = templates.escape
+
+    def render(self, user_data: Mapping, shares_data) -> str:
+        """Render the result of the calculation for the answers in ``user_data``.
+
+        ``shares_data`` is the :class:`~inheritance.engine.InheritanceShares` of
+        the calculation; dicts in the format of :func:`result_dicts` are
+        accepted as well.
+        """
+        total_inheritance = float(user_data.get('total_inheritance', 0))
+        debts = float(user_data.get('debts', 0))
+        has_will = user_data.get('has_will', False)
+        will_amount = float(user_data.get('will_amount', 0)) if has_will else 0
+        net_inheritance = total_inheritance - debts
+
+        if isinstance(shares_data, InheritanceShares):
+            lines = _share_lines(shares_data, net_inheritance)
+            explanations = _explanation_lines(shares_data)
+        else:
+            lines = _dict_lines(shares_data, net_inheritance)
+            explanations = _dict_explanation_lines(shares_data)
+
+        escape = self._escape
+        parts = [self._header(total=total_inheritance, debts=debts)]
+        if has_will and will_amount > 0:
+            parts.append(self._will(will=will_amount))
+        parts.append(self._net(net=net_inheritance))
+
+        # Наследники по алфавиту
+        lines = sorted(lines, key=itemgetter(0))
+        if not lines:
+            parts.append(self.templates.no_shares)
+        heir = self._heir
+        message = self._message
+        for name, emoji, amount, percent, fraction, text in lines:
+            if text is None:
+                parts.append(heir(emoji=emoji, name=escape(name), amount=amount, percent=percent,
+                                  fraction=escape(fraction)))
+            else:
+                parts.append(message(emoji=emoji, name=escape(name), text=escape(str(text))))
+
+        # Добавляем информацию о наследниках, которые не получают доли
+        explanations = sorted(explanations)
+        if explanations:
+            parts.append(self.templates.explanations)
+            for name, emoji, text in explanations:
+                parts.append(message(emoji=emoji, name=escape(name), text=escape(text)))
+
+        parts.append(self.templates.footer)
+        return "".join(parts)
+
+
+RENDERERS = {
+    'markdown': Renderer(MARKDOWN),
+    'text': Renderer(PLAIN_TEXT),
+    'html': Renderer(HTML),
+}
+
+
+def render_response(user_data: Mapping, shares_data, target: str = 'markdown') -> str:
+    """Render the result for an output target: ``markdown`` (Telegram), ``text`` or ``html``."""
+    return RENDERERS[target].render(user_data, shares_data)
+
+
+def format_inheritance_response(user_data: Mapping, shares_data) -> str:
+    """Format the inheritance calculation results for display (Telegram Markdown)."""
+    return RENDERERS['markdown'].render(user_data, shares_data)
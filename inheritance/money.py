@@ -0,0 +1,43 @@
+"""Exact money helpers: rubles are converted to integer kopecks only at the end."""
+from decimal import Decimal, ROUND_HALF_UP
+from typing import List, Sequence, Union
+
+KOPECK = Decimal('0.01')
+
+
+def to_kopecks(value: Union[int, float, str, Decimal]) -> int:
+    """Convert an amount in rubles to whole kopecks (half up)."""
+    # str() keeps the decimal digits the user typed instead of the binary float
+    rubles = Decimal(str(value)).quantize(KOPECK, rounding=ROUND_HALF_UP)
+    return int(rubles * 100)
+
+
+def to_rubles(kopecks: int) -> Decimal:
+    """Convert whole kopecks to rubles."""
+    return Decimal(kopecks).scaleb(-2)
+
+
+def divide_half_up(numerator: int, denominator: int) -> int:
+    """Divide integers rounding the quotient half up."""
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+def allocate(parts: Sequence[int], base: int, total: int) -> List[int]:
+    """Split ``total`` kopecks in proportion ``parts / base`` with the largest remainder method.
+
+    Every amount is rounded down, then the kopecks missing up to the rounded
+    total go to the amounts with the largest fractional parts (earlier amounts
+    win ties). The result always adds up to the rounded total.
+    """
+    floors = []
+    remainders = []
+    for part in parts:
+        amount, remainder = divmod(part * total, base)
+        floors.append(amount)
+        remainders.append(remainder)
+    missing = divide_half_up(sum(parts) * total, base) - sum(floors)
+    if missing:
+        by_remainder = sorted(range(len(parts)), key=remainders.__getitem__, reverse=True)
+        for i in by_remainder[:missing]:
+            floors[i] += 1
+    return floors
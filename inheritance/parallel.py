@@ -0,0 +1,57 @@
+"""Ordered parallel map of chunks over a process pool with bounded memory.
+
+At most ``workers * prefetch`` chunks are submitted but not yet consumed: the
+next chunk is only read from the input once the oldest result is taken, so a
+slow consumer slows the reading down instead of piling results up in memory.
+"""
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+DEFAULT_PREFETCH = 2
+
+
+def default_workers() -> int:
+    """Number of CPUs this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _call_list(function: Callable[[List[T]], Iterable[R]], chunk: List[T]) -> List[R]:
+    # Generators cannot be sent back from a worker process
+    return list(function(chunk))
+
+
+def map_chunks(function: Callable[[List[T]], Iterable[R]], chunks: Iterable[List[T]],
+               workers: Optional[int] = None, prefetch: int = DEFAULT_PREFETCH,
+               executor: Optional[Executor] = None) -> Iterator[List[R]]:
+    """Yield ``list(function(chunk))`` for every chunk, in input order.
+
+    ``function`` must be a module-level function so that it can be pickled.
+    A passed ``executor`` is left open; otherwise a pool of ``workers``
+    processes is created and shut down when the iteration ends.
+    """
+    workers = workers or default_workers()
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    task = partial(_call_list, function)
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(executor.submit(task, chunk))
+            if len(pending) >= workers * prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=True)
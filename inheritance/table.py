@@ -0,0 +1,192 @@
+"""Precomputed lookup table of the shares of every bounded family composition.
+
+The shares of an estate without a will depend only on the family
+composition, and only a few counts matter for a given composition: with
+children the grandchildren, siblings and cousins get nothing, and brothers
+leave nothing to the cousins. The table stores the shares of every such
+normalized composition with counts up to ``bound``. A lookup is a single index
+computation into a read-only memory map, so worker processes share the pages.
+
+Building the table needs numpy (see requirements-batch.txt), reading it does not::
+
+    python -m inheritance.table build shares.tbl --bound 20
+"""
+import argparse
+import mmap
+import struct
+from typing import List, NamedTuple, Optional, Tuple
+
+from inheritance.engine import HEIR_GROUPS, Composition
+from inheritance.money import allocate
+
+MAGIC = b'MIRASTBL'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIQ')  # magic, version, bound, columns, rows
+HEADER_SIZE = 32
+
+# Heir groups of the engine without the will
+TABLE_COLUMNS = HEIR_GROUPS[1:]
+# asl, bit mask of the present heir groups, parts of every heir group
+ROW = struct.Struct(f'<iI{len(TABLE_COLUMNS)}i')
+
+DEFAULT_BOUND = 20
+
+
+class TableEntry(NamedTuple):
+    """Shares of a family composition: ``parts[j] / asl`` of the net inheritance."""
+    asl: int
+    present: Tuple[bool, ...]
+    parts: Tuple[int, ...]
+
+
+def _block_sizes(bound: int) -> Tuple[int, int]:
+    """Rows per pair of descendant counts and rows per combination of the flags."""
+    size = bound + 1
+    descendants = (size * size - 1) * 2  # (sons, daughters) or (grandsons, granddaughters) x siblings
+    return descendants, 2 * descendants + bound * size + size ** 3
+
+
+def table_index(composition: Composition, bound: int) -> Optional[int]:
+    """Row of the composition in a table built with ``bound``, or None if it is not covered."""
+    size = bound + 1
+    descendants, rows_per_flags = _block_sizes(bound)
+    c = composition
+    flags = (c.has_spouse | c.has_wife << 1 | c.has_father << 2 | c.has_mother << 3
+             | c.has_grandfather << 4 | c.has_grandmother << 5)
+    # Siblings and cousins reduce the share of the mother even when they inherit nothing
+    has_siblings = (c.num_siblings_brothers > 0 or c.num_siblings_sisters > 0
+                    or c.num_cousins_brothers > 0 or c.num_cousins_sisters > 0)
+
+    if c.num_sons or c.num_daughters:
+        if c.num_sons > bound or c.num_daughters > bound:
+            return None
+        row = (c.num_sons * size + c.num_daughters - 1) * 2 + has_siblings
+    elif c.num_grandsons or c.num_granddaughters:
+        if c.num_grandsons > bound or c.num_granddaughters > bound:
+            return None
+        row = descendants + (c.num_grandsons * size + c.num_granddaughters - 1) * 2 + has_siblings
+    elif c.num_siblings_brothers:
+        if c.num_siblings_brothers > bound or c.num_siblings_sisters > bound:
+            return None
+        row = 2 * descendants + (c.num_siblings_brothers - 1) * size + c.num_siblings_sisters
+    else:
+        if max(c.num_siblings_sisters, c.num_cousins_brothers, c.num_cousins_sisters) > bound:
+            return None
+        row = (2 * descendants + bound * size
+               + (c.num_siblings_sisters * size + c.num_cousins_brothers) * size + c.num_cousins_sisters)
+    return flags * rows_per_flags + row
+
+
+def _representatives(bound: int) -> List[Tuple[int, ...]]:
+    """Counts (daughters, sons, granddaughters, grandsons, sisters, brothers,
+    cousin sisters, cousin brothers) of one composition per row, in row order."""
+    size = bound + 1
+    rows = []
+    for sons in range(size):
+        for daughters in range(size):
+            if sons or daughters:
+                for has_siblings in (0, 1):
+                    rows.append((daughters, sons, 0, 0, 0, 0, has_siblings, 0))
+    for grandsons in range(size):
+        for granddaughters in range(size):
+            if grandsons or granddaughters:
+                for has_siblings in (0, 1):
+                    rows.append((0, 0, granddaughters, grandsons, 0, 0, has_siblings, 0))
+    for brothers in range(1, size):
+        for sisters in range(size):
+            rows.append((0, 0, 0, 0, sisters, brothers, 0, 0))
+    for sisters in range(size):
+        for cousins_brothers in range(size):
+            for cousins_sisters in range(size):
+                rows.append((0, 0, 0, 0, sisters, 0, cousins_sisters, cousins_brothers))
+    return rows
+
+
+def build_table(path: str, bound: int = DEFAULT_BOUND) -> int:
+    """Write the table of every composition with counts up to ``bound``; returns the row count."""
+    import numpy as np
+
+    from inheritance.vectorized import calculate_batch
+
+    counts = np.array(_representatives(bound), dtype=np.int64)
+    flag_names = ('has_spouse', 'has_wife', 'has_father', 'has_mother', 'has_grandfather', 'has_grandmother')
+    count_names = ('num_daughters', 'num_sons', 'num_granddaughters', 'num_grandsons',
+                   'num_siblings_sisters', 'num_siblings_brothers', 'num_cousins_sisters', 'num_cousins_brothers')
+    flags = np.arange(2 ** len(flag_names)).repeat(len(counts))
+    columns = {name: (flags >> bit) & 1 for bit, name in enumerate(flag_names)}
+    columns.update({name: np.tile(counts[:, i], 2 ** len(flag_names)) for i, name in enumerate(count_names)})
+    # Without a will the shares do not depend on the amount
+    columns['total_inheritance'] = np.ones(len(flags), dtype=np.int64)
+
+    result = calculate_batch(columns)
+    if result.overflow.any():
+        raise ValueError(f'Доли не помещаются в 64 бита при bound={bound}')
+    heirs = [HEIR_GROUPS.index(name) for name in TABLE_COLUMNS]
+    parts = result.parts[:, heirs]
+    if np.abs(parts).max() >= 2 ** 31 or result.asl.max() >= 2 ** 31:
+        raise ValueError(f'Доли не помещаются в 32 бита при bound={bound}')
+
+    rows = np.zeros(len(flags), dtype=np.dtype([('asl', '<i4'), ('present', '<u4'),
+                                                ('parts', '<i4', len(TABLE_COLUMNS))]))
+    rows['asl'] = result.asl
+    rows['present'] = (result.present[:, heirs] << np.arange(len(TABLE_COLUMNS))).sum(axis=1)
+    rows['parts'] = parts
+
+    with open(path, 'wb') as table:
+        table.write(HEADER.pack(MAGIC, VERSION, bound, len(TABLE_COLUMNS), len(rows)).ljust(HEADER_SIZE, b'\0'))
+        table.write(rows.tobytes())
+    return len(rows)
+
+
+class ShareTable:
+    """Read-only memory-mapped share table."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as table:
+            self._map = mmap.mmap(table.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.bound, columns, self.rows = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION or columns != len(TABLE_COLUMNS):
+            self._map.close()
+            raise ValueError(f'{path} не является таблицей долей версии {VERSION}')
+
+    def lookup(self, composition: Composition) -> Optional[TableEntry]:
+        """Shares of the composition, or None if its counts exceed the bound."""
+        index = table_index(composition, self.bound)
+        if index is None:
+            return None
+        asl, present, *parts = ROW.unpack_from(self._map, HEADER_SIZE + index * ROW.size)
+        return TableEntry(asl, tuple(bool(present >> i & 1) for i in range(len(parts))), tuple(parts))
+
+    def kopecks(self, composition: Composition, net_inheritance: int) -> Optional[List[int]]:
+        """Amounts of every heir group for ``net_inheritance`` kopecks without a will."""
+        entry = self.lookup(composition)
+        if entry is None:
+            return None
+        return allocate(entry.parts, entry.asl, net_inheritance)
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m inheritance.table',
+                                     description='Таблица долей для всех составов семьи')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='построить таблицу')
+    build.add_argument('path')
+    build.add_argument('--bound', type=int, default=DEFAULT_BOUND,
+                       help='наибольшее количество наследников одной группы (по умолчанию %(default)s)')
+    args = parser.parse_args(argv)
+
+    rows = build_table(args.path, args.bound)
+    print(f'{args.path}: {rows} составов семьи, {HEADER_SIZE + rows * ROW.size} байт')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""Vectorized batch calculation over columnar scenario arrays.
+
+Requires numpy (see requirements-batch.txt). Every rule branch of
+:func:`inheritance.engine.share_structure` is applied as a mask over all rows
+at once; the results match the scalar engine exactly, including the kopeck
+allocation. Explanations are not produced in batch mode.
+
+The arithmetic is in int64. Rows whose amounts could overflow it are not
+calculated and are marked in ``BatchResult.overflow``; the scalar engine
+handles them with Python integers.
+"""
+from typing import Mapping, NamedTuple, Optional
+
+import numpy as np
+
+from inheritance.engine import ESTATE_FIELDS, HEIR_GROUPS
+from inheritance.money import to_kopecks
+
+# Columns of the share matrices, in the order the scalar engine adds its lines
+HEIR_COLUMNS = HEIR_GROUPS
+(WILL, HUSBAND, WIFE, FATHER, MOTHER, GRANDFATHER, GRANDMOTHER, SONS, DAUGHTERS,
+ GRANDSONS, GRANDDAUGHTERS, SIBLINGS_BROTHERS, SIBLINGS_SISTERS, COUSINS_BROTHERS,
+ COUSINS_SISTERS) = range(len(HEIR_COLUMNS))
+
+MONEY_FIELDS = ('total_inheritance', 'debts', 'will_amount')
+
+# Fixed shares are multiples of 1/24 and the will is capped at 1/3, so every
+# amount is a whole number of 1/72 kopecks before the residue is split
+UNIT = 72
+
+# Estimates of the intermediate values are compared with this, with a margin for the float rounding
+INT64_LIMIT = 2.0 ** 62
+
+
+class BatchResult(NamedTuple):
+    """Shares of every scenario: one row per estate, one column per heir group.
+
+    ``parts[i, j] / asl[i]`` is the exact share of the net inheritance of heir
+    group ``HEIR_COLUMNS[j]``; ``kopecks`` are the allocated amounts.
+    """
+    net: np.ndarray  # (n,) net inheritance in kopecks
+    valid: np.ndarray  # (n,) False where nothing is left after the debts
+    present: np.ndarray  # (n, heirs) the scalar engine has a line for the heir group
+    asl: np.ndarray  # (n,) common base of the shares
+    parts: np.ndarray  # (n, heirs) shares in parts of the base
+    kopecks: np.ndarray  # (n, heirs) allocated amounts
+    overflow: np.ndarray  # (n,) too large for int64, not calculated
+
+
+def to_kopecks_array(values) -> np.ndarray:
+    """Convert amounts in rubles to whole kopecks, exactly like :func:`to_kopecks`."""
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu':
+        return values.astype(np.int64) * 100
+    values = values.astype(np.float64)
+    scaled = values * 100
+    kopecks = np.rint(scaled).astype(np.int64)
+    # Only amounts with a half kopeck can round differently in binary and decimal
+    halves = np.flatnonzero(np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) < 1e-6)
+    for i in halves:
+        kopecks[i] = to_kopecks(float(values[i]))
+    return kopecks
+
+
+def _column(columns: Mapping, name: str, size: int, dtype, skip: Optional[np.ndarray] = None) -> np.ndarray:
+    """The column converted to ``dtype``; the ``skip`` rows are zeroed first, their values may not fit it."""
+    if name not in columns:
+        return np.zeros(size, dtype=dtype)
+    values = np.asarray(columns[name])
+    if skip is not None:
+        values = np.where(skip, 0, values)
+    return values.astype(dtype)
+
+
+def _overflows(columns: Mapping, size: int) -> np.ndarray:
+    """Rows whose intermediate values could exceed int64."""
+    amount = np.zeros(size)
+    for name in MONEY_FIELDS:
+        if name in columns:
+            amount = np.maximum(amount, np.abs(_column(columns, name, size, np.float64)))
+    counts = np.array([_column(columns, name, size, np.float64) for name in ESTATE_FIELDS
+                       if name.startswith('num_')])
+    parts = 1 + 2 * counts.sum(axis=0)
+    heads = np.maximum(counts, 1).prod(axis=0)
+    # Kopecks in 1/72 units, times the parts of the residue and the group sizes in the common base,
+    # doubled by the rounding; NaN fails the comparison too
+    return ~(amount * 100 * 2 * UNIT * parts * heads < INT64_LIMIT)
+
+
+def _rank_descending(values: np.ndarray) -> np.ndarray:
+    """Rank of every value within its row, largest first, earlier columns win ties."""
+    order = np.argsort(-values, axis=1, kind='stable')
+    return np.argsort(order, axis=1)
+
+
+def calculate_batch(columns: Mapping) -> BatchResult:
+    """Calculate the shares of many estates given as columns.
+
+    ``columns`` maps the ``user_data`` keys to equally long arrays; missing
+    keys default to zero/False like in the bot.
+    """
+    size = max(len(np.asarray(columns[name]).reshape(-1)) for name in columns)
+
+    overflow = _overflows(columns, size)
+    money = {name: to_kopecks_array(np.where(overflow, 0, columns[name])) if name in columns
+             else np.zeros(size, dtype=np.int64)
+             for name in MONEY_FIELDS}
+    flags = {name: _column(columns, name, size, bool) for name in ESTATE_FIELDS
+             if name.startswith(('has_', 'is_'))}
+    counts = {name: _column(columns, name, size, np.int64, overflow) for name in ESTATE_FIELDS
+              if name.startswith('num_')}
+
+    net = np.maximum(0, money['total_inheritance'] - money['debts'])
+    valid = net > 0
+    will = np.where(flags['has_will'], money['will_amount'], 0)
+    # Three times the will amount, capped at 1/3 of the net inheritance
+    will3 = np.minimum(3 * will, net)
+
+    sons = counts['num_sons']
+    daughters = counts['num_daughters']
+    grandsons = counts['num_grandsons']
+    granddaughters = counts['num_granddaughters']
+    brothers = counts['num_siblings_brothers']
+    sisters = counts['num_siblings_sisters']
+    cousins_brothers = counts['num_cousins_brothers']
+    cousins_sisters = counts['num_cousins_sisters']
+    has_father = flags['has_father']
+    has_mother = flags['has_mother']
+
+    heirs = len(HEIR_COLUMNS)
+    values = np.zeros((size, heirs), dtype=np.int64, order='F')  # amounts in 1/72 kopecks
+    present = np.zeros((size, heirs), dtype=bool, order='F')
+    heads = np.ones((size, heirs), dtype=np.int64, order='F')
+    # Amount split between the residuary heirs: values of the split columns are
+    # multiplied by the number of parts, all other columns get multiplied at the end
+    split_parts = np.ones(size, dtype=np.int64)
+    split = np.zeros((size, heirs), dtype=bool, order='F')
+
+    def give(column, mask, amount):
+        values[:, column] = np.where(mask, amount, values[:, column])
+        present[:, column] |= mask
+
+    def split_remaining(mask, remaining, male, num_male, female, num_female):
+        parts = np.where(mask, 2 * num_male + num_female, 1)
+        split_parts[:] = np.where(mask, parts, split_parts)
+        for column, count, multiplier in ((male, num_male, 2), (female, num_female, 1)):
+            has = mask & (count > 0)
+            give(column, has, remaining * multiplier * count)
+            heads[:, column] = np.where(has, count, heads[:, column])
+            split[:, column] |= has
+
+    remaining = UNIT * net
+    has_will = will > 0
+    give(WILL, has_will, 24 * will3)
+    remaining = remaining - np.where(has_will, 24 * will3, 0)
+
+    has_children = (sons > 0) | (daughters > 0)
+    has_descendants = has_children | (grandsons > 0) | (granddaughters > 0)
+
+    husband = np.where(has_descendants, 18, 36) * net
+    give(HUSBAND, flags['has_spouse'], husband)
+    remaining = remaining - np.where(flags['has_spouse'], husband, 0)
+
+    wife = np.where(has_descendants, 9, 18) * net
+    give(WIFE, flags['has_wife'], wife)
+    remaining = remaining - np.where(flags['has_wife'], wife, 0)
+
+    father = np.where(sons > 0, 12 * net, remaining)
+    give(FATHER, has_father, father)
+    remaining = remaining - np.where(has_father, father, 0)
+
+    has_siblings = (brothers > 0) | (sisters > 0) | (cousins_brothers > 0) | (cousins_sisters > 0)
+    mother = np.where(has_children | has_siblings, 12, 24) * net
+    give(MOTHER, has_mother, mother)
+    remaining = remaining - np.where(has_mother, mother, 0)
+
+    has_grandfather = flags['has_grandfather'] & ~has_father
+    give(GRANDFATHER, has_grandfather, 12 * net)
+    remaining = remaining - np.where(has_grandfather, 12 * net, 0)
+
+    has_grandmother = flags['has_grandmother'] & ~has_mother
+    give(GRANDMOTHER, has_grandmother, 12 * net)
+    remaining = remaining - np.where(has_grandmother, 12 * net, 0)
+
+    split_remaining(has_children, remaining, SONS, sons, DAUGHTERS, daughters)
+    remaining = np.where(has_children, 0, remaining)
+
+    to_grandchildren = ~has_children & (remaining > 0) & ((grandsons > 0) | (granddaughters > 0))
+    split_remaining(to_grandchildren, remaining, GRANDSONS, grandsons, GRANDDAUGHTERS, granddaughters)
+    remaining = np.where(to_grandchildren, 0, remaining)
+
+    to_siblings = (remaining > 0) & ((brothers > 0) | (sisters > 0))
+    special_sisters = to_siblings & ~has_descendants & (brothers == 0) & (sisters > 0) & ~has_father
+    sisters_share = np.where(sisters == 1, 36, 48) * net
+    give(SIBLINGS_SISTERS, special_sisters, sisters_share)
+    heads[:, SIBLINGS_SISTERS] = np.where(special_sisters, sisters, 1)
+    remaining = remaining - np.where(special_sisters, sisters_share, 0)
+    standard_siblings = to_siblings & ~special_sisters
+    split_remaining(standard_siblings, remaining, SIBLINGS_BROTHERS, brothers, SIBLINGS_SISTERS, sisters)
+    remaining = np.where(standard_siblings, 0, remaining)
+
+    to_cousins = (remaining > 0) & ((cousins_brothers > 0) | (cousins_sisters > 0))
+    split_remaining(to_cousins, remaining, COUSINS_BROTHERS, cousins_brothers, COUSINS_SISTERS, cousins_sisters)
+
+    values = np.where(split, values, values * split_parts[:, None])
+    values[~valid] = 0
+    present[~valid] = False
+    denominator = UNIT * split_parts
+
+    # Largest remainder allocation of whole kopecks, see inheritance.money.allocate
+    kopecks, remainders = np.divmod(values, denominator[:, None])
+    target = (2 * values.sum(axis=1) + denominator) // (2 * denominator)
+    missing = target - kopecks.sum(axis=1)
+    kopecks += _rank_descending(remainders) < missing[:, None]
+
+    # Exact shares of the net inheritance and their common base (asl)
+    whole = denominator * np.where(valid, net, 1)
+    divisor = np.gcd(values, whole[:, None])
+    numerators = values // divisor
+    denominators = whole[:, None] // divisor
+    each_denominators = denominators * heads // np.gcd(numerators, heads)
+    asl = np.lcm.reduce(np.concatenate([denominators, each_denominators], axis=1), axis=1)
+    parts = numerators * (asl[:, None] // denominators)
+
+    return BatchResult(net, valid, present, asl, parts, kopecks, overflow)
+
+
+def columns_from_records(records) -> Mapping[str, np.ndarray]:
+    """Turn ``user_data``-like dicts into the columns :func:`calculate_batch` takes."""
+    records = list(records)
+    return {name: np.array([record.get(name, 0) for record in records])
+            for name in ESTATE_FIELDS}
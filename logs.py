@@ -0,0 +1,176 @@
+"""Structured logging that keeps the formatting off the event loop.
+
+A handler of the bot only puts the log record into a queue; a listener thread
+formats it and writes it to stderr, as one JSON object per line::
+
+    {"time": "2026-10-18T09:30:00.125Z", "level": "WARNING", "logger": "__main__",
+     "message": "Update caused error \\"Timed out\\"", "update_id": 1001, "chat_id": 42, "user_id": 42,
+     "state": 3, "error": "TimedOut"}
+
+Nothing is turned into text in the thread that logs: the arguments of the
+message, the traceback and the fields of an update given as
+``extra={'update': update}`` are only read by the listener. ``state`` (or
+another field) may be a function, it is called when the record is written.
+The record is passed as it is, so the arguments must not change after the
+call; the objects of the Bot API do not.
+
+Records with ``extra={'sample_key': ...}``, e.g. network errors that come in
+series while Telegram is unreachable, are sampled: one record per key every
+``sample_interval`` seconds is written, with the number of the ones skipped
+before it in ``suppressed``.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, TextIO, Union
+
+DEFAULT_SAMPLE_INTERVAL = 60.0  # секунд между записями с одним sample_key
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Fields taken from ``extra``, in the order they are written
+FIELDS = ('update_id', 'chat_id', 'user_id', 'state', 'error', 'suppressed')
+
+# Listener thread started by configure() and the handler it writes with
+_listener: Optional[QueueListener] = None
+_handler: Optional[logging.Handler] = None
+
+
+def update_fields(update: Any) -> Dict[str, Any]:
+    """update_id, chat_id and user_id of an update, the ones it has."""
+    fields = {}
+    update_id = getattr(update, 'update_id', None)
+    if update_id is not None:
+        fields['update_id'] = update_id
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        fields['chat_id'] = chat.id
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        fields['user_id'] = user.id
+    return fields
+
+
+def record_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    """The structured fields of the record; runs in the listener thread."""
+    update = getattr(record, 'update', None)
+    fields = update_fields(update) if update is not None else {}
+    for name in FIELDS:
+        value = getattr(record, name, None)
+        if callable(value):
+            value = value()
+        if value is not None:
+            fields[name] = value
+    return fields
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, the time in UTC."""
+
+    def formatTime(self, record: logging.LogRecord, datefmt: Optional[str] = None) -> str:
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z'
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'time': self.formatTime(record), 'level': record.levelname, 'logger': record.name,
+                 'message': record.getMessage()}
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The usual line with the structured fields appended as ``name=value``."""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        text = super().formatMessage(record)
+        fields = record_fields(record)
+        if fields:
+            text += ' ' + ' '.join(f'{name}={value}' for name, value in fields.items())
+        return text
+
+
+class LazyQueueHandler(QueueHandler):
+    """Puts the record into the queue as it is; ``QueueHandler`` would format the message first."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through one record per ``sample_key`` every ``interval`` seconds, the records without it all."""
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last: Dict[str, float] = {}
+        self._suppressed: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, 'sample_key', None)
+        if key is None:
+            return True
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and record.created - last < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+            self._last[key] = record.created
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+def configure(level: Union[int, str] = logging.INFO, json_format: bool = True,
+              sample_interval: float = DEFAULT_SAMPLE_INTERVAL, stream: Optional[TextIO] = None):
+    """Send the records of the root logger through a queue to a listener thread; it is stopped at exit."""
+    global _listener, _handler
+    shutdown()
+    handler = _handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JSONFormatter() if json_format else TextFormatter())
+    records = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(records)
+    # Sampled out before the queue, so a series of errors costs the event loop next to nothing
+    queue_handler.addFilter(SamplingFilter(sample_interval))
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    _listener = QueueListener(records, handler)
+    _listener.start()
+
+
+def _write_directly():
+    """In a forked process, e.g. of the calculation pool, there is no listener to read the queue."""
+    global _listener
+    if _listener is None:
+        return
+    _listener = None
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(_handler)
+
+
+os.register_at_fork(after_in_child=_write_directly)
+
+
+@atexit.register
+def shutdown():
+    """Write out what is still in the queue and stop the listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,247 @@
+"""Replies of the bot that survive network errors.
+
+A reply is written to the outbox in SQLite before it is sent. If the request
+fails with ``TimedOut`` or ``NetworkError``, the reply stays there and a
+background task sends it again with exponential backoff and jitter, also after
+a restart. The replies of a chat are delivered in the order they were written:
+while one of them waits for a retry, the later ones wait behind it.
+
+Every reply has a key within its chat, e.g. the id of the update it answers,
+and is delivered at most once per ``(chat, key)``: an update that is processed
+again after a restart does not send its replies twice. A request that timed
+out after Telegram had already accepted it is still sent again, the Bot API
+has no way to tell.
+"""
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from telegram import Bot, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_DELAY = 1.0  # секунд до первого повтора
+DEFAULT_MAX_DELAY = 300.0  # секунд между повторами, не больше
+DEFAULT_MAX_ATTEMPTS = 12
+DEFAULT_KEEP = 3600.0  # секунд помнить доставленные ответы
+POLL_INTERVAL = 60.0  # секунд, проверка очереди без новых ошибок
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outbox (
+    chat_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    method TEXT NOT NULL,  -- send_message or edit_message_text
+    params TEXT NOT NULL,  -- JSON
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,  -- time.time()
+    sent REAL,  -- time.time() of the delivery, NULL while pending
+    PRIMARY KEY (chat_id, key)
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (sent, chat_id);
+'''
+METHODS = ('send_message', 'edit_message_text')
+MARKUPS = {'inline_keyboard': InlineKeyboardMarkup, 'keyboard': ReplyKeyboardMarkup,
+           'remove_keyboard': ReplyKeyboardRemove}
+
+
+class OutboxStats(NamedTuple):
+    delivered: int
+    retried: int  # Повторные попытки
+    dropped: int  # Ответы, которые так и не удалось доставить
+    pending: int  # Ответы, ждущие повтора
+
+
+class Entry(NamedTuple):
+    rowid: int
+    chat_id: int
+    key: str
+    method: str
+    params: Dict[str, Any]
+    attempts: int
+
+
+def _markup(data: Optional[dict], bot: Bot):
+    """The keyboard object of ``reply_markup`` as stored in the outbox."""
+    if data is None:
+        return None
+    for field, markup in MARKUPS.items():
+        if field in data:
+            return markup.de_json(data, bot)
+    raise ValueError(f'Неизвестная клавиатура: {data}')
+
+
+class Outbox:
+    """Replies in one SQLite file; every database call runs in the outbox thread."""
+
+    def __init__(self, path: str, base_delay: float = DEFAULT_BASE_DELAY, max_delay: float = DEFAULT_MAX_DELAY,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, keep: float = DEFAULT_KEEP):
+        self.path = path
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.keep = keep
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(SCHEMA)
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='outbox')
+        self._sending: Set[Tuple[int, str]] = set()  # (chat_id, key) being sent right now
+        self._queued: Set[int] = set()  # chats with replies written while another one was being sent
+        self._wakeup: Optional[asyncio.Event] = None
+        self._delivered = self._retried = self._dropped = 0
+
+    async def _db(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def backoff(self, attempts: int) -> float:
+        """Delay before the next attempt: doubles with every attempt, the upper half is random."""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempts)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    # Database calls
+
+    def _insert(self, chat_id: int, key: str, method: str, params: str) -> Tuple[Optional[int], bool]:
+        """Row id of the new reply (None for a duplicate) and whether the chat has earlier ones pending."""
+        with self._connection:
+            queued = self._connection.execute(
+                'SELECT 1 FROM outbox WHERE sent IS NULL AND chat_id = ? LIMIT 1', (chat_id,)).fetchone()
+            cursor = self._connection.execute(
+                'INSERT OR IGNORE INTO outbox (chat_id, key, method, params, next_attempt) VALUES (?, ?, ?, ?, ?)',
+                (chat_id, key, method, params, time.time()))
+        return (cursor.lastrowid if cursor.rowcount else None), queued is not None
+
+    def _sent(self, rowid: int):
+        with self._connection:
+            self._connection.execute('UPDATE outbox SET sent = ? WHERE rowid = ?', (time.time(), rowid))
+
+    def _reschedule(self, rowid: int, attempts: int, next_attempt: float):
+        with self._connection:
+            self._connection.execute('UPDATE outbox SET attempts = ?, next_attempt = ? WHERE rowid = ?',
+                                     (attempts, next_attempt, rowid))
+
+    def _drop(self, rowid: int):
+        with self._connection:
+            self._connection.execute('DELETE FROM outbox WHERE rowid = ?', (rowid,))
+
+    def _due(self, now: float) -> Tuple[List[Entry], Optional[float]]:
+        """The first pending reply of every chat that is due, and when the next one is due."""
+        rows = self._connection.execute(
+            'SELECT rowid, chat_id, key, method, params, attempts, next_attempt FROM outbox WHERE rowid IN '
+            '(SELECT min(rowid) FROM outbox WHERE sent IS NULL GROUP BY chat_id)').fetchall()
+        due = [Entry(rowid, chat_id, key, method, json.loads(params), attempts)
+               for rowid, chat_id, key, method, params, attempts, next_attempt in rows if next_attempt <= now]
+        later = [next_attempt for *_, next_attempt in rows if next_attempt > now]
+        return due, min(later, default=None)
+
+    def _purge(self, before: float):
+        with self._connection:
+            self._connection.execute('DELETE FROM outbox WHERE sent < ?', (before,))
+
+    def _pending(self) -> int:
+        return self._connection.execute('SELECT count(*) FROM outbox WHERE sent IS NULL').fetchone()[0]
+
+    # Delivery
+
+    async def send(self, bot: Bot, chat_id: int, key: str, method: str, **params) -> bool:
+        """Write the reply and send it; False if it is left for a retry or was sent before.
+
+        ``method`` is ``send_message`` or ``edit_message_text`` of the bot;
+        errors other than network errors are raised like from the method.
+        """
+        if method not in METHODS:
+            raise ValueError(f'Неизвестный метод: {method}')
+        params['chat_id'] = chat_id
+        stored = json.dumps(params, ensure_ascii=False, default=lambda value: value.to_dict())
+        rowid, queued = await self._db(self._insert, chat_id, key, method, stored)
+        if rowid is None:
+            return False
+        if queued:
+            # The reply goes after the ones still waiting in this chat
+            self._queued.add(chat_id)
+            self._wake()
+            return False
+        return await self._attempt(bot, Entry(rowid, chat_id, key, method, params, 0), raise_errors=True)
+
+    async def _attempt(self, bot: Bot, entry: Entry, raise_errors: bool = False) -> bool:
+        self._sending.add((entry.chat_id, entry.key))
+        try:
+            params = dict(entry.params)
+            if isinstance(params.get('reply_markup'), dict):
+                params['reply_markup'] = _markup(params['reply_markup'], bot)
+            await getattr(bot, entry.method)(**params)
+        except BadRequest as e:
+            # Telegram rejected the request itself, another attempt would fail the same way
+            return await self._give_up(entry, e, raise_errors)
+        except (RetryAfter, NetworkError) as e:
+            attempts = entry.attempts + 1
+            if attempts >= self.max_attempts:
+                return await self._give_up(entry, e, raise_errors=False)
+            delay = self.backoff(entry.attempts)
+            if isinstance(e, RetryAfter):
+                delay = max(delay, e.retry_after)
+            await self._db(self._reschedule, entry.rowid, attempts, time.time() + delay)
+            # While the network is down every reply fails in turn, the log gets a sample of them
+            logger.warning('Ответ %s в чат %s не отправлен (%s), повтор через %.1f с',
+                           entry.key, entry.chat_id, e, delay,
+                           extra={'chat_id': entry.chat_id, 'sample_key': 'outbox_retry'})
+            self._wake()
+            return False
+        except Exception as e:
+            return await self._give_up(entry, e, raise_errors)
+        else:
+            await self._db(self._sent, entry.rowid)
+            self._delivered += 1
+            if entry.chat_id in self._queued:
+                # The replies written meanwhile can go now
+                self._queued.discard(entry.chat_id)
+                self._wake()
+            return True
+        finally:
+            # Only after the outcome is written, so the delivery task does not send it again
+            self._sending.discard((entry.chat_id, entry.key))
+
+    async def _give_up(self, entry: Entry, error: Exception, raise_errors: bool) -> bool:
+        """Forget the reply; the error goes to the caller or to the log."""
+        await self._db(self._drop, entry.rowid)
+        self._dropped += 1
+        if raise_errors:
+            raise error
+        logger.error('Ответ %s в чат %s не доставлен за %d попыток: %s',
+                     entry.key, entry.chat_id, entry.attempts + 1, error)
+        return False
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self, bot: Bot):
+        """Send the pending replies when they are due; runs until cancelled."""
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            due, next_due = await self._db(self._due, now)
+            due = [entry for entry in due if (entry.chat_id, entry.key) not in self._sending]
+            if due:
+                self._retried += sum(entry.attempts > 0 for entry in due)
+                await asyncio.gather(*(self._attempt(bot, entry) for entry in due))
+                continue
+            await self._db(self._purge, now - self.keep)
+            timeout = POLL_INTERVAL if next_due is None else min(POLL_INTERVAL, max(0.0, next_due - now))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stats(self) -> OutboxStats:
+        return OutboxStats(self._delivered, self._retried, self._dropped, await self._db(self._pending))
+
+    def close(self):
+        self._executor.shutdown()
+        self._connection.close()
@@ -0,0 +1,134 @@
+"""Conversation state and ``user_data`` of the bot stored in SQLite.
+
+The database runs in WAL mode with ``synchronous=NORMAL``, so a commit does
+not wait for fsync. Changes are collected for the persistence interval of the
+application and written in one transaction per batch, which lets a restarted
+bot continue the conversations where the users left them.
+"""
+import asyncio
+import json
+import sqlite3
+from typing import Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+DEFAULT_UPDATE_INTERVAL = 5.0  # секунд
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS data (
+    kind TEXT NOT NULL,  -- user, chat or bot
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,  -- JSON list, e.g. [chat_id, user_id]
+    state TEXT NOT NULL,
+    PRIMARY KEY (name, key)
+);
+'''
+
+
+class SQLitePersistence(BasePersistence):
+    """Persistence of user, chat and bot data and conversations in one SQLite file.
+
+    Values are stored as JSON, so the data must consist of JSON types; the
+    keys of ``user_data`` and ``chat_data`` come back as strings. Callback
+    data is not stored.
+    """
+
+    def __init__(self, path: str, store_data: Optional[PersistenceInput] = None,
+                 update_interval: float = DEFAULT_UPDATE_INTERVAL):
+        store_data = store_data or PersistenceInput()
+        super().__init__(store_data._replace(callback_data=False), update_interval)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(SCHEMA)
+        # (table, kind or conversation name, key) -> JSON value or None to delete
+        self._pending: Dict[Tuple[str, str, str], Optional[str]] = {}
+        self._writer: Optional[asyncio.Task] = None
+
+    def _load(self, kind: str) -> Dict[str, dict]:
+        rows = self._connection.execute('SELECT key, value FROM data WHERE kind = ?', (kind,))
+        return {key: json.loads(value) for key, value in rows}
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        return {int(key): value for key, value in self._load('user').items()}
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {int(key): value for key, value in self._load('chat').items()}
+
+    async def get_bot_data(self) -> dict:
+        return self._load('bot').get('', {})
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[tuple, object]:
+        rows = self._connection.execute('SELECT key, state FROM conversations WHERE name = ?', (name,))
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    def _store(self, table: str, kind: str, key: str, value):
+        self._pending[(table, kind, key)] = None if value is None else json.dumps(value, ensure_ascii=False)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.get_running_loop().create_task(self._write_pending())
+
+    async def update_user_data(self, user_id: int, data: dict):
+        self._store('data', 'user', str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        self._store('data', 'chat', str(chat_id), data)
+
+    async def update_bot_data(self, data: dict):
+        self._store('data', 'bot', '', data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]):
+        self._store('conversations', name, json.dumps(key), new_state)
+
+    async def drop_user_data(self, user_id: int):
+        self._store('data', 'user', str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int):
+        self._store('data', 'chat', str(chat_id), None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    async def _write_pending(self):
+        # The application updates all changed entries at once; let the rest of them arrive
+        await asyncio.sleep(0)
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            await asyncio.to_thread(self._write, batch)
+
+    def _write(self, batch: Dict[Tuple[str, str, str], Optional[str]]):
+        """Write a batch of changes in one transaction."""
+        with self._connection:
+            for (table, kind, key), value in batch.items():
+                column = 'kind' if table == 'data' else 'name'
+                if value is None:
+                    self._connection.execute(f'DELETE FROM {table} WHERE {column} = ? AND key = ?', (kind, key))
+                else:
+                    self._connection.execute(f'INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)', (kind, key, value))
+
+    async def flush(self):
+        """Write what is left and close the database; called when the application stops."""
+        if self._writer is not None:
+            await self._writer
+        if self._pending:
+            batch, self._pending = self._pending, {}
+            self._write(batch)
+        self._connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self._connection.close()
@@ -0,0 +1,192 @@
+"""Profiling of a sample of the live updates with cProfile and tracemalloc.
+
+A sampled update is processed under cProfile, and tracemalloc traces the
+memory it allocates. cProfile sees one thread, so while sampled updates are in
+flight the profile covers everything the event loop does; the calculation in
+the executor is profiled where it runs and its statistics are added to the
+same profile, also from a process pool.
+
+The statistics are aggregated and written to the directory once per interval:
+``profile-<time>.pstats`` for ``pstats``/snakeviz, ``allocations-<time>.txt``
+with the largest allocations that outlived the sampled updates, and the last
+snapshot as ``allocations-<time>.snapshot`` for ``tracemalloc.Snapshot.load``.
+Only the newest files are kept.
+"""
+import cProfile
+import contextvars
+import logging
+import os
+import pstats
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 300.0  # секунд между файлами
+DEFAULT_KEEP = 12  # файлов каждого вида
+DEFAULT_FRAMES = 5  # кадров в трассировке выделения памяти; 0 - без tracemalloc
+TOP_ALLOCATIONS = 50
+
+# Set while a sampled update is processed, so that the code it calls can be profiled too
+SAMPLED = contextvars.ContextVar('profiled_update', default=False)
+
+
+class _RawStats:
+    """Statistics of a profile made elsewhere, in the form ``pstats.Stats.add`` accepts."""
+
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def profiled(function: Callable, *args) -> Tuple[Any, Dict]:
+    """Call the function under cProfile in an executor; its result and the raw statistics."""
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler is active in the process and already sees this call
+        return function(*args), {}
+    try:
+        result = function(*args)
+    finally:
+        profile.disable()
+    profile.create_stats()
+    return result, profile.stats
+
+
+class UpdateProfiler:
+    """Profiles ``rate`` of the updates and writes the statistics to ``directory`` every ``interval``."""
+
+    def __init__(self, rate: float, directory: str, interval: float = DEFAULT_INTERVAL, keep: int = DEFAULT_KEEP,
+                 frames: int = DEFAULT_FRAMES):
+        self.rate = rate
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.frames = frames
+        os.makedirs(directory, exist_ok=True)
+        self._active = 0  # sampled updates in flight
+        self._profile: Optional[cProfile.Profile] = None
+        self._tracing = False  # tracemalloc was started by the profiler
+        self._stats: Optional[pstats.Stats] = None
+        self._allocations: Dict[tracemalloc.Traceback, List[int]] = defaultdict(lambda: [0, 0])  # size, count
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._updates = 0
+        self._written = time.monotonic()
+
+    @staticmethod
+    def sampling() -> bool:
+        """Whether the current code runs for a sampled update."""
+        return SAMPLED.get()
+
+    def wrap(self, coroutine: Awaitable) -> Awaitable:
+        """The processing of an update, profiled if the update is sampled."""
+        if random.random() >= self.rate:
+            return coroutine
+        return self._profiled(coroutine)
+
+    async def _profiled(self, coroutine: Awaitable):
+        token = SAMPLED.set(True)
+        self._begin()
+        try:
+            return await coroutine
+        finally:
+            self._end()
+            SAMPLED.reset(token)
+
+    def _begin(self):
+        self._active += 1
+        if self._active > 1:
+            return
+        if self.frames and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._tracing = True
+        # One profile accumulates all the sampled updates of the interval
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def _end(self):
+        self._updates += 1
+        self._active -= 1
+        if not self._active:
+            self._profile.disable()
+            self._take_snapshot()
+        if time.monotonic() - self._written >= self.interval:
+            self.write()
+
+    def _take_snapshot(self):
+        """Add what the sampled updates allocated and still hold; tracing goes on for the ones in flight."""
+        if not self._tracing:
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ))
+        for statistic in snapshot.statistics('traceback'):
+            allocation = self._allocations[statistic.traceback]
+            allocation[0] += statistic.size
+            allocation[1] += statistic.count
+        self._snapshot = snapshot
+        if self._active:
+            tracemalloc.clear_traces()
+        else:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def add(self, stats):
+        """Add a profile, or the raw statistics from ``profiled``, to the current interval."""
+        if isinstance(stats, dict):
+            if not stats:
+                return
+            stats = _RawStats(stats)
+        if self._stats is None:
+            self._stats = pstats.Stats(stats)
+        else:
+            self._stats.add(stats)
+
+    def write(self):
+        """Write the statistics of the interval and start a new one."""
+        self._written = time.monotonic()
+        if self._profile is not None:
+            # Under steady load the sampled updates overlap, the ones in flight go on in a new profile
+            if self._active:
+                self._profile.disable()
+                self._take_snapshot()
+            self.add(self._profile)
+            self._profile = None
+            if self._active:
+                self._profile = cProfile.Profile()
+                self._profile.enable()
+        if self._stats is None:
+            return
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(self.directory, f'profile-{stamp}.pstats')
+        self._stats.dump_stats(path)
+        if self._snapshot is not None:
+            self._snapshot.dump(os.path.join(self.directory, f'allocations-{stamp}.snapshot'))
+            with open(os.path.join(self.directory, f'allocations-{stamp}.txt'), 'w', encoding='utf-8') as report:
+                report.write(f'Обновлений в выборке: {self._updates}\n\n')
+                largest = sorted(self._allocations.items(), key=lambda item: item[1][0], reverse=True)
+                for traceback, (size, count) in largest[:TOP_ALLOCATIONS]:
+                    report.write(f'{size / 1024:.1f} KiB в {count} блоках\n')
+                    report.write('\n'.join(traceback.format()) + '\n\n')
+        logger.info("Профиль %d обновлений записан в %s", self._updates, path)
+        self._stats = self._snapshot = None
+        self._allocations.clear()
+        self._updates = 0
+        self._remove_old()
+
+    def _remove_old(self):
+        for prefix, suffix in (('profile-', '.pstats'), ('allocations-', '.txt'), ('allocations-', '.snapshot')):
+            files = sorted(name for name in os.listdir(self.directory)
+                           if name.startswith(prefix) and name.endswith(suffix))
+            for name in files[:-self.keep]:
+                os.remove(os.path.join(self.directory, name))
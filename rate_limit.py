@@ -0,0 +1,197 @@
+"""Throttling of the messages the bot sends, within the flood limits of Telegram.
+
+Telegram lets a bot send about 30 messages per second in total, about one per
+second in a private chat (short bursts are tolerated) and 20 per minute in a
+group; beyond that it answers 429 with ``retry_after``. The limiter spreads
+the requests out instead: a request with a ``chat_id`` waits for a token of
+its chat and then for a token of the bot, and the tokens of the bot go to the
+waiting requests by priority, so the replies in conversations go before
+broadcasts::
+
+    await context.bot.send_message(chat_id, text, rate_limit_args=BROADCAST)
+
+Requests without a chat (answers to callback and inline queries) are not
+throttled. A request that still gets 429 waits ``retry_after`` seconds and is
+sent again; the flood wait applies to the whole bot, so all the other requests
+that need a token of the bot wait as well.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Coroutine, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Priorities of the requests, lower goes first
+REPLY = 0
+BROADCAST = 10
+
+DEFAULT_RATE = 30.0  # сообщений в секунду от бота
+DEFAULT_CHAT_RATE = 1.0  # сообщений в секунду в личном чате
+DEFAULT_CHAT_BURST = 3  # сообщений подряд в личном чате
+DEFAULT_GROUP_RATE = 20 / 60  # сообщений в секунду в группе
+DEFAULT_MAX_RETRIES = 3
+MAX_IDLE_CHATS = 10000  # чатов с полным запасом, которые можно забыть
+
+
+class RateLimiterStats(NamedTuple):
+    requests: int
+    throttled: int  # Запросы, которые ждали токена
+    retries: int  # Повторы после 429
+    waiting: int  # Запросы в очереди на токен бота
+
+
+class TokenBucket:
+    """``capacity`` tokens that refill at ``rate`` per second."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def _refill(self) -> float:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    def delay(self) -> float:
+        """Seconds until a token is available."""
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    def take(self):
+        self._refill()
+        self._tokens -= 1
+
+    def pause(self, seconds: float):
+        """No tokens for the next ``seconds``, e.g. after 429."""
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate + 1)
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self._tokens >= self.capacity
+
+
+class TokenBucketRateLimiter(BaseRateLimiter[int]):
+    """Token buckets of the bot and of every chat; ``rate_limit_args`` is the priority."""
+
+    def __init__(self, rate: float = DEFAULT_RATE, chat_rate: float = DEFAULT_CHAT_RATE,
+                 chat_burst: int = DEFAULT_CHAT_BURST, group_rate: float = DEFAULT_GROUP_RATE,
+                 max_retries: int = DEFAULT_MAX_RETRIES):
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._bucket = TokenBucket(rate, max(rate, 1))
+        self._chats: Dict[Union[int, str], Tuple[TokenBucket, asyncio.Lock]] = OrderedDict()
+        self._waiting: List[Tuple[int, int, asyncio.Future]] = []  # (priority, order, future)
+        self._order = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._requests = self._throttled = self._retries = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for _, _, future in self._waiting:
+            future.cancel()
+        self._waiting.clear()
+
+    def _chat(self, chat_id: Union[int, str]) -> Tuple[TokenBucket, asyncio.Lock]:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            # Group ids and @channel usernames get the limit of groups
+            group = isinstance(chat_id, str) or int(chat_id) < 0
+            bucket = (TokenBucket(self.group_rate, 1) if group
+                      else TokenBucket(self.chat_rate, self.chat_burst))
+            chat = self._chats[chat_id] = (bucket, asyncio.Lock())
+            # A chat with all its tokens is the same as a new one
+            while len(self._chats) > MAX_IDLE_CHATS:
+                oldest = next(iter(self._chats))
+                old_bucket, old_lock = self._chats[oldest]
+                if oldest == chat_id or not old_bucket.full or old_lock.locked():
+                    break
+                del self._chats[oldest]
+        self._chats.move_to_end(chat_id)
+        return chat
+
+    async def _dispatch(self):
+        """Hand out the tokens of the bot to the waiting requests, highest priority first."""
+        while self._waiting:
+            delay = self._bucket.delay()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                self._bucket.take()
+                future.set_result(None)
+        self._dispatcher = None
+
+    async def _acquire(self, priority: int):
+        if not self._waiting and not self._bucket.delay():
+            self._bucket.take()
+            return
+        self._throttled += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._order), future))
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def process_request(
+            self,
+            callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+            args: Any,
+            kwargs: Dict[str, Any],
+            endpoint: str,
+            data: Dict[str, Any],
+            rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        self._requests += 1
+        chat_id = data.get('chat_id')
+        priority = REPLY if rate_limit_args is None else rate_limit_args
+        for attempt in itertools.count():
+            try:
+                if chat_id is None:
+                    return await callback(*args, **kwargs)
+                bucket, lock = self._chat(chat_id)
+                # The lock keeps the messages of the chat in order while they wait
+                async with lock:
+                    delay = bucket.delay()
+                    if delay:
+                        self._throttled += 1
+                        await asyncio.sleep(delay)
+                    bucket.take()
+                    await self._acquire(priority)
+                    return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                self._retries += 1
+                logger.warning("%s в чат %s: превышен лимит Telegram, повтор через %s с",
+                               endpoint, chat_id, e.retry_after, extra={'chat_id': chat_id, 'sample_key': 'retry_after'})
+                # Telegram counts the limit per bot token, not per chat
+                self._bucket.pause(e.retry_after)
+                if chat_id is None:
+                    await asyncio.sleep(e.retry_after)
+                else:
+                    self._chat(chat_id)[0].pause(e.retry_after)
+
+    def stats(self) -> RateLimiterStats:
+        return RateLimiterStats(self._requests, self._throttled, self._retries, len(self._waiting))
@@ -0,0 +1,99 @@
+"""Bookkeeping of the live conversations of the bot.
+
+A conversation that the user abandons keeps its state and ``user_data`` in
+memory. The registry remembers when every session was last active, so idle
+sessions can be dropped after a timeout and the oldest ones when there are too
+many of them. It also keeps the state the conversation handlers returned last,
+so the bot knows which sessions are in a conversation without reading the
+internals of ``ConversationHandler``.
+"""
+import sys
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List, NamedTuple, Optional
+
+DEFAULT_TIMEOUT = 3600.0  # секунд без ответа
+DEFAULT_MAX_SESSIONS = 10000
+DEFAULT_CLEANUP_INTERVAL = 60.0  # секунд
+
+
+class SessionStats(NamedTuple):
+    sessions: int
+    max_sessions: int
+    bytes: int  # Приблизительный объем данных сессий
+    expired: int  # Сессии, завершенные по времени
+    evicted: int  # Сессии, вытесненные из-за ограничения числа
+
+
+def approximate_size(value) -> int:
+    """Size of the value with everything it contains, as reported by ``sys.getsizeof``."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approximate_size(key) + approximate_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approximate_size(item) for item in value)
+    return size
+
+
+class SessionRegistry:
+    """Last activity of the sessions, least recently active first.
+
+    The registry only decides which sessions have to go; ``touch`` and
+    ``expire`` return their keys and the caller drops the state they hold.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._sessions = OrderedDict()  # key -> last activity
+        self._states = {}  # key -> state of the conversation
+        self._expired = self._evicted = 0
+
+    def touch(self, key: Hashable) -> List[Hashable]:
+        """Mark the session as active; the keys of the sessions evicted to stay within the limit."""
+        self._sessions[key] = self._clock()
+        self._sessions.move_to_end(key)
+        evicted = []
+        while len(self._sessions) > max(self.max_sessions, 1):
+            evicted.append(self._sessions.popitem(last=False)[0])
+            self._states.pop(evicted[-1], None)
+        self._evicted += len(evicted)
+        return evicted
+
+    def state(self, key: Hashable) -> Optional[object]:
+        """The state of the conversation of the session, None outside of one."""
+        return self._states.get(key)
+
+    def set_state(self, key: Hashable, state: Optional[object]):
+        """Note the state a conversation handler returned; None ends the conversation."""
+        if state is None:
+            self._states.pop(key, None)
+        elif key in self._sessions:
+            self._states[key] = state
+
+    def expire(self) -> List[Hashable]:
+        """Forget the sessions idle for longer than the timeout and return their keys."""
+        deadline = self._clock() - self.timeout
+        expired = []
+        while self._sessions:
+            key, active = next(iter(self._sessions.items()))
+            if active > deadline:
+                break
+            del self._sessions[key]
+            self._states.pop(key, None)
+            expired.append(key)
+        self._expired += len(expired)
+        return expired
+
+    def stats(self, size_of: Optional[Callable[[Hashable], int]] = None) -> SessionStats:
+        """Counters of the registry; ``size_of`` gives the bytes held by a session."""
+        size = sum(size_of(key) for key in self._sessions) if size_of else 0
+        return SessionStats(len(self._sessions), self.max_sessions, size, self._expired, self._evicted)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,79 @@
+import pytest
+
+from inheritance.answers import (FLAG_ERROR, ScenarioError, max_will_amount, parse_amount, parse_count,
+                                 parse_scenario, will_warning)
+
+
+def errors(text: str):
+    with pytest.raises(ScenarioError) as raised:
+        parse_scenario(text)
+    return raised.value.errors
+
+
+def test_scenario_with_positional_amounts_and_aliases():
+    user_data, warnings = parse_scenario('1000000 100000 wife sons=2 daughters=1 mother')
+    assert warnings == []
+    assert user_data['total_inheritance'] == 1000000.0
+    assert user_data['debts'] == 100000.0
+    assert (user_data['has_wife'], user_data['has_mother'], user_data['has_spouse']) == (True, True, False)
+    assert (user_data['num_sons'], user_data['num_daughters']) == (2, 1)
+    assert (user_data['has_will'], user_data['will_amount']) == (False, 0.0)
+
+
+def test_all_invalid_fields_are_reported_at_once():
+    reported = errors('total=-5 foo=1 sons=x wife=2')
+    assert [field for field, _ in reported] == ['total', 'foo', 'sons', 'wife']
+    assert reported[0][1] == 'Сумма наследства должна быть положительной'
+    assert reported[1][1] == 'неизвестное поле'
+    assert reported[3][1] == FLAG_ERROR
+    assert str(ScenarioError(reported[:2])) == 'total: Сумма наследства должна быть положительной; foo: неизвестное поле'
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('', [('total', 'не указана сумма наследства')]),
+    ('wife sons=2', [('total', 'не указана сумма наследства')]),
+    ('1000 1 2 3', [('3', 'лишнее число, укажите поле в виде имя=значение')]),
+    ('total=inf', [('total', 'Сумма должна быть числом')]),
+    ('total=nan', [('total', 'Сумма должна быть числом')]),
+    ('total=1e400', [('total', 'Сумма должна быть числом')]),
+    ('total=1e30', [('total', 'Сумма слишком велика')]),
+    ('1000 debts=-1', [('debts', 'Сумма долгов не может быть отрицательной')]),
+    ('1000 will=-1', [('will', 'Сумма в завещании не может быть отрицательной')]),
+    ('1000 sons=-1', [('sons', 'Число не может быть отрицательным')]),
+])
+def test_error_messages(text, expected):
+    assert errors(text) == expected
+
+
+def test_will_is_capped_at_a_third_of_the_net_inheritance():
+    user_data, warnings = parse_scenario('1200 300 will=500 wife')
+    assert user_data['has_will'] is True
+    assert user_data['will_amount'] == 300.0
+    assert warnings == [will_warning(300.0)]
+
+
+def test_will_flag_follows_the_amount():
+    assert parse_scenario('1000 will=0')[0]['has_will'] is False
+    assert parse_scenario('1000 has_will=0 will=100')[0]['will_amount'] == 0.0
+
+
+@pytest.mark.parametrize('text', ['inf', '-inf', 'nan', '1e400'])
+def test_parse_amount_rejects_non_finite_values(text):
+    with pytest.raises(ValueError):
+        parse_amount(text)
+
+
+def test_parse_amount_accepts_a_decimal_comma():
+    assert parse_amount('1,5') == 1.5
+
+
+def test_max_will_amount_rejects_non_finite_values():
+    assert max_will_amount({'total_inheritance': 900, 'debts': 300}) == 200
+    with pytest.raises(ValueError):
+        max_will_amount({'total_inheritance': float('inf')})
+
+
+def test_parse_count():
+    assert parse_count(' 3 ') == 3
+    with pytest.raises(ValueError):
+        parse_count('x')
@@ -0,0 +1,43 @@
+from inheritance.cache import CacheStats, TTLCache, response_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_stats_count_hits_misses_expirations_and_evictions():
+    clock = Clock()
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)  # 'b' is the least recently used
+    assert cache.get('b') is None
+    clock.now = 11
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert stats == CacheStats(size=1, maxsize=2, hits=2, misses=3, expirations=1, evictions=1)
+    assert stats.hit_ratio == 0.4
+
+
+def test_hit_ratio_without_lookups():
+    assert TTLCache().stats().hit_ratio == 0.0
+
+
+def test_zero_size_disables_the_cache():
+    cache = TTLCache(maxsize=0)
+    cache.put('a', 1)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_response_key_normalizes_the_answers():
+    assert response_key({'total_inheritance': '1000', 'has_wife': 1, 'num_sons': '2'}) == response_key(
+        {'total_inheritance': 1000.0, 'has_wife': True, 'num_sons': 2, 'will_amount': 5.0})
+    assert response_key({'total_inheritance': 1000}) != response_key({'total_inheritance': 1000}, detailed=False)
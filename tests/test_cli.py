@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+from importlib.util import find_spec
+
+import pytest
+
+from inheritance.cli import run
+
+needs_numpy = pytest.mark.skipif(find_spec('numpy') is None, reason='numpy is not installed')
+
+RECORDS = [
+    {'id': 1, 'total_inheritance': 100, 'num_sons': 10 ** 30},
+    {'id': 2, 'total_inheritance': 100, 'has_wife': True, 'num_sons': 2},
+    {'id': 3, 'total_inheritance': 1e15, 'num_daughters': 2 ** 40, 'has_mother': True},
+    {'id': 4, 'total_inheritance': 100, 'num_siblings_brothers': 10 ** 20, 'has_spouse': True},
+    {'id': 5, 'total_inheritance': 10 ** 17, 'debts': 1, 'num_sons': 3, 'num_daughters': 1},
+]
+
+
+def jsonl(records) -> io.StringIO:
+    return io.StringIO(''.join((record if isinstance(record, str) else json.dumps(record)) + '\n'
+                               for record in records))
+
+
+def calculate(records, **options) -> str:
+    target = io.StringIO()
+    run(jsonl(records), target, **options)
+    return target.getvalue()
+
+
+@needs_numpy
+@pytest.mark.parametrize('workers', [1, 2])
+def test_numpy_engine_recalculates_overflow_rows(workers):
+    expected = calculate(RECORDS, engine='scalar')
+    assert calculate(RECORDS, engine='numpy', workers=workers, chunk_size=2) == expected
+    rows = [json.loads(line) for line in expected.splitlines()]
+    assert [row['id'] for row in rows] == [1, 2, 3, 4, 5]
+    assert not any('error' in row for row in rows)
+    assert rows[0]['asl'] == 10 ** 30
+
+
+@pytest.mark.parametrize('engine', ['scalar', pytest.param('numpy', marks=needs_numpy)])
+def test_bad_records_get_an_error_each(engine):
+    records = ['{"id": 1,', [1, 2], {'id': 3, 'total_inheritance': 'inf'}, {'id': 4, 'total_inheritance': 1e300},
+               {'id': 5, 'total_inheritance': 100, 'num_sons': -1}, {'id': 6, 'total_inheritance': 100}]
+    rows = [json.loads(line) for line in calculate(records, engine=engine).splitlines()]
+    assert [row.get('id') for row in rows] == [None, None, 3, 4, 5, 6]
+    assert all(row['error'] for row in rows[:5])
+    assert rows[3]['error'] == 'сумма слишком велика для расчета'
+    assert rows[5] == {'id': 6, 'net_inheritance': '100.00', 'asl': 1}
+
+
+def test_csv_header_has_the_fields_of_all_records():
+    records = ['not json', {'total_inheritance': 100, 'num_sons': 1},
+               {'id': 7, 'note': 'x', 'total_inheritance': 100, 'has_wife': True, 'num_sons': 1}]
+    rows = list(csv.DictReader(io.StringIO(calculate(records, output_format='csv', chunk_size=1))))
+    assert list(rows[0])[:2] == ['id', 'note']
+    assert rows[2]['id'] == '7'
+    assert rows[2]['note'] == 'x'
+    assert rows[0]['error']
+
+
+def test_csv_header_from_a_pipe():
+    class Pipe(io.StringIO):
+        def seekable(self):
+            return False
+
+    target = io.StringIO()
+    run(Pipe('{"total_inheritance": 100}\n{"id": 2, "total_inheritance": 100, "num_sons": 1}\n'), target,
+        output_format='csv', workers=2, chunk_size=1)
+    rows = list(csv.DictReader(io.StringIO(target.getvalue())))
+    assert [row['id'] for row in rows] == ['', '2']
+    assert rows[1]['sons'] == '100.00'
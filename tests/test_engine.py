@@ -0,0 +1,34 @@
+from fractions import Fraction
+
+from benchmarks.corpus import compositions
+from inheritance.engine import Estate, distribute, share_structure
+from inheritance.money import divide_half_up
+
+
+def test_amounts_add_up_to_the_net_inheritance():
+    for user_data in compositions(2000, seed=7):
+        distribution = distribute(Estate.from_user_data(user_data), detailed=False)
+        if distribution is None:
+            continue
+        structure = distribution.structure
+        net_inheritance = distribution.net_inheritance
+        # A husband and a wife together get more than the estate, the rules do not reduce the shares
+        assert sum(distribution.kopecks) == divide_half_up(sum(structure.parts) * net_inheritance, structure.asl)
+        if sum(structure.parts) == structure.asl:
+            assert sum(distribution.kopecks) == net_inheritance
+        assert [Fraction(part, structure.asl) for part in structure.parts] == [
+            line.share for line in structure.lines]
+
+
+def test_debts_that_take_everything_leave_nothing_to_distribute():
+    assert distribute(Estate(total_inheritance=1000, debts=1000, has_wife=True)) is None
+
+
+def test_share_structure_cache_counts_hits_by_composition():
+    share_structure.cache_clear()
+    composition = Estate(has_wife=True, num_sons=2).composition()
+    first = share_structure(composition)
+    assert share_structure(composition) is first
+    share_structure(composition, Fraction(1, 5))
+    info = share_structure.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
@@ -0,0 +1,48 @@
+import random
+from decimal import Decimal
+
+import pytest
+
+from inheritance.money import allocate, divide_half_up, to_kopecks, to_rubles
+
+
+@pytest.mark.parametrize('value, kopecks', [(1, 100), (0.1, 10), ('2.675', 268), (1.005, 101), (999.994, 99999)])
+def test_to_kopecks_rounds_the_decimal_digits_half_up(value, kopecks):
+    assert to_kopecks(value) == kopecks
+
+
+def test_to_rubles():
+    assert to_rubles(12345) == Decimal('123.45')
+
+
+def test_divide_half_up():
+    assert [divide_half_up(n, 4) for n in range(7)] == [0, 0, 1, 1, 1, 1, 2]
+
+
+def test_allocate_adds_up_to_the_total():
+    rng = random.Random(2024)
+    for _ in range(2000):
+        # Parts of a calculation add up to the base
+        base = rng.randint(1, 500)
+        cuts = sorted(rng.randint(0, base) for _ in range(rng.randint(0, 7)))
+        parts = [end - start for start, end in zip([0] + cuts, cuts + [base])]
+        total = rng.randint(0, 10 ** 9)
+        amounts = allocate(parts, base, total)
+        assert sum(amounts) == total
+        assert all(part * total // base <= amount <= part * total // base + 1
+                   for part, amount in zip(parts, amounts))
+
+
+def test_allocate_of_a_part_of_the_base_rounds_the_total_half_up():
+    assert sum(allocate([1, 1], 3, 100)) == 67
+    assert sum(allocate([1], 8, 4)) == 1
+
+
+def test_allocate_gives_the_missing_kopecks_to_the_largest_remainders():
+    # 100 / 7 = 14.28..., 200 / 7 = 28.57..., 400 / 7 = 57.14...
+    assert allocate([1, 2, 4], 7, 100) == [14, 29, 57]
+
+
+def test_allocate_breaks_ties_in_favour_of_earlier_amounts():
+    assert allocate([1, 1, 1], 3, 100) == [34, 33, 33]
+    assert allocate([1, 1, 1, 1, 1, 1], 6, 100) == [17, 17, 17, 17, 16, 16]
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip('telegram')
+
+from telegram.error import RetryAfter  # noqa: E402
+
+from rate_limit import BROADCAST, TokenBucket, TokenBucketRateLimiter  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_refills_up_to_its_capacity():
+    clock = Clock()
+    bucket = TokenBucket(2.0, 3, clock)
+    for _ in range(3):
+        assert bucket.delay() == 0
+        bucket.take()
+    assert bucket.delay() == pytest.approx(0.5)
+    clock.now += 0.25
+    assert bucket.delay() == pytest.approx(0.25)
+    clock.now += 10
+    assert bucket.full
+    for _ in range(3):
+        bucket.take()
+    assert bucket.delay() == pytest.approx(0.5)
+
+
+def test_pause_takes_the_tokens_for_the_given_time():
+    clock = Clock()
+    bucket = TokenBucket(30.0, 30, clock)
+    bucket.pause(2)
+    assert bucket.delay() == pytest.approx(2)
+    clock.now += 1.5
+    assert bucket.delay() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.delay() == 0
+    # A shorter pause does not shorten a longer one
+    bucket.pause(3)
+    bucket.pause(1)
+    assert bucket.delay() == pytest.approx(3)
+
+
+def send(limiter, chat_id, callback, priority=None):
+    return limiter.process_request(callback, (), {}, 'sendMessage', {'chat_id': chat_id}, priority)
+
+
+def test_chat_is_throttled_after_its_burst():
+    async def main():
+        limiter = TokenBucketRateLimiter(rate=1000, chat_rate=20, chat_burst=2)
+        sent = []
+
+        async def callback():
+            sent.append(time.monotonic())
+            return True
+
+        start = time.monotonic()
+        await asyncio.gather(*(send(limiter, 1, callback) for _ in range(4)))
+        await limiter.shutdown()
+        return [moment - start for moment in sent], limiter.stats()
+
+    sent, stats = asyncio.run(main())
+    assert sent[1] < 0.03
+    assert sent[3] == pytest.approx(0.1, abs=0.04)
+    assert stats.requests == 4
+    assert stats.throttled == 2
+
+
+def test_replies_go_before_broadcasts():
+    async def main():
+        limiter = TokenBucketRateLimiter(rate=20, chat_rate=1000, chat_burst=1000)
+        order = []
+
+        def callback(name):
+            async def call():
+                order.append(name)
+                return True
+            return call
+
+        limiter._bucket.pause(0.05)  # The requests queue up for the next token of the bot
+        requests = [send(limiter, chat_id, callback(f'broadcast {chat_id}'), BROADCAST) for chat_id in (1, 2)]
+        requests.append(send(limiter, 3, callback('reply')))
+        await asyncio.gather(*requests)
+        await limiter.shutdown()
+        return order
+
+    assert asyncio.run(main())[0] == 'reply'
+
+
+def test_retry_after_pauses_every_chat():
+    async def main():
+        limiter = TokenBucketRateLimiter(rate=1000, chat_rate=1000, chat_burst=1000)
+        sent = {}
+        failed = []
+
+        async def flooded():
+            if not failed:
+                failed.append(time.monotonic())
+                raise RetryAfter(0.2)
+            sent['flooded'] = time.monotonic()
+            return True
+
+        async def other():
+            sent['other'] = time.monotonic()
+            return True
+
+        async def later():
+            await asyncio.sleep(0.05)
+            await send(limiter, 2, other)
+
+        start = time.monotonic()
+        await asyncio.gather(send(limiter, 1, flooded), later())
+        await limiter.shutdown()
+        return {name: moment - start for name, moment in sent.items()}, limiter.stats()
+
+    sent, stats = asyncio.run(main())
+    assert sent['flooded'] >= 0.19
+    assert sent['other'] >= 0.19
+    assert stats.retries == 1
+
+
+def test_retry_after_is_raised_after_the_last_retry():
+    async def main():
+        limiter = TokenBucketRateLimiter(rate=1000, max_retries=1)
+
+        async def flooded():
+            raise RetryAfter(0.01)
+
+        try:
+            await send(limiter, 1, flooded)
+        finally:
+            await limiter.shutdown()
+
+    with pytest.raises(RetryAfter):
+        asyncio.run(main())
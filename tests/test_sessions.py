@@ -0,0 +1,57 @@
+from sessions import SessionRegistry, approximate_size
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_idle_sessions_expire_with_their_state():
+    clock = Clock()
+    sessions = SessionRegistry(timeout=10, clock=clock)
+    sessions.touch('a')
+    sessions.set_state('a', 3)
+    clock.now = 5
+    sessions.touch('b')
+    clock.now = 11
+    assert sessions.expire() == ['a']
+    assert 'a' not in sessions
+    assert sessions.state('a') is None
+    assert sessions.stats().expired == 1
+
+
+def test_least_recently_active_sessions_are_evicted():
+    clock = Clock()
+    sessions = SessionRegistry(max_sessions=2, clock=clock)
+    for key in 'ab':
+        sessions.touch(key)
+        sessions.set_state(key, 1)
+    sessions.touch('a')
+    assert sessions.touch('c') == ['b']
+    assert sessions.state('b') is None
+    assert sessions.state('a') == 1
+    assert sessions.stats().evicted == 1
+
+
+def test_state_is_kept_only_for_live_sessions():
+    sessions = SessionRegistry()
+    sessions.set_state('a', 1)
+    assert sessions.state('a') is None
+    sessions.touch('a')
+    sessions.set_state('a', 1)
+    sessions.touch('a')
+    assert sessions.state('a') == 1
+    sessions.set_state('a', None)
+    assert sessions.state('a') is None
+    assert 'a' in sessions
+
+
+def test_stats_report_the_bytes_of_the_sessions():
+    sessions = SessionRegistry()
+    sessions.touch('a')
+    data = {'a': {'total_inheritance': 1000.0, 'num_sons': 2}}
+    assert sessions.stats(lambda key: approximate_size(data[key])).bytes == approximate_size(data['a'])
+    assert approximate_size({'x': [1, 2]}) > approximate_size({'x': []})
@@ -0,0 +1,81 @@
+import io
+import json
+
+import pytest
+
+from benchmarks.corpus import compositions
+from inheritance.cli import run
+from inheritance.engine import HEIR_GROUPS, Composition, Estate, distribute
+from inheritance.table import TABLE_COLUMNS, ShareTable, _block_sizes, _representatives, build_table, table_index
+
+BOUND = 4
+
+
+def composition(**counts) -> Composition:
+    return Estate(**counts).composition()
+
+
+def test_every_row_has_one_representative():
+    _, rows_per_flags = _block_sizes(BOUND)
+    representatives = _representatives(BOUND)
+    assert len(representatives) == rows_per_flags
+    names = ('num_daughters', 'num_sons', 'num_granddaughters', 'num_grandsons', 'num_siblings_sisters',
+             'num_siblings_brothers', 'num_cousins_sisters', 'num_cousins_brothers')
+    for row, counts in enumerate(representatives):
+        assert table_index(composition(**dict(zip(names, counts))), BOUND) == row
+
+
+def test_counts_that_do_not_change_the_shares_share_a_row():
+    with_children = table_index(composition(num_sons=2, num_siblings_brothers=1), BOUND)
+    assert table_index(composition(num_sons=2, num_siblings_sisters=3, num_grandsons=100,
+                                   num_cousins_brothers=100), BOUND) == with_children
+    assert table_index(composition(num_sons=2), BOUND) != with_children
+
+    with_brothers = table_index(composition(num_siblings_brothers=1, num_siblings_sisters=2), BOUND)
+    assert table_index(composition(num_siblings_brothers=1, num_siblings_sisters=2,
+                                   num_cousins_sisters=100), BOUND) == with_brothers
+
+
+def test_flags_select_the_block():
+    _, rows_per_flags = _block_sizes(BOUND)
+    assert table_index(composition(num_daughters=1), BOUND) == 0
+    assert table_index(composition(has_spouse=True, num_daughters=1), BOUND) == rows_per_flags
+    assert table_index(composition(has_grandmother=True, num_daughters=1), BOUND) == 32 * rows_per_flags
+    # The warnings do not change the shares
+    assert table_index(composition(is_murderer=True, is_different_faith=True, num_daughters=1), BOUND) == 0
+
+
+@pytest.mark.parametrize('counts', [{'num_sons': BOUND + 1}, {'num_granddaughters': BOUND + 1},
+                                    {'num_siblings_brothers': 1, 'num_siblings_sisters': BOUND + 1},
+                                    {'num_cousins_brothers': BOUND + 1}])
+def test_counts_above_the_bound_are_not_covered(counts):
+    assert table_index(composition(**counts), BOUND) is None
+
+
+def test_lookup_matches_the_engine(tmp_path):
+    pytest.importorskip('numpy')
+    path = str(tmp_path / 'shares.tbl')
+    build_table(path, BOUND)
+    heirs = [HEIR_GROUPS.index(name) for name in TABLE_COLUMNS]
+    with ShareTable(path) as table:
+        for user_data in compositions(1000, seed=5):
+            estate = Estate.from_user_data({**user_data, 'has_will': False, 'debts': 0})
+            entry = table.lookup(estate.composition())
+            if entry is None:
+                continue
+            structure = distribute(estate, detailed=False).structure
+            present = [heir for heir, present in zip(heirs, entry.present) if present]
+            assert present == [line.heir for line in structure.lines]
+            assert entry.asl == structure.asl
+            assert [part for part, present in zip(entry.parts, entry.present) if present] == list(structure.parts)
+
+
+def test_batch_with_the_table_matches_the_rules(tmp_path):
+    pytest.importorskip('numpy')
+    path = str(tmp_path / 'shares.tbl')
+    build_table(path, BOUND)
+    lines = ''.join(json.dumps(user_data) + '\n' for user_data in compositions(500, seed=9))
+    expected, target = io.StringIO(), io.StringIO()
+    run(io.StringIO(lines), expected)
+    run(io.StringIO(lines), target, table=path)
+    assert target.getvalue() == expected.getvalue()
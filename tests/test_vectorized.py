@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from benchmarks.corpus import compositions  # noqa: E402
+from inheritance.engine import Estate, distribute  # noqa: E402
+from inheritance.money import to_kopecks  # noqa: E402
+from inheritance.vectorized import calculate_batch, columns_from_records, to_kopecks_array  # noqa: E402
+
+OVERFLOW = [
+    {'total_inheritance': 100, 'num_sons': 10 ** 30},
+    {'total_inheritance': 100, 'has_spouse': True, 'num_siblings_brothers': 10 ** 20},
+    {'total_inheritance': 1e300, 'has_wife': True, 'num_sons': 1},
+    {'total_inheritance': 9e15, 'num_sons': 20, 'num_daughters': 19, 'has_mother': True},
+]
+
+
+def corpus():
+    records = compositions(3000, seed=11)
+    rng = random.Random(11)
+    for record in records[::7]:
+        # Amounts with half kopecks and large amounts that still fit in int64
+        record['total_inheritance'] = rng.choice((0.005, 1.015, 2.675, 123456789012.34, 10 ** 11))
+    return records + OVERFLOW
+
+
+def assert_same(record, result, i):
+    distribution = distribute(Estate.from_user_data(record), detailed=False)
+    if distribution is None:
+        assert not result.valid[i]
+        return
+    assert result.valid[i]
+    assert result.net[i] == distribution.net_inheritance
+    structure = distribution.structure
+    assert result.asl[i] == structure.asl
+    assert list(np.flatnonzero(result.present[i])) == [line.heir for line in structure.lines]
+    assert [result.parts[i, line.heir] for line in structure.lines] == list(structure.parts)
+    assert [result.kopecks[i, line.heir] for line in structure.lines] == distribution.kopecks
+
+
+def test_matches_the_scalar_engine():
+    records = corpus()
+    result = calculate_batch(columns_from_records(records))
+    # The estimate is conservative: rows with large amounts and many heirs are flagged too
+    assert result.overflow[-len(OVERFLOW):].all()
+    assert result.overflow.sum() < len(records) // 50
+    for i, record in enumerate(records):
+        if not result.overflow[i]:
+            assert_same(record, result, i)
+
+
+def test_overflow_rows_do_not_affect_the_others():
+    records = OVERFLOW + compositions(50, seed=3)
+    result = calculate_batch(columns_from_records(records))
+    assert result.overflow[:len(OVERFLOW)].all()
+    assert not result.overflow[len(OVERFLOW):].any()
+    for i, record in enumerate(records[len(OVERFLOW):], len(OVERFLOW)):
+        assert_same(record, result, i)
+
+
+def test_missing_columns_default_to_zero():
+    result = calculate_batch({'total_inheritance': np.array([100.0]), 'has_wife': np.array([True])})
+    assert result.kopecks[0].sum() == 2500
+
+
+@pytest.mark.parametrize('value', [0.005, 0.015, 1.005, 2.675, 1234.565, 10 ** 9])
+def test_to_kopecks_array_matches_to_kopecks(value):
+    assert to_kopecks_array([value])[0] == to_kopecks(value)